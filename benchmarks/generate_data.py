@@ -0,0 +1,166 @@
+"""Synthetic DTM and road network for benchmarks.
+
+Writes a 1 m resolution terrain GeoTIFF and a roads GeoPackage with the
+columns of the OSM extract (highway, bridge, tunnel, other_tags), both in the
+CRS of the project, so they can be loaded with load_data.sh like real data.
+The output only depends on the size, density and seed.
+"""
+import argparse
+import math
+import os
+import sys
+from os.path import dirname, abspath
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+import shapely
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+# Add the project root directory to Python path
+project_root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from config import CONFIG
+
+# Lower left corner of the synthetic area (inside UTM zone 32N)
+ORIGIN_X = 370000.0
+ORIGIN_Y = 5670000.0
+
+NODATA = -9999.0
+
+# Highway types and their share of the roads
+HIGHWAY_TYPES = {
+    'residential': 0.55,
+    'service': 0.15,
+    'tertiary': 0.12,
+    'secondary': 0.10,
+    'primary': 0.05,
+    'footway': 0.03,
+}
+
+
+def area_bounds(size_km2):
+    """Square bounding box (minx, miny, maxx, maxy) of the given area, in whole meters."""
+    side = round(math.sqrt(size_km2) * 1000)
+    return ORIGIN_X, ORIGIN_Y, ORIGIN_X + side, ORIGIN_Y + side
+
+
+def terrain(x, y, hills):
+    """Terrain height in meters: long waves, Gaussian hills and a fine ripple."""
+    z = 150 + 40 * np.sin(x / 1800.0) * np.cos(y / 2300.0) + 15 * np.sin((x + y) / 700.0)
+    for hx, hy, height, radius in hills:
+        z += height * np.exp(-((x - hx) ** 2 + (y - hy) ** 2) / (2 * radius ** 2))
+    return z + 0.3 * np.sin(x / 7.0) * np.sin(y / 11.0)
+
+
+def write_dtm(path, bounds, rng, block_rows=512):
+    """Write the terrain as a tiled GeoTIFF, block by block, with a few nodata holes."""
+    minx, miny, maxx, maxy = bounds
+    width, height = int(maxx - minx), int(maxy - miny)
+    n_hills = max(1, int(width * height / 1e6 * 3))
+    hills = list(zip(
+        rng.uniform(minx, maxx, n_hills),
+        rng.uniform(miny, maxy, n_hills),
+        rng.uniform(-30, 60, n_hills),
+        rng.uniform(100, 600, n_hills),
+    ))
+    holes = list(zip(rng.uniform(minx, maxx, n_hills), rng.uniform(miny, maxy, n_hills)))
+
+    profile = {
+        'driver': 'GTiff', 'dtype': 'float32', 'count': 1,
+        'width': width, 'height': height, 'nodata': NODATA,
+        'crs': CONFIG['dtm_crs'], 'transform': from_origin(minx, maxy, 1.0, 1.0),
+        'tiled': True, 'blockxsize': 256, 'blockysize': 256, 'compress': 'lzw',
+    }
+    x = minx + 0.5 + np.arange(width)
+    with rasterio.open(path, 'w', **profile) as dst:
+        for row in range(0, height, block_rows):
+            rows = min(block_rows, height - row)
+            y = maxy - row - 0.5 - np.arange(rows)
+            xx, yy = np.meshgrid(x, y)
+            z = terrain(xx, yy, hills)
+            # Small gaps like missing DTM pixels under buildings
+            for hx, hy in holes:
+                z[(xx - hx) ** 2 + (yy - hy) ** 2 < 15 ** 2] = NODATA
+            dst.write(z.astype('float32'), 1, window=Window(0, row, width, rows))
+
+
+def wiggle(start, end, rng, vertex_spacing=20.0):
+    """Line from start to end with vertices every vertex_spacing meters and a slight sideways bend."""
+    length = math.dist(start, end)
+    n = max(2, int(length / vertex_spacing) + 1)
+    t = np.linspace(0, 1, n)
+    dx, dy = (end[0] - start[0]) / length, (end[1] - start[1]) / length
+    offset = rng.uniform(-8, 8) * np.sin(math.pi * t)
+    return shapely.LineString(np.column_stack([
+        start[0] + t * (end[0] - start[0]) - dy * offset,
+        start[1] + t * (end[1] - start[1]) + dx * offset,
+    ]))
+
+
+def make_roads(bounds, density, rng):
+    """Perturbed street grid with density km of road per km2, split into ways of 1 to 4 blocks."""
+    minx, miny, maxx, maxy = bounds
+    # A square grid with spacing s has 2 / s km of road per km2
+    spacing = 2000.0 / density
+    xs = np.arange(minx + spacing / 2, maxx, spacing)
+    ys = np.arange(miny + spacing / 2, maxy, spacing)
+    jitter = spacing * 0.15
+    nodes = {
+        (i, j): (x + rng.uniform(-jitter, jitter), y + rng.uniform(-jitter, jitter))
+        for i, x in enumerate(xs) for j, y in enumerate(ys)
+    }
+
+    lines = []
+    for along, count in (((1, 0), len(xs)), ((0, 1), len(ys))):
+        for k in range(len(ys) if along == (1, 0) else len(xs)):
+            step = 0
+            while step < count - 1:
+                blocks = int(rng.integers(1, 5))
+                path = []
+                for n in range(step, min(step + blocks, count - 1) + 1):
+                    path.append(nodes[(n, k)] if along == (1, 0) else nodes[(k, n)])
+                lines.append(shapely.line_merge(shapely.MultiLineString([
+                    wiggle(a, b, rng) for a, b in zip(path[:-1], path[1:])
+                ])))
+                step += blocks
+
+    n = len(lines)
+    highway = rng.choice(list(HIGHWAY_TYPES), size=n, p=list(HIGHWAY_TYPES.values()))
+    kind = rng.choice(['road', 'bridge', 'tunnel', 'viaduct'], size=n, p=[0.95, 0.025, 0.01, 0.015])
+    return gpd.GeoDataFrame({
+        'osm_id': [str(1000000 + i) for i in range(n)],
+        'name': [f"Synthetic Street {i}" for i in range(n)],
+        'highway': highway,
+        'bridge': np.where(kind == 'bridge', 'yes', None),
+        'tunnel': np.where(kind == 'tunnel', 'yes', None),
+        'other_tags': np.where(kind == 'viaduct', '"bridge"=>"viaduct","layer"=>"1"', '"surface"=>"asphalt"'),
+    }, geometry=lines, crs=CONFIG['dtm_crs'])
+
+
+def generate(output_dir, size_km2, density, seed=0):
+    """Write dtm.tif and roads.gpkg for a square area of size_km2 into output_dir and return their paths."""
+    rng = np.random.default_rng(seed)
+    bounds = area_bounds(size_km2)
+    os.makedirs(output_dir, exist_ok=True)
+    dtm_path = os.path.join(output_dir, 'dtm.tif')
+    roads_path = os.path.join(output_dir, 'roads.gpkg')
+    write_dtm(dtm_path, bounds, rng)
+    roads = make_roads(bounds, density, rng)
+    roads.to_file(roads_path, driver='GPKG', layer='lines', engine='pyogrio')
+    print(f"Synthetic data in {output_dir}: {size_km2} km2, {len(roads):,} roads, "
+          f"{roads.length.sum() / 1000:.1f} km of road")
+    return dtm_path, roads_path, bounds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic DTM and road network for benchmarks.")
+    parser.add_argument('-o', '--output', default='benchmarks/data/synthetic', help="Output directory")
+    parser.add_argument('--size', type=float, default=1.0, help="Area in km2 (default: 1)")
+    parser.add_argument('--density', type=float, default=15.0, help="Road length in km per km2 (default: 15)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    generate(args.output, args.size, args.density, args.seed)
@@ -0,0 +1,230 @@
+"""Pipeline benchmarks at several scales on synthetic data.
+
+For each area size, generates a synthetic DTM and road network, loads them
+with load_data.sh into a separate benchmark database, runs every pipeline
+stage with per-statement profiling and times the dashboard queries. The
+results (throughput, stage times, backend peak memory) are printed as a table
+and written to reports/benchmark_<timestamp>.json. With --baseline, the run
+fails when throughput dropped by more than --max-slowdown against an earlier
+report.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from os.path import dirname, abspath, join
+
+# Add the project root, scripts and web-app directories to Python path
+project_root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, join(project_root, 'scripts'))
+sys.path.insert(0, join(project_root, 'web-app'))
+
+from sqlalchemy import create_engine
+
+from config import CONFIG
+import execute_queries
+import profiling
+from dashboard_queries import get_stats, get_filtered_stats, histogram_from_bins
+from generate_data import generate
+
+DATA_DIR = join(project_root, 'benchmarks', 'data')
+
+# Database the synthetic data is loaded into, never the analysis database (DB_NAME)
+BENCH_DATABASE = os.getenv('BENCH_DB_NAME', 'road_slopes_bench')
+
+# Slope ranges of the timed dashboard queries: everything, a typical filter and a narrow one
+DASHBOARD_RANGES = [(0.0, 40.0), (3.0, 10.0), (5.05, 5.25)]
+
+
+def load(dtm_path, roads_path, tile_size):
+    """Create the benchmark database if needed and load the data with load_data.sh, returning the seconds taken."""
+    subprocess.run(['bash', 'init_db.sh'], cwd=project_root, check=True)
+    start_time = time.time()
+    subprocess.run(
+        ['bash', 'load_data.sh', '-d', dtm_path, '-r', roads_path, '-t', tile_size],
+        cwd=project_root, check=True, stdout=subprocess.DEVNULL
+    )
+    return time.time() - start_time
+
+
+def backend_peak_memory_mb(conn):
+    """Peak resident memory of the connection's backend, if the database runs on this host."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_backend_pid()")
+        pid = cur.fetchone()[0]
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def temp_bytes(conn):
+    """Bytes written to temporary files by the database so far (work_mem spills)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT temp_bytes FROM pg_stat_database WHERE datname = current_database()")
+        return cur.fetchone()[0]
+
+
+def count_rows(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {table}")
+        return cur.fetchone()[0]
+
+
+def run_stages(params):
+    """Run each pipeline stage on a fresh connection, so the backend peak memory is per stage."""
+    area_name = execute_queries.area_table_name(params['name_area'])
+    stages = {}
+    for stage in execute_queries.STAGES:
+        conn = execute_queries.connect()
+        try:
+            execute_queries.prepare_database(params, conn)
+            temp_before = temp_bytes(conn)
+            start_time = time.time()
+            execute_queries.run_stages(conn, params, [stage], force={stage['name']})
+            stages[stage['name']] = {
+                'seconds': round(time.time() - start_time, 3),
+                'peak_memory_mb': backend_peak_memory_mb(conn),
+                # Statistics are flushed with a delay, so this is a lower bound
+                'temp_bytes': temp_bytes(conn) - temp_before,
+            }
+        finally:
+            conn.close()
+
+    conn = execute_queries.connect()
+    try:
+        counts = {
+            'roads': count_rows(conn, f"filtered_roads_{area_name}"),
+            'points': count_rows(conn, f"road_points_window_{area_name}"),
+            'segments': count_rows(conn, f"road_segments_slope_{area_name}"),
+        }
+    finally:
+        conn.close()
+    return stages, counts
+
+
+def time_dashboard(region, repeat):
+    """Median milliseconds of the dashboard statistics queries, per slope range."""
+    db = CONFIG['db_connection']
+    engine = create_engine(f"postgresql://{db['user']}:{db['password']}@{db['host']}/{CONFIG['database']}")
+    timings = {}
+
+    def median_ms(func):
+        durations = []
+        for _ in range(repeat):
+            start_time = time.time()
+            func()
+            durations.append((time.time() - start_time) * 1000)
+        return round(statistics.median(durations), 1)
+
+    timings['stats'] = median_ms(lambda: get_stats(engine, region))
+    for min_slope, max_slope in DASHBOARD_RANGES:
+        def filtered():
+            _, bins = get_filtered_stats(engine, region, min_slope, max_slope)
+            histogram_from_bins(bins, min_slope, max_slope)
+        timings[f"filtered_{min_slope:g}_{max_slope:g}"] = median_ms(filtered)
+    engine.dispose()
+    return timings
+
+
+def benchmark(size_km2, args):
+    """Generate, load and process one scale and return its results."""
+    print(f"\n=== {size_km2:g} km2 ===")
+    output_dir = join(DATA_DIR, f"{size_km2:g}km2_d{args.density:g}_s{args.seed}")
+    dtm_path, roads_path, bounds = generate(output_dir, size_km2, args.density, args.seed)
+    load_seconds = load(dtm_path, roads_path, args.tile_size)
+
+    minx, miny, maxx, maxy = bounds
+    params = {
+        'minx': minx, 'miny': miny, 'maxx': maxx, 'maxy': maxy,
+        'crs': int(CONFIG['dtm_crs'].split(':')[1]),
+        'name_area': f"bench_{size_km2:g}km2".replace('.', '_'),
+    }
+    execute_queries.profile_report = profiling.new_report(params, CONFIG['session_settings'])
+    stages, counts = run_stages(params)
+    statements = execute_queries.profile_report['queries']
+    execute_queries.profile_report = None
+
+    return {
+        'size_km2': size_km2,
+        'density_km_per_km2': args.density,
+        'load_seconds': round(load_seconds, 3),
+        **counts,
+        'points_per_second': round(counts['points'] / stages['points']['seconds'], 1),
+        'segments_per_second': round(counts['segments'] / stages['segments']['seconds'], 1),
+        'stages': stages,
+        'dashboard_ms': time_dashboard(params['name_area'], args.repeat),
+        'queries': statements,
+    }
+
+
+def compare(results, baseline_path, max_slowdown):
+    """Print the throughput change against a baseline report and return False on a regression."""
+    with open(baseline_path) as f:
+        baseline = {r['size_km2']: r for r in json.load(f)['results']}
+    ok = True
+    for result in results:
+        base = baseline.get(result['size_km2'])
+        if base is None:
+            continue
+        for metric in ('points_per_second', 'segments_per_second'):
+            change = result[metric] / base[metric] - 1
+            regression = change < -max_slowdown
+            ok = ok and not regression
+            print(f"{result['size_km2']:>8g} km2  {metric:<20} {change:+7.1%}{'  REGRESSION' if regression else ''}")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data of several sizes.")
+    parser.add_argument('--sizes', default='1,4,16', help="Comma-separated area sizes in km2 (default: 1,4,16)")
+    parser.add_argument('--density', type=float, default=15.0, help="Road length in km per km2 (default: 15)")
+    parser.add_argument('--tile-size', default='500x500', help="Raster tile size for raster2pgsql (default: 500x500)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the synthetic data (default: 0)")
+    parser.add_argument('--repeat', type=int, default=5, help="Repetitions of each dashboard query (default: 5)")
+    parser.add_argument('--baseline', help="Earlier benchmark report to compare the throughput against")
+    parser.add_argument('--max-slowdown', type=float, default=0.2,
+                        help="Allowed throughput drop against the baseline (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    # load_data.sh drops and reloads the dtm and roads tables of the database it loads into
+    if BENCH_DATABASE == CONFIG['database']:
+        print(f"Error: the benchmark database '{BENCH_DATABASE}' is the analysis database (DB_NAME), "
+              "set BENCH_DB_NAME to another database")
+        sys.exit(1)
+    # The pipeline, init_db.sh and load_data.sh connect to CONFIG['database'], the scripts read it from DB_NAME
+    CONFIG['database'] = BENCH_DATABASE
+    os.environ['DB_NAME'] = BENCH_DATABASE
+
+    print(f"Benchmark database: {CONFIG['database']}")
+    results = [benchmark(float(size), args) for size in args.sizes.split(',')]
+
+    print(f"\n{'km2':>8} {'roads':>8} {'points':>10} {'segments':>10} {'points/s':>10} {'segments/s':>11} "
+          f"{'points s':>9} {'segments s':>10} {'peak MB':>8} {'stats ms':>9}")
+    for r in results:
+        peak = max((s['peak_memory_mb'] or 0) for s in r['stages'].values())
+        print(f"{r['size_km2']:>8g} {r['roads']:>8,} {r['points']:>10,} {r['segments']:>10,} "
+              f"{r['points_per_second']:>10,.0f} {r['segments_per_second']:>11,.0f} "
+              f"{r['stages']['points']['seconds']:>9.2f} {r['stages']['segments']['seconds']:>10.2f} "
+              f"{peak or float('nan'):>8.0f} {r['dashboard_ms']['stats']:>9.1f}")
+
+    profiling.REPORT_DIR.mkdir(exist_ok=True)
+    report_path = profiling.REPORT_DIR / f"benchmark_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    report_path.write_text(json.dumps({
+        'database': CONFIG['database'],
+        'session_settings': CONFIG['session_settings'],
+        'results': results,
+    }, indent=2, default=str))
+    print(f"\nBenchmark report written to {report_path}")
+
+    if args.baseline and not compare(results, args.baseline, args.max_slowdown):
+        sys.exit(1)
@@ -10,9 +10,52 @@ IN_DOCKER = os.getenv('IN_DOCKER', 'false').lower() == 'true'
 
 CONFIG = {
     "database": os.getenv("DB_NAME", "road_slopes"),
-    "region": "wuppertal_center",
+    "region": os.getenv("REGION", "wuppertal_center"),
     "dtm_crs": "EPSG:25832",    # UTM Zone 32N - our primary CRS for all calculations
     "map_crs": "EPSG:4326",     # WGS84 - only used for web map display
+    # Dashboard map source: "geojson" embeds all segments, "tiles" loads vector tiles from web-app/tile_server.py
+    "map_source": os.getenv("MAP_SOURCE", "geojson"),
+    # Directory of region snapshots from scripts/export_snapshot.py; when set, the dashboard runs without a database
+    "snapshot_dir": os.getenv("SNAPSHOT_DIR"),
+    # Tile server URL as seen from the browser
+    "tile_server_url": os.getenv("TILE_SERVER_URL", "http://localhost:8080"),
+    # Simplification tolerances in meters of the map levels of detail 1, 2, ... (level 0 = original segments)
+    "lod_tolerances": [2.0, 5.0, 15.0, 40.0],
+    # Grid size in meters on which the DTM data footprint (dtm_coverage table) is traced at load time
+    "coverage_cell_size": 25.0,
+    # OSM highway values that are not roads to analyse, left out when the roads are loaded
+    "excluded_highways": ["proposed", "construction", "abandoned", "disused", "razed", "platform", "raceway"],
+    # DTM sampling of the road points: "nearest" pixel or "bilinear" interpolation between pixel centers
+    "dtm_resample": os.getenv("DTM_RESAMPLE", "nearest"),
+    # Road densification: "fixed" spacing by road length (5/10/25 m), or "adaptive": densify_coarse spacing,
+    # split to densify_fine spacing where the sampled elevation changes by more than densify_max_rise meters
+    # or the road turns by more than densify_max_turn degrees
+    "densify": os.getenv("DENSIFY", "fixed"),
+    "densify_coarse": 25.0,
+    "densify_fine": 5.0,
+    "densify_max_rise": 0.5,
+    "densify_max_turn": 20.0,
+    # Admission of new regions by their estimated runtime (scripts/cost_estimator.py): above the first
+    # limit the area selector warns, above the second it splits the region into tiles of at most that runtime
+    "estimate_warn_seconds": 300,
+    "estimate_max_seconds": 1200,
+    # SQLite file of the job queue the area selector submits regions to, and the number of regions
+    # scripts/job_worker.py processes at the same time
+    "job_queue": os.getenv("JOB_QUEUE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.sqlite")),
+    "job_concurrency": int(os.getenv("JOB_CONCURRENCY", "2")),
+    # Storage of the points and segments: "standard", or "compact" (database/queries/compact/): unlogged
+    # intermediates, decimetre smallint elevations, codes instead of text and no per-road attributes on the points
+    "storage": os.getenv("STORAGE", "standard"),
+    # Longest gap in meters bridged by a segment where points between have no elevation
+    "segment_max_gap": float(os.getenv("SEGMENT_MAX_GAP", "50")),
+    # Settings of the database session the pipeline stages run in
+    "session_settings": {
+        "work_mem": "256MB",
+        "maintenance_work_mem": "1GB",
+        "max_parallel_workers_per_gather": 4,
+        # JIT compilation rarely pays off for the PostGIS function calls and adds seconds per query
+        "jit": "off",
+    },
     "db_connection": {
         "user": os.getenv("DB_USER", "postgres"),
         "password": os.getenv("DB_PASSWORD", "postgres"),
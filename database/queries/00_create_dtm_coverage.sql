@@ -0,0 +1,32 @@
+-- 00_create_dtm_coverage.sql
+-- This script stores the extent and the data footprint of the DTM once after load_data.sh loaded it,
+-- so the area selector and the dashboard do not aggregate every DTM tile on each page load.
+
+-- Run with psql variables: srid (DTM SRID), map_srid (SRID of the web map) and cell (meters).
+-- The footprint is traced on a grid of cell meters (nearest DTM pixel per cell), so tiles with
+-- nodata gaps or borders are not counted as fully covered, and simplified with the same tolerance.
+
+DROP TABLE IF EXISTS public.dtm_coverage;
+
+CREATE TABLE public.dtm_coverage AS
+WITH
+extent AS (
+  SELECT ST_SetSRID(ST_Extent(ST_Envelope(rast))::geometry, :srid) AS geom
+  FROM public.dtm
+),
+footprint AS (
+  SELECT ST_Multi(ST_SimplifyPreserveTopology(
+    ST_Union(ST_Polygon(ST_Rescale(rast, :cell, -:cell, 'NearestNeighbour'))),
+    :cell
+  )) AS geom
+  FROM public.dtm
+  WHERE NOT ST_BandIsNoData(rast)
+)
+SELECT
+  extent.geom AS extent,
+  footprint.geom AS coverage,
+  ST_Area(footprint.geom) / 1e6 AS coverage_km2,
+  -- Ready for the web map
+  ST_AsGeoJSON(ST_Transform(footprint.geom, :map_srid)) AS coverage_geojson,
+  now() AS computed_at
+FROM extent, footprint;
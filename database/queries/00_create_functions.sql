@@ -0,0 +1,62 @@
+-- 00_create_functions.sql
+-- This script creates the helper functions used by the pipeline stages.
+
+-- Elevation of a point from one DTM tile, with resample 'nearest' (the pixel containing the point)
+-- or 'bilinear' (between the four surrounding pixel centers). Bilinear falls back to nearest where a
+-- neighbouring pixel is nodata or lies in the next tile. Works without the resample argument of
+-- ST_Value, which needs PostGIS 3.2.
+CREATE OR REPLACE FUNCTION slope_sample_elevation(rast raster, pt geometry, resample text)
+RETURNS double precision
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT CASE
+    WHEN n IS NULL THEN ST_Value(rast, 1, pt)
+    ELSE COALESCE(
+      (1 - fx) * (1 - fy) * n[2][2] + fx * (1 - fy) * n[2][3]
+      + (1 - fx) * fy * n[3][2] + fx * fy * n[3][3],
+      ST_Value(rast, 1, pt)
+    )
+  END
+  FROM (
+    SELECT
+      fx, fy,
+      -- 3x3 pixels around the pixel center up-left of the point, only when it and its
+      -- right/lower neighbours are inside the tile
+      CASE
+        WHEN resample = 'bilinear' AND c0 >= 1 AND r0 >= 1 AND c0 < ST_Width(rast) AND r0 < ST_Height(rast)
+        THEN ST_Neighborhood(rast, 1, c0, r0, 1, 1)
+      END AS n
+    FROM (
+      -- Pixel coordinates in which the pixel centers are at whole numbers (1-based)
+      SELECT
+        floor(px)::integer AS c0, floor(py)::integer AS r0,
+        px - floor(px) AS fx, py - floor(py) AS fy
+      FROM (
+        SELECT
+          (ST_X(pt) - ST_UpperLeftX(rast)) / ST_ScaleX(rast) + 0.5 AS px,
+          (ST_Y(pt) - ST_UpperLeftY(rast)) / ST_ScaleY(rast) + 0.5 AS py
+      ) position
+    ) cell
+  ) neighbourhood
+$$;
+
+-- Change of direction in degrees (0-180) of a line running through the points a, b and c, at b.
+-- NULL when a or c is missing (b is an end of the line).
+CREATE OR REPLACE FUNCTION slope_turn_angle(a geometry, b geometry, c geometry)
+RETURNS double precision
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT 180 - abs(180 - abs(degrees(ST_Azimuth(b, c) - ST_Azimuth(a, b))))
+$$;
+
+-- Elevation in meters of a point or segment end: compact storage (database/queries/compact/) stores
+-- decimetres as smallint, the standard tables meters as double precision.
+CREATE OR REPLACE FUNCTION slope_elevation_m(elevation smallint)
+RETURNS double precision
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT elevation / 10.0::double precision
+$$;
+
+CREATE OR REPLACE FUNCTION slope_elevation_m(elevation double precision)
+RETURNS double precision
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT elevation
+$$;
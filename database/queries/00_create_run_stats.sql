@@ -0,0 +1,24 @@
+-- 00_create_run_stats.sql
+-- This script creates the table in which execute_queries.py records the cost of each full region run,
+-- so that scripts/cost_estimator.py can calibrate its estimates for new regions.
+
+-- estimated_points is the point count estimated before the run, points the actual count,
+-- so their ratio corrects the estimate (e.g. for the points added by adaptive densification).
+-- table_bytes is the total size of the region tables, seconds the run time of all stages.
+
+CREATE TABLE IF NOT EXISTS pipeline_run_stats (
+  name_area text NOT NULL,
+  finished_at timestamptz NOT NULL DEFAULT now(),
+  densify text NOT NULL,
+  area_km2 double precision NOT NULL,
+  roads integer NOT NULL,
+  road_length_m double precision NOT NULL,
+  dtm_tiles integer NOT NULL,
+  estimated_points bigint NOT NULL,
+  points bigint NOT NULL,
+  segments bigint NOT NULL,
+  table_bytes bigint NOT NULL,
+  seconds double precision NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS pipeline_run_stats_densify_idx ON pipeline_run_stats (densify, finished_at DESC);
@@ -0,0 +1,27 @@
+-- 00_create_storage_codes.sql
+-- This script creates the lookup tables of the codes stored by compact storage (CONFIG["storage"],
+-- database/queries/compact/) in place of the text values of the standard tables.
+
+-- Fixed codes of the point status and the segment direction, by the column they are stored in
+CREATE TABLE IF NOT EXISTS storage_codes (
+  kind text NOT NULL,
+  code smallint NOT NULL,
+  value text NOT NULL,
+  PRIMARY KEY (kind, code)
+);
+
+INSERT INTO storage_codes (kind, code, value) VALUES
+  ('status_code', 0, 'valid'),
+  ('status_code', 1, 'null_elevation'),
+  -- The elevation does not fit the smallint decimetres (below -3276.8 m or above 3276.7 m)
+  ('status_code', 2, 'elevation_out_of_range'),
+  ('direction_code', -1, 'downhill_along_road_direction'),
+  ('direction_code', 0, 'flat'),
+  ('direction_code', 1, 'uphill_along_road_direction')
+ON CONFLICT DO NOTHING;
+
+-- Codes of the highway values, added by the segments stage for the highways of its roads
+CREATE TABLE IF NOT EXISTS highway_codes (
+  code smallint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  highway text NOT NULL UNIQUE
+);
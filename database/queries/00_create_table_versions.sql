@@ -0,0 +1,12 @@
+-- 00_create_table_versions.sql
+-- This script creates the table in which the pipeline records when each table was last built,
+-- so that stages whose outputs are newer than their inputs can be skipped.
+
+-- load_data.sh records the loaded dtm and roads tables, execute_queries.py the tables of each stage.
+-- params_hash identifies the region parameters a table was built with (NULL for loaded tables).
+
+CREATE TABLE IF NOT EXISTS pipeline_table_versions (
+  table_name text PRIMARY KEY,
+  built_at timestamptz NOT NULL,
+  params_hash text
+);
@@ -0,0 +1,33 @@
+-- 00_prepare_roads.sql
+-- This script classifies the roads once after load_data.sh loaded them, so the region stages
+-- read typed columns instead of matching patterns in other_tags on every run.
+-- load_data.sh already keeps only highway features (without CONFIG["excluded_highways"]) as single-part lines.
+
+-- 1) Typed bridge, tunnel and layer columns, parsed from the OSM tags
+ALTER TABLE public.roads
+    ADD COLUMN IF NOT EXISTS is_bridge boolean,
+    ADD COLUMN IF NOT EXISTS is_tunnel boolean,
+    ADD COLUMN IF NOT EXISTS layer smallint;
+
+UPDATE public.roads SET
+    is_bridge = COALESCE(
+        bridge = 'yes' OR other_tags ~ '"bridge"=>"(yes|viaduct|aqueduct)"',
+        false
+    ),
+    is_tunnel = COALESCE(
+        tunnel = 'yes' OR other_tags ~ '"tunnel"=>"(yes|building_passage|passage)"',
+        false
+    ),
+    layer = COALESCE(substring(other_tags FROM '"layer"=>"(-?[0-9]{1,2})"')::smallint, 0);
+
+ALTER TABLE public.roads
+    ALTER COLUMN is_bridge SET NOT NULL,
+    ALTER COLUMN is_tunnel SET NOT NULL,
+    ALTER COLUMN layer SET NOT NULL;
+
+-- 2) Indexes for selecting structures and highway types
+CREATE INDEX IF NOT EXISTS roads_structure_idx ON public.roads (layer) WHERE is_bridge OR is_tunnel;
+CREATE INDEX IF NOT EXISTS roads_highway_idx ON public.roads (highway);
+
+-- 3) The table was rewritten by the UPDATE
+VACUUM ANALYZE public.roads;
@@ -1,7 +1,13 @@
 -- 01_extract_points_window.sql
 -- This script creates a table of road points within a given window.
 
--- We expect 6 parameters: minx, miny, maxx, maxy, crs, name_area
+-- We expect 14 parameters: minx, miny, maxx, maxy, crs, name_area, fids, resample ('nearest' or 'bilinear'),
+-- densify ('fixed' or 'adaptive'), densify_coarse, densify_fine, densify_max_rise, densify_max_turn,
+-- storage ('standard' or 'compact')
+
+-- Compact storage runs this script from compact/01_extract_points_window.sql, which converts the points
+-- to the compact layout and drops the clipped DTM: both are then unlogged intermediates (they are rebuilt
+-- by this script, but emptied by a database crash).
 
 DROP TABLE IF EXISTS spatial_window_%(name_area)s;
 DROP TABLE IF EXISTS road_points_window_%(name_area)s;
@@ -15,12 +21,45 @@ SELECT ST_MakeEnvelope(
     %(crs)s
 ) AS geom;
 
--- 2) Create bounded DTM layer
-CREATE TABLE dtm_window_%(name_area)s AS
+-- 2) Create a table of clipped roads to the spatial window
+-- (optionally restricted to a list of road fids, NULL = all roads).
+-- The roads are filtered and classified at load time by 00_prepare_roads.sql.
+CREATE TABLE filtered_roads_%(name_area)s AS
 SELECT 
-    ST_Clip(d.rast, w.geom) as rast
+    r.fid,
+    r.highway,
+    r.layer,
+    CASE WHEN r.is_bridge THEN 'yes' ELSE 'no' END AS bridge_combined,
+    CASE WHEN r.is_tunnel THEN 'yes' ELSE 'no' END AS tunnel_combined,
+    r.geom
+FROM roads r, spatial_window_%(name_area)s w
+WHERE ST_Intersects(r.geom, w.geom)
+AND (%(fids)s::integer[] IS NULL OR r.fid = ANY(%(fids)s::integer[]));
+
+CREATE INDEX filtered_roads_%(name_area)s_geom_idx ON filtered_roads_%(name_area)s USING GIST(geom);
+
+-- 3) Create bounded DTM layer, only from DTM tiles under the selected roads.
+-- In-db tiles are clipped to the window. Out-of-db tiles (load_data.sh --out-db) are kept as
+-- references to the GeoTIFF, so only the pixels under the road points are ever read.
+CREATE TABLE dtm_window_%(name_area)s (rast raster);
+
+DO $$
+BEGIN
+  IF %(storage)s = 'compact' THEN
+    ALTER TABLE dtm_window_%(name_area)s SET UNLOGGED;
+  END IF;
+END $$;
+
+-- @explain
+INSERT INTO dtm_window_%(name_area)s
+SELECT 
+    CASE WHEN ST_BandPath(d.rast) IS NULL THEN ST_Clip(d.rast, w.geom) ELSE d.rast END as rast
 FROM dtm d, spatial_window_%(name_area)s w
-WHERE ST_Intersects(d.rast, w.geom);
+WHERE ST_Intersects(d.rast, w.geom)
+AND EXISTS (
+    SELECT 1 FROM filtered_roads_%(name_area)s r
+    WHERE ST_Envelope(d.rast) && r.geom
+);
 
 -- Add raster constraints
 SELECT AddRasterConstraints('public'::name, 'dtm_window_%(name_area)s'::name, 'rast'::name);
@@ -28,28 +67,6 @@ SELECT AddRasterConstraints('public'::name, 'dtm_window_%(name_area)s'::name, 'r
 -- Create spatial index on the raster
 CREATE INDEX dtm_window_%(name_area)s_rast_idx ON dtm_window_%(name_area)s USING gist(ST_ConvexHull(rast));
 
--- 3) Create a table of clipped roads to the spatial window
-CREATE TABLE filtered_roads_%(name_area)s AS
-SELECT 
-    r.*,
-    CASE 
-        WHEN r.bridge = 'yes' THEN 'yes'
-        WHEN r.other_tags LIKE '%%"bridge"=>"yes"%%' THEN 'yes'
-        WHEN r.other_tags LIKE '%%"bridge"=>"viaduct"%%' THEN 'yes'
-        WHEN r.other_tags LIKE '%%"bridge"=>"aqueduct"%%' THEN 'yes'
-        ELSE 'no'
-    END AS bridge_combined,
-    CASE 
-        WHEN r.tunnel = 'yes' THEN 'yes'
-        WHEN r.other_tags LIKE '%%"tunnel"=>"yes"%%' THEN 'yes'
-        WHEN r.other_tags LIKE '%%"tunnel"=>"building_passage"%%' THEN 'yes'
-        WHEN r.other_tags LIKE '%%"tunnel"=>"passage"%%' THEN 'yes'
-        ELSE 'no'
-    END AS tunnel_combined
-FROM roads r, spatial_window_%(name_area)s w
-WHERE ST_Intersects(r.geom, w.geom)
-AND r.highway IS NOT NULL;
-
 -- 4) Create final table with segmented roads (inserting information at the end)
 CREATE TABLE road_points_window_%(name_area)s (
   fid integer,
@@ -58,19 +75,30 @@ CREATE TABLE road_points_window_%(name_area)s (
   point_status text,
   elevation double precision,
   segmented_points integer,
+  resolution real,
   bridge text,
   tunnel text,
   highway text
 );
 
+DO $$
+BEGIN
+  IF %(storage)s = 'compact' THEN
+    ALTER TABLE road_points_window_%(name_area)s SET UNLOGGED;
+  END IF;
+END $$;
+
+-- @explain: ST_DumpPoints lateral and elevation lookup
 WITH 
 -- 5) Create table with road lengths and segmentation distances in meters
+-- (adaptive densification starts from the coarse distance and refines in step 10)
 road_lengths_table AS (
 SELECT 
   fid, 
   geom,
   ST_Length(geom) AS length_m,
   CASE 
+    WHEN %(densify)s = 'adaptive' THEN %(densify_coarse)s
     WHEN ST_Length(geom) < 50 THEN 5
     WHEN ST_Length(geom) < 100 THEN 10
     ELSE 25
@@ -101,10 +129,13 @@ SELECT
 FROM road_lengths_table
 ),
 -- 7) Create table for each point product of segmented roads. CROSS JOIN LATERAL is used to create a row for each point in the segmented road.
+-- The roads are single LineStrings (load_data.sh), so the path of a point is {index along the road}.
 pts_table AS (
 SELECT
   sr.fid,
-  (dp).path[2] AS seq,
+  -- Adaptive densification leaves room for 999 new points after each point (step 10). Points outside
+  -- the window leave gaps in seq, so the segments stage does not join the points around them.
+  (dp).path[1] * CASE WHEN %(densify)s = 'adaptive' THEN 1000 ELSE 1 END AS seq,
   (dp).geom AS geom_utm,
   sr.seg_distance,
   sr.segmented_points,
@@ -114,25 +145,113 @@ SELECT
 FROM segmented_roads_table sr
 CROSS JOIN LATERAL ST_DumpPoints(sr.geom_segmented) AS dp
 )
--- 8) Create the final road_points_window table
+-- 8) Create the final road_points_window table, keeping the points inside the window
+-- (a bounding box test is exact for a point and a rectangle)
 INSERT INTO road_points_window_%(name_area)s
 SELECT 
   p.fid,
   p.seq,
   p.geom_utm,
   CASE 
-    WHEN ST_Value(dtm_window_%(name_area)s.rast, p.geom_utm) IS NULL THEN 'null_elevation'
+    WHEN s.elevation IS NULL THEN 'null_elevation'
     ELSE 'valid'
   END AS point_status,
-  ST_Value(dtm_window_%(name_area)s.rast, p.geom_utm)::double precision AS elevation,
+  s.elevation,
   p.segmented_points,
+  p.seg_distance AS resolution,
   p.bridge,
   p.tunnel,
   p.highway
 FROM pts_table p
-JOIN spatial_window_%(name_area)s w ON ST_Intersects(p.geom_utm, w.geom)
-LEFT JOIN dtm_window_%(name_area)s ON ST_Intersects(p.geom_utm, dtm_window_%(name_area)s.rast);
+JOIN spatial_window_%(name_area)s w ON p.geom_utm && w.geom
+-- 9) Sample each point once, from exactly one tile. Points on a border shared by two tiles
+-- belong to the tile right of / below the border (half-open tiles), where they are inside the pixel grid.
+LEFT JOIN LATERAL (
+  SELECT slope_sample_elevation(d.rast, p.geom_utm, %(resample)s) AS elevation
+  FROM dtm_window_%(name_area)s d
+  WHERE ST_Intersects(p.geom_utm, ST_ConvexHull(d.rast))
+  ORDER BY ST_UpperLeftX(d.rast) DESC, ST_UpperLeftY(d.rast) ASC
+  LIMIT 1
+) s ON true;
+
+-- 10) Adaptive densification: the interval between two consecutive points is split at the fine distance
+-- where their sampled elevations differ by more than densify_max_rise, where only one of them has an
+-- elevation, or where the road turns by more than densify_max_turn degrees at either end. Consecutive
+-- points of ST_Segmentize lie on one straight piece of the road, so the new points are on the chord.
+-- Only intervals between consecutive points are split, not the gaps where the road leaves the window.
+-- The new points are numbered seq + 1, seq + 2, ... after the interval start, no points are renumbered.
+-- @explain: adaptive refinement of the coarse intervals
+WITH
+intervals AS (
+SELECT
+  p.fid,
+  p.seq,
+  p.geom_utm AS geom_start,
+  CASE WHEN LEAD(p.seq) OVER w = p.seq + 1000 THEN LEAD(p.geom_utm) OVER w END AS geom_end,
+  CASE WHEN LAG(p.seq) OVER w = p.seq - 1000 THEN LAG(p.geom_utm) OVER w END AS geom_before,
+  CASE WHEN LEAD(p.seq, 2) OVER w = p.seq + 2000 THEN LEAD(p.geom_utm, 2) OVER w END AS geom_after,
+  p.elevation AS elev_start,
+  LEAD(p.elevation) OVER w AS elev_end,
+  p.segmented_points,
+  p.bridge,
+  p.tunnel,
+  p.highway
+FROM road_points_window_%(name_area)s p
+WHERE %(densify)s = 'adaptive'
+WINDOW w AS (PARTITION BY p.fid ORDER BY p.seq)
+),
+refined_intervals AS (
+SELECT
+  i.*,
+  CEIL(ST_Distance(i.geom_start, i.geom_end) / %(densify_fine)s)::integer AS pieces
+FROM intervals i
+WHERE i.geom_end IS NOT NULL
+AND (
+  ABS(i.elev_end - i.elev_start) > %(densify_max_rise)s
+  OR (i.elev_start IS NULL) <> (i.elev_end IS NULL)
+  OR slope_turn_angle(i.geom_before, i.geom_start, i.geom_end) > %(densify_max_turn)s
+  OR slope_turn_angle(i.geom_start, i.geom_end, i.geom_after) > %(densify_max_turn)s
+)
+),
+new_points AS (
+SELECT
+  r.fid,
+  r.seq + k AS seq,
+  ST_LineInterpolatePoint(ST_MakeLine(r.geom_start, r.geom_end), k::double precision / r.pieces) AS geom_utm,
+  r.segmented_points,
+  r.bridge,
+  r.tunnel,
+  r.highway
+FROM refined_intervals r
+CROSS JOIN LATERAL generate_series(1, r.pieces - 1) AS k
+)
+INSERT INTO road_points_window_%(name_area)s
+SELECT
+  p.fid,
+  p.seq,
+  p.geom_utm,
+  CASE 
+    WHEN s.elevation IS NULL THEN 'null_elevation'
+    ELSE 'valid'
+  END AS point_status,
+  s.elevation,
+  p.segmented_points,
+  %(densify_fine)s AS resolution,
+  p.bridge,
+  p.tunnel,
+  p.highway
+FROM new_points p
+LEFT JOIN LATERAL (
+  SELECT slope_sample_elevation(d.rast, p.geom_utm, %(resample)s) AS elevation
+  FROM dtm_window_%(name_area)s d
+  WHERE ST_Intersects(p.geom_utm, ST_ConvexHull(d.rast))
+  ORDER BY ST_UpperLeftX(d.rast) DESC, ST_UpperLeftY(d.rast) ASC
+  LIMIT 1
+) s ON true;
 
 -- Create spatial index on the debug table
 CREATE INDEX road_points_window_%(name_area)s_geom_idx ON road_points_window_%(name_area)s USING GIST(geom_utm);
 
+-- Order of the points along each road, scanned by the segments stage
+CREATE INDEX road_points_window_%(name_area)s_seq_idx ON road_points_window_%(name_area)s (fid, seq);
+
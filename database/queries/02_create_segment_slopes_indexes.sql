@@ -0,0 +1,15 @@
+-- 02_create_segment_slopes_indexes.sql
+-- This script creates the indexes of road_segments_slope_<area>. It is included by
+-- 02_create_segment_slopes_table.sql and run on the segments merged from tiles (execute_queries.py --tiles)
+-- and on the segments of the in-process engine (numpy_engine.py), so all segment tables are indexed alike.
+
+-- We expect 1 parameter: name_area
+
+-- Create spatial index
+CREATE INDEX road_segments_slope_%(name_area)s_geom_idx ON road_segments_slope_%(name_area)s USING GIST(segment_geom);
+
+-- Create slope index for range filters and road counts (index-only on fid)
+CREATE INDEX road_segments_slope_%(name_area)s_slope_idx ON road_segments_slope_%(name_area)s (slope_pct) INCLUDE (fid);
+
+-- Per-road slope index for the road lookups of the dashboard (index-only on segment_length)
+CREATE INDEX road_segments_slope_%(name_area)s_fid_slope_idx ON road_segments_slope_%(name_area)s (fid, slope_pct) INCLUDE (segment_length);
@@ -0,0 +1,96 @@
+-- 02_select_segment_slopes.sql
+-- Segments of road_points_window with their slopes in meters, in the standard layout of
+-- road_segments_slope, shared by 02_create_segment_slopes_table.sql and compact/02_create_segment_slopes_table.sql
+
+-- Segments are computed in one ordered scan per road with window functions: each valid point is
+-- paired with the next valid point. Points without elevation in between are bridged when the next
+-- valid point is at most max_gap meters away, otherwise the road is interrupted there.
+-- Points outside the region window leave a gap in seq, which is never bridged: every road point index
+-- between the two points (seq, or seq / 1000 with adaptive densification, seq = index * 1000 + k)
+-- must be in the table, which holds when the index difference equals the count of indexes in between.
+-- The scan follows the (fid, seq) index of road_points_window and is partitioned by road.
+-- Elevations are read with slope_elevation_m, whatever the storage of the points, and the bridge,
+-- tunnel and highway attributes of each road are taken from filtered_roads.
+WITH
+ordered_points AS (
+  -- Next point of the road in the table, with or without elevation
+  SELECT
+    p.fid,
+    p.seq,
+    p.geom_utm,
+    slope_elevation_m(p.elevation) AS elevation,
+    p.resolution,
+    LEAD(p.seq) OVER w AS next_seq,
+    -- Road point index of the point (of the coarse point it follows with adaptive densification)
+    p.seq / CASE WHEN %(densify)s = 'adaptive' THEN 1000 ELSE 1 END AS road_index,
+    -- Road point indexes of the road in the table up to this point
+    COUNT(*) FILTER (WHERE %(densify)s <> 'adaptive' OR mod(p.seq, 1000) = 0) OVER w AS road_index_count
+  FROM road_points_window_%(name_area)s p
+  WINDOW w AS (PARTITION BY p.fid ORDER BY p.seq)
+),
+consecutive_points AS (
+  -- Pair every valid point with the next valid point of the same road
+  SELECT
+    p.fid,
+    p.seq AS seq_start,
+    LEAD(p.seq) OVER w AS seq_end,
+    p.next_seq,
+    LEAD(p.road_index) OVER w - p.road_index AS index_step,
+    LEAD(p.road_index_count) OVER w - p.road_index_count AS index_count_step,
+    p.elevation AS elev_start,
+    LEAD(p.elevation) OVER w AS elev_end,
+    p.geom_utm AS geom_start,
+    LEAD(p.geom_utm) OVER w AS geom_end,
+    -- A coarse point followed by refined points starts a segment at the fine distance
+    LEAST(p.resolution, LEAD(p.resolution) OVER w) AS resolution
+  FROM ordered_points p
+  WHERE p.elevation IS NOT NULL  -- Only include points with valid elevation
+  WINDOW w AS (PARTITION BY p.fid ORDER BY p.seq)
+),
+segments AS (
+  SELECT
+    fid,
+    seq_start,
+    seq_end,
+    elev_start,
+    elev_end,
+    ST_MakeLine(geom_start, geom_end) AS segment_geom,
+    ST_Distance(geom_start, geom_end) AS segment_length,
+    resolution
+  FROM consecutive_points
+  -- No road point in between is missing from the table (left out by the window or not sampled),
+  -- the points in between, if any, have no elevation
+  WHERE index_step = index_count_step
+  AND (
+    seq_end = next_seq  -- Next point along the road
+    OR ST_DWithin(geom_start, geom_end, %(max_gap)s)  -- Bridged gap of points without elevation
+  )
+)
+SELECT 
+  s.fid,
+  ROW_NUMBER() OVER(PARTITION BY s.fid ORDER BY seq_start) AS segment_id,
+  seq_start,
+  seq_end,
+  segment_length,
+  resolution,  -- Densification distance of the segment (meters)
+  elev_start,
+  elev_end,
+  ABS(elev_end - elev_start) AS elevation_change,
+  CASE 
+    WHEN r.bridge_combined = 'yes' THEN NULL  -- Exclude bridges
+    WHEN r.tunnel_combined = 'yes' THEN NULL  -- Exclude tunnels
+    WHEN segment_length = 0 THEN NULL  -- Avoid division by zero
+    ELSE ABS(elev_end - elev_start) / segment_length * 100.0
+  END AS slope_pct,
+  CASE
+    WHEN elev_end > elev_start THEN 'uphill_along_road_direction'
+    WHEN elev_end < elev_start THEN 'downhill_along_road_direction'
+    ELSE 'flat'
+  END AS direction,
+  segment_geom,
+  r.bridge_combined AS bridge,
+  r.tunnel_combined AS tunnel,
+  r.highway
+FROM segments s
+JOIN filtered_roads_%(name_area)s r ON r.fid = s.fid
+WHERE segment_length > 0  -- Exclude zero-length segments
@@ -0,0 +1,33 @@
+-- 03_create_slope_bins_table.sql
+-- This script creates a per-region summary of the slope distribution in fine-grained bins,
+-- so the dashboard can compute histogram, median and counts without scanning every segment.
+
+-- Bins are 0.1 wide between 0 and 40 (bins 1 to 400); bin 401 holds all slopes from 40 upwards.
+
+DROP TABLE IF EXISTS road_slope_bins_%(name_area)s;
+
+CREATE TABLE road_slope_bins_%(name_area)s AS
+WITH binned AS (
+  SELECT
+    width_bucket(slope_pct, 0, 40, 400) AS bin,
+    fid,
+    slope_pct,
+    segment_length
+  FROM road_segments_slope_%(name_area)s
+  WHERE slope_pct IS NOT NULL
+)
+SELECT
+  bin,
+  (bin - 1) / 10.0::double precision AS bin_min,
+  CASE WHEN bin > 400 THEN 'Infinity'::double precision ELSE bin / 10.0::double precision END AS bin_max,
+  COUNT(*) AS segment_count,
+  COUNT(DISTINCT fid) AS road_count,
+  SUM(segment_length) AS length_m,
+  SUM(slope_pct) AS slope_sum,
+  MIN(slope_pct) AS min_slope,
+  MAX(slope_pct) AS max_slope
+FROM binned
+GROUP BY bin
+ORDER BY bin;
+
+ALTER TABLE road_slope_bins_%(name_area)s ADD PRIMARY KEY (bin);
@@ -0,0 +1,91 @@
+-- 04_create_segment_lod_table.sql
+-- This script creates simplified levels of detail of the slope map for low zoom levels:
+-- consecutive segments of a road with the same slope category are merged into one line,
+-- which is then simplified once per tolerance in lod_tolerances (level 1, 2, ...).
+
+-- We expect 2 parameters: name_area, lod_tolerances (meters, one per level)
+
+DROP TABLE IF EXISTS road_segments_lod_%(name_area)s;
+
+CREATE TABLE road_segments_lod_%(name_area)s AS
+WITH
+categorized AS (
+  SELECT
+    fid,
+    seq_start,
+    seq_end,
+    slope_pct,
+    segment_length,
+    segment_geom,
+    CASE
+      WHEN slope_pct <= 1 THEN 1
+      WHEN slope_pct <= 3 THEN 2
+      WHEN slope_pct <= 6 THEN 3
+      WHEN slope_pct <= 10 THEN 4
+      ELSE 5
+    END AS slope_category
+  FROM road_segments_slope_%(name_area)s
+  WHERE slope_pct IS NOT NULL
+),
+flagged AS (
+  -- A new run starts when the category changes or the segment does not continue the previous one
+  SELECT
+    c.*,
+    CASE
+      WHEN slope_category = LAG(slope_category) OVER w AND seq_start = LAG(seq_end) OVER w THEN 0
+      ELSE 1
+    END AS new_run
+  FROM categorized c
+  WINDOW w AS (PARTITION BY fid ORDER BY seq_start)
+),
+runs AS (
+  SELECT
+    f.*,
+    SUM(new_run) OVER (PARTITION BY fid ORDER BY seq_start) AS run_id
+  FROM flagged f
+),
+merged AS (
+  -- One line per run of equal slope category
+  SELECT
+    fid,
+    run_id,
+    slope_category,
+    MIN(slope_pct) AS min_slope,
+    MAX(slope_pct) AS max_slope,
+    SUM(slope_pct * segment_length) / NULLIF(SUM(segment_length), 0) AS mean_slope,
+    SUM(segment_length) AS length_m,
+    ST_MakeLine(segment_geom ORDER BY seq_start) AS geom
+  FROM runs
+  GROUP BY fid, run_id, slope_category
+)
+SELECT
+  lod,
+  tolerance,
+  fid,
+  run_id,
+  slope_category,
+  min_slope,
+  max_slope,
+  mean_slope,
+  length_m,
+  geom
+FROM (
+  SELECT
+    l.lod::integer AS lod,
+    l.tolerance,
+    m.fid,
+    m.run_id,
+    m.slope_category,
+    m.min_slope,
+    m.max_slope,
+    m.mean_slope,
+    m.length_m,
+    ST_Simplify(m.geom, l.tolerance) AS geom
+  FROM merged m
+  CROSS JOIN unnest(%(lod_tolerances)s::double precision[]) WITH ORDINALITY AS l(tolerance, lod)
+) simplified
+-- Runs shorter than the tolerance collapse and are dropped at that level
+WHERE geom IS NOT NULL AND NOT ST_IsEmpty(geom);
+
+CREATE INDEX road_segments_lod_%(name_area)s_geom_idx ON road_segments_lod_%(name_area)s USING GIST(geom);
+CREATE INDEX road_segments_lod_%(name_area)s_lod_idx ON road_segments_lod_%(name_area)s (lod);
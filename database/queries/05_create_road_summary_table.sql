@@ -0,0 +1,67 @@
+-- 05_create_road_summary_table.sql
+-- This script creates one row per road with its length, slope and climb figures, so the dashboard
+-- can count and filter roads without scanning every segment.
+
+-- We expect 1 parameter: name_area
+
+-- The highway of each road is taken from filtered_roads, compact storage keeps a code per segment.
+-- Segment end elevations are read with slope_elevation_m, in meters whatever the storage.
+
+-- Slope categories as in the dashboard legend: flat <= 1, gentle <= 3, moderate <= 6, steep <= 10,
+-- very steep > 10 percent. Bridges and tunnels have no slope: they count in length_m only.
+
+DROP TABLE IF EXISTS road_summary_%(name_area)s;
+
+-- @explain: aggregation of the segments per road
+CREATE TABLE road_summary_%(name_area)s AS
+WITH per_road AS (
+  SELECT
+    fid,
+    COUNT(*) AS segment_count,
+    SUM(segment_length) AS length_m,
+    SUM(segment_length) FILTER (WHERE slope_pct IS NOT NULL) AS slope_length_m,
+    SUM(slope_pct * segment_length) AS weighted_slope_sum,
+    MIN(slope_pct) AS min_slope,
+    MAX(slope_pct) AS max_slope,
+    -- Elevation gained and lost travelling along the road direction (the reverse direction swaps them)
+    SUM(GREATEST(slope_elevation_m(elev_end) - slope_elevation_m(elev_start), 0))
+      FILTER (WHERE slope_pct IS NOT NULL) AS climb_m,
+    SUM(GREATEST(slope_elevation_m(elev_start) - slope_elevation_m(elev_end), 0))
+      FILTER (WHERE slope_pct IS NOT NULL) AS descent_m,
+    SUM(segment_length) FILTER (WHERE slope_pct <= 1) AS flat_m,
+    SUM(segment_length) FILTER (WHERE slope_pct > 1 AND slope_pct <= 3) AS gentle_m,
+    SUM(segment_length) FILTER (WHERE slope_pct > 3 AND slope_pct <= 6) AS moderate_m,
+    SUM(segment_length) FILTER (WHERE slope_pct > 6 AND slope_pct <= 10) AS steep_m,
+    SUM(segment_length) FILTER (WHERE slope_pct > 10) AS very_steep_m
+  FROM road_segments_slope_%(name_area)s
+  GROUP BY fid
+)
+SELECT
+  p.fid,
+  r.highway,
+  segment_count,
+  length_m,
+  COALESCE(slope_length_m, 0) AS slope_length_m,
+  weighted_slope_sum / NULLIF(slope_length_m, 0) AS mean_slope,
+  min_slope,
+  max_slope,
+  COALESCE(climb_m, 0) AS climb_m,
+  COALESCE(descent_m, 0) AS descent_m,
+  -- Share of the length with a slope, per slope category
+  COALESCE(flat_m, 0) / NULLIF(slope_length_m, 0) AS share_flat,
+  COALESCE(gentle_m, 0) / NULLIF(slope_length_m, 0) AS share_gentle,
+  COALESCE(moderate_m, 0) / NULLIF(slope_length_m, 0) AS share_moderate,
+  COALESCE(steep_m, 0) / NULLIF(slope_length_m, 0) AS share_steep,
+  COALESCE(very_steep_m, 0) / NULLIF(slope_length_m, 0) AS share_very_steep
+FROM per_road p
+JOIN filtered_roads_%(name_area)s r ON r.fid = p.fid;
+
+ALTER TABLE road_summary_%(name_area)s ADD PRIMARY KEY (fid);
+
+-- Indexes for road filters and for counting roads by slope range
+CREATE INDEX road_summary_%(name_area)s_min_slope_idx ON road_summary_%(name_area)s (min_slope);
+CREATE INDEX road_summary_%(name_area)s_max_slope_idx ON road_summary_%(name_area)s (max_slope);
+CREATE INDEX road_summary_%(name_area)s_mean_slope_idx ON road_summary_%(name_area)s (mean_slope);
+CREATE INDEX road_summary_%(name_area)s_length_idx ON road_summary_%(name_area)s (length_m);
+CREATE INDEX road_summary_%(name_area)s_climb_idx ON road_summary_%(name_area)s (climb_m);
+CREATE INDEX road_summary_%(name_area)s_descent_idx ON road_summary_%(name_area)s (descent_m);
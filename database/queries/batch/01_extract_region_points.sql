@@ -0,0 +1,38 @@
+-- batch/01_extract_region_points.sql
+-- This script creates the filtered roads and road points of a region from those of a shared window
+-- covering several overlapping regions, instead of clipping and sampling the DTM again for each region.
+
+-- We expect 8 parameters: minx, miny, maxx, maxy, crs, name_area, shared_area, storage
+
+DROP TABLE IF EXISTS road_points_window_%(name_area)s;
+DROP TABLE IF EXISTS filtered_roads_%(name_area)s;
+-- The region has no clipped DTM of its own in batch mode
+DROP TABLE IF EXISTS dtm_window_%(name_area)s;
+
+-- 1) Roads of the region, as selected by 01_extract_points_window.sql
+CREATE TABLE filtered_roads_%(name_area)s AS
+SELECT r.*
+FROM filtered_roads_%(shared_area)s r
+WHERE ST_Intersects(r.geom, ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, %(crs)s));
+
+CREATE INDEX filtered_roads_%(name_area)s_geom_idx ON filtered_roads_%(name_area)s USING GIST(geom);
+
+-- 2) Sampled points inside the region window (a bounding box test is exact for a point and a rectangle),
+-- with the columns and storage of the shared points
+CREATE TABLE road_points_window_%(name_area)s (LIKE road_points_window_%(shared_area)s);
+
+DO $$
+BEGIN
+  IF %(storage)s = 'compact' THEN
+    ALTER TABLE road_points_window_%(name_area)s SET UNLOGGED;
+  END IF;
+END $$;
+
+INSERT INTO road_points_window_%(name_area)s
+SELECT p.*
+FROM road_points_window_%(shared_area)s p
+WHERE p.geom_utm && ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, %(crs)s)
+ORDER BY p.fid, p.seq;
+
+CREATE INDEX road_points_window_%(name_area)s_geom_idx ON road_points_window_%(name_area)s USING GIST(geom_utm);
+CREATE INDEX road_points_window_%(name_area)s_seq_idx ON road_points_window_%(name_area)s (fid, seq);
@@ -0,0 +1,59 @@
+-- compact/01_extract_points_window.sql
+-- This script creates the road points of 01_extract_points_window.sql in the compact layout of
+-- CONFIG["storage"] = "compact", and drops the clipped DTM once the points are sampled.
+
+-- We expect the parameters of 01_extract_points_window.sql
+
+-- The compact points table is unlogged, like the clipped DTM: it is rebuilt by this script, but emptied
+-- by a database crash. Per point it keeps:
+--   elevation    smallint decimetres (round(elevation * 10)), from -3276.8 to 3276.7 m,
+--                read in meters with slope_elevation_m
+--   status_code  the point status as a code of storage_codes (00_create_storage_codes.sql): 0 valid,
+--                1 no elevation, 2 elevation out of the smallint range (the elevation is then NULL)
+-- The per-road attributes (bridge, tunnel, highway) stay in filtered_roads only and the number of points
+-- per road is not stored.
+
+-- 1) Points in the standard layout, as in the standard storage
+-- @include 01_extract_points_window
+
+-- 2) Converted to the compact layout, in the order of the (fid, seq) index
+DROP TABLE IF EXISTS road_points_window_%(name_area)s_compact;
+
+CREATE UNLOGGED TABLE road_points_window_%(name_area)s_compact (
+  fid integer,
+  seq integer,
+  geom_utm geometry(Point, %(crs)s),
+  status_code smallint,
+  elevation smallint,
+  resolution real
+);
+
+-- @explain: conversion of the points to the compact layout
+INSERT INTO road_points_window_%(name_area)s_compact
+SELECT
+  p.fid,
+  p.seq,
+  p.geom_utm,
+  CASE
+    WHEN p.elevation IS NULL THEN 1
+    WHEN round(p.elevation * 10) NOT BETWEEN -32768 AND 32767 THEN 2
+    ELSE 0
+  END AS status_code,
+  CASE
+    WHEN round(p.elevation * 10) BETWEEN -32768 AND 32767 THEN round(p.elevation * 10)
+  END AS elevation,
+  p.resolution
+FROM road_points_window_%(name_area)s p
+ORDER BY p.fid, p.seq;
+
+DROP TABLE road_points_window_%(name_area)s;
+ALTER TABLE road_points_window_%(name_area)s_compact RENAME TO road_points_window_%(name_area)s;
+
+-- Create spatial index on the debug table
+CREATE INDEX road_points_window_%(name_area)s_geom_idx ON road_points_window_%(name_area)s USING GIST(geom_utm);
+
+-- Order of the points along each road, scanned by the segments stage
+CREATE INDEX road_points_window_%(name_area)s_seq_idx ON road_points_window_%(name_area)s (fid, seq);
+
+-- 3) The clipped DTM is only read while sampling
+DROP TABLE dtm_window_%(name_area)s;
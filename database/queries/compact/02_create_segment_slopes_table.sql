@@ -0,0 +1,66 @@
+-- compact/02_create_segment_slopes_table.sql
+-- This script creates the road segments of 02_create_segment_slopes_table.sql in the compact layout of
+-- CONFIG["storage"] = "compact".
+
+-- We expect the parameters of 02_create_segment_slopes_table.sql
+
+-- The slopes are computed by 02_select_segment_slopes.sql from the decimetre point elevations, then per segment:
+--   elev_start, elev_end  smallint decimetres, as the points, read in meters with slope_elevation_m
+--   direction_code        sign of the elevation change, as a code of storage_codes (-1, 0, 1)
+--   highway_code          the highway of the road, as a code of highway_codes
+--   is_bridge, is_tunnel  the bridge and tunnel values of the road as flags
+-- elevation_change is not stored, it is abs(elev_end - elev_start).
+
+DROP TABLE IF EXISTS road_segments_slope_%(name_area)s;
+
+-- 1) Codes of the highway values new to highway_codes
+INSERT INTO highway_codes (highway)
+SELECT DISTINCT r.highway
+FROM filtered_roads_%(name_area)s r
+WHERE r.highway IS NOT NULL
+AND NOT EXISTS (SELECT 1 FROM highway_codes c WHERE c.highway = r.highway)
+ON CONFLICT (highway) DO NOTHING;
+
+-- 2) Segments in the compact layout
+CREATE TABLE road_segments_slope_%(name_area)s (
+  fid integer,
+  segment_id bigint,
+  seq_start integer,
+  seq_end integer,
+  segment_length double precision,
+  slope_pct double precision,
+  segment_geom geometry(LineString, %(crs)s),
+  resolution real,
+  elev_start smallint,
+  elev_end smallint,
+  direction_code smallint,
+  highway_code smallint,
+  is_bridge boolean,
+  is_tunnel boolean
+);
+
+-- @explain: window function pairing of consecutive valid points
+INSERT INTO road_segments_slope_%(name_area)s
+SELECT
+  s.fid,
+  s.segment_id,
+  s.seq_start,
+  s.seq_end,
+  s.segment_length,
+  s.slope_pct,
+  s.segment_geom,
+  s.resolution,
+  -- Exact: the point elevations are decimetres
+  round(s.elev_start * 10),
+  round(s.elev_end * 10),
+  sign(s.elev_end - s.elev_start),
+  c.code,
+  s.bridge = 'yes',
+  s.tunnel = 'yes'
+FROM (
+-- @include 02_select_segment_slopes
+) s
+LEFT JOIN highway_codes c ON c.highway = s.highway;
+
+-- Indexes shared with the standard layout
+-- @include 02_create_segment_slopes_indexes
@@ -0,0 +1,78 @@
+-- incremental/01_detect_changes.sql
+-- This script fingerprints the roads and DTM tiles of the window and lists the roads that must be recomputed.
+
+-- We expect 6 parameters: minx, miny, maxx, maxy, crs, name_area
+
+-- 1) Fingerprint tables of the last completed run (empty before the first run)
+CREATE TABLE IF NOT EXISTS road_fingerprints_%(name_area)s (
+  fid integer PRIMARY KEY,
+  fingerprint text
+);
+
+CREATE TABLE IF NOT EXISTS dtm_fingerprints_%(name_area)s (
+  tile_key text PRIMARY KEY,
+  envelope geometry(Polygon, %(crs)s),
+  fingerprint text
+);
+
+DROP TABLE IF EXISTS road_fingerprints_new_%(name_area)s;
+DROP TABLE IF EXISTS dtm_fingerprints_new_%(name_area)s;
+DROP TABLE IF EXISTS changed_dtm_tiles_%(name_area)s;
+DROP TABLE IF EXISTS changed_roads_%(name_area)s;
+
+-- 2) Current fingerprint per road: geometry and tags hash keyed by fid
+CREATE TABLE road_fingerprints_new_%(name_area)s AS
+SELECT
+  r.fid,
+  md5(
+    ST_AsBinary(r.geom)
+    || convert_to(concat_ws('|', r.highway, r.is_bridge, r.is_tunnel, r.layer), 'UTF8')
+  ) AS fingerprint
+FROM roads r
+JOIN (SELECT ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, %(crs)s) AS geom) w
+  ON ST_Intersects(r.geom, w.geom);
+
+ALTER TABLE road_fingerprints_new_%(name_area)s ADD PRIMARY KEY (fid);
+
+-- 3) Current fingerprint per DTM tile, keyed by the tile envelope (rids change when the DTM is reloaded).
+-- The pixels are not read: a tile is fingerprinted on its source file (raster2pgsql -F), its grid, its band
+-- (pixel type, nodata value and the file of out-of-db tiles) and the time the DTM was last loaded
+-- (recorded by load_data.sh), so every reload counts as a change of the reloaded tiles.
+CREATE TABLE dtm_fingerprints_new_%(name_area)s AS
+SELECT
+  ST_AsText(ST_Envelope(d.rast)) AS tile_key,
+  ST_Envelope(d.rast)::geometry(Polygon, %(crs)s) AS envelope,
+  md5(concat_ws('|',
+    d.filename,
+    ST_MetaData(d.rast)::text,
+    ST_BandMetaData(d.rast, 1)::text,
+    (SELECT v.built_at FROM pipeline_table_versions v WHERE v.table_name = 'dtm')
+  )) AS fingerprint
+FROM dtm d
+JOIN (SELECT ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, %(crs)s) AS geom) w
+  ON ST_Intersects(d.rast, w.geom);
+
+ALTER TABLE dtm_fingerprints_new_%(name_area)s ADD PRIMARY KEY (tile_key);
+
+-- 4) DTM tiles that were added, reloaded with different pixels or removed
+CREATE TABLE changed_dtm_tiles_%(name_area)s AS
+SELECT COALESCE(n.envelope, o.envelope) AS envelope
+FROM dtm_fingerprints_new_%(name_area)s n
+FULL JOIN dtm_fingerprints_%(name_area)s o USING (tile_key)
+WHERE n.fingerprint IS DISTINCT FROM o.fingerprint;
+
+CREATE INDEX changed_dtm_tiles_%(name_area)s_geom_idx ON changed_dtm_tiles_%(name_area)s USING GIST(envelope);
+
+-- 5) Roads to recompute: new, changed or deleted roads, and roads on changed DTM tiles
+CREATE TABLE changed_roads_%(name_area)s AS
+SELECT fid
+FROM road_fingerprints_new_%(name_area)s n
+FULL JOIN road_fingerprints_%(name_area)s o USING (fid)
+WHERE n.fingerprint IS DISTINCT FROM o.fingerprint
+UNION
+SELECT r.fid
+FROM roads r
+JOIN road_fingerprints_new_%(name_area)s n ON n.fid = r.fid
+JOIN changed_dtm_tiles_%(name_area)s t ON ST_Intersects(r.geom, t.envelope);
+
+ALTER TABLE changed_roads_%(name_area)s ADD PRIMARY KEY (fid);
@@ -0,0 +1,45 @@
+-- incremental/02_apply_changes.sql
+-- This script replaces the changed roads in the region tables with the rows recomputed in the *_delta tables.
+
+-- We expect 6 parameters: minx, miny, maxx, maxy, crs, name_area
+
+-- 1) Remove the old rows of every changed road
+DELETE FROM filtered_roads_%(name_area)s t USING changed_roads_%(name_area)s c WHERE t.fid = c.fid;
+DELETE FROM road_points_window_%(name_area)s t USING changed_roads_%(name_area)s c WHERE t.fid = c.fid;
+DELETE FROM road_segments_slope_%(name_area)s t USING changed_roads_%(name_area)s c WHERE t.fid = c.fid;
+
+-- 2) Insert the recomputed rows (deleted roads have none)
+INSERT INTO filtered_roads_%(name_area)s SELECT * FROM filtered_roads_%(name_area)s_delta;
+INSERT INTO road_points_window_%(name_area)s SELECT * FROM road_points_window_%(name_area)s_delta;
+INSERT INTO road_segments_slope_%(name_area)s SELECT * FROM road_segments_slope_%(name_area)s_delta;
+
+-- 3) Refresh the clipped DTM on the changed tiles (constraints are rebuilt as the extent may change).
+-- Tiled runs and compact storage do not keep the clipped DTM.
+DO $$
+BEGIN
+  IF to_regclass('public.dtm_window_%(name_area)s') IS NULL THEN
+    RETURN;
+  END IF;
+
+  PERFORM DropRasterConstraints('public'::name, 'dtm_window_%(name_area)s'::name, 'rast'::name);
+
+  DELETE FROM dtm_window_%(name_area)s d
+  USING changed_dtm_tiles_%(name_area)s t
+  WHERE ST_Intersects(ST_Envelope(d.rast), t.envelope)
+  AND NOT ST_Touches(ST_Envelope(d.rast), t.envelope);
+
+  INSERT INTO dtm_window_%(name_area)s
+  SELECT CASE
+    WHEN ST_BandPath(d.rast) IS NULL THEN ST_Clip(d.rast, ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, %(crs)s))
+    ELSE d.rast
+  END
+  FROM dtm d
+  JOIN dtm_fingerprints_new_%(name_area)s n ON n.tile_key = ST_AsText(ST_Envelope(d.rast))
+  LEFT JOIN dtm_fingerprints_%(name_area)s o USING (tile_key)
+  WHERE n.fingerprint IS DISTINCT FROM o.fingerprint;
+
+  PERFORM AddRasterConstraints('public'::name, 'dtm_window_%(name_area)s'::name, 'rast'::name);
+END $$;
+
+ANALYZE road_points_window_%(name_area)s;
+ANALYZE road_segments_slope_%(name_area)s;
@@ -0,0 +1,19 @@
+-- incremental/03_commit_fingerprints.sql
+-- This script stores the fingerprints of this run and drops the change lists and delta tables.
+
+-- We expect 1 parameter: name_area
+
+-- 1) The current fingerprints become the reference for the next run
+TRUNCATE road_fingerprints_%(name_area)s, dtm_fingerprints_%(name_area)s;
+INSERT INTO road_fingerprints_%(name_area)s SELECT fid, fingerprint FROM road_fingerprints_new_%(name_area)s;
+INSERT INTO dtm_fingerprints_%(name_area)s SELECT tile_key, envelope, fingerprint FROM dtm_fingerprints_new_%(name_area)s;
+
+-- 2) Drop the change lists and the delta tables
+DROP TABLE road_fingerprints_new_%(name_area)s;
+DROP TABLE dtm_fingerprints_new_%(name_area)s;
+DROP TABLE changed_dtm_tiles_%(name_area)s;
+DROP TABLE changed_roads_%(name_area)s;
+DROP TABLE IF EXISTS dtm_window_%(name_area)s_delta;
+DROP TABLE IF EXISTS filtered_roads_%(name_area)s_delta;
+DROP TABLE IF EXISTS road_points_window_%(name_area)s_delta;
+DROP TABLE IF EXISTS road_segments_slope_%(name_area)s_delta;
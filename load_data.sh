@@ -7,13 +7,23 @@ DB_USER=$(python3 -c "from config import CONFIG; print(CONFIG['db_connection']['
 DB_PASSWORD=$(python3 -c "from config import CONFIG; print(CONFIG['db_connection']['password'])")
 DB_HOST=$(python3 -c "from config import CONFIG; print(CONFIG['db_connection']['host'])")
 TARGET_SRID=$(python3 -c "from config import CONFIG; print(CONFIG['dtm_crs'].split(':')[1])")
+MAP_SRID=$(python3 -c "from config import CONFIG; print(CONFIG['map_crs'].split(':')[1])")
+COVERAGE_CELL=$(python3 -c "from config import CONFIG; print(CONFIG['coverage_cell_size'])")
+ROADS_WHERE=$(python3 -c "from config import CONFIG; print('highway IS NOT NULL AND highway NOT IN (%s)' % ', '.join(\"'%s'\" % h for h in CONFIG['excluded_highways']))")
 
 # See README in data folder for more details about downloading the data
 # Default values
 DTM_FILE="data/dtm.tif"
 ROADS_FILE="data/roads.gpkg"
 TILE_SIZE="500x500"
+TILE_SIZE_SET=false
 TILES_PATH=""
+# Register the DTM as out-of-db rasters pointing at a Cloud-Optimized GeoTIFF instead of copying the pixels
+OUT_DB=false
+COG_BLOCKSIZE=512
+# Parallel COPY connections for the DTM (1 = single psql session)
+JOBS=1
+RESUME=false
 # Flags to track what should be loaded
 LOAD_DTM=false
 LOAD_ROADS=false
@@ -27,6 +37,10 @@ show_usage() {
   echo -e "  -t, --tile-size SIZE   Tile size for raster import (default: 500x500)"
   echo -e "  -s, --srid EPSG        Target SRID/EPSG code (default: $TARGET_SRID)"
   echo -e "  -p, --tiles-path PATH  Path to DTM tiles (if creating unified DTM)"
+  echo -e "  -o, --out-db           Keep the DTM pixels in a Cloud-Optimized GeoTIFF next to the DTM file and"
+  echo -e "                         register it as out-of-db rasters (the database server must see the same path)"
+  echo -e "  -j, --jobs N           Load the DTM over N parallel COPY connections (scripts/load_dtm.py)"
+  echo -e "  --resume               With --jobs, keep the DTM table and load only the missing parts"
   echo -e "  -do, --dtm-only        Load only DTM"
   echo -e "  -ro, --roads-only      Load only roads"
   echo -e "  -h, --help             Show this help message"
@@ -120,6 +134,7 @@ while [[ $# -gt 0 ]]; do
       ;;
     -t|--tile-size)
       TILE_SIZE="$2"
+      TILE_SIZE_SET=true
       shift 2
       ;;
     -s|--srid)
@@ -130,6 +145,18 @@ while [[ $# -gt 0 ]]; do
       TILES_PATH="$2"
       shift 2
       ;;
+    -o|--out-db)
+      OUT_DB=true
+      shift 1
+      ;;
+    -j|--jobs)
+      JOBS="$2"
+      shift 2
+      ;;
+    --resume)
+      RESUME=true
+      shift 1
+      ;;
     -do|--dtm-only)
       LOAD_DTM=true
       LOAD_ROADS=false
@@ -180,11 +207,15 @@ echo -e "Starting data loading process for database: $DB_NAME"
 echo "Target CRS: EPSG:$TARGET_SRID"
 
 if [ "$LOAD_DTM" = true ]; then
-    # Drop existing DTM table if it exists
-    echo "Dropping existing DTM table if it exists..."
-    PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -U $DB_USER -d "$DB_NAME" -c "DROP TABLE IF EXISTS public.dtm CASCADE;"
+    if [ "$JOBS" -le 1 ]; then
+        # Drop existing DTM table if it exists (the parallel loader drops it itself, unless resuming)
+        echo "Dropping existing DTM table if it exists..."
+        PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -U $DB_USER -d "$DB_NAME" -c "DROP TABLE IF EXISTS public.dtm CASCADE;"
+    fi
 
     dtm_srid=""
+    # Tiles in the target CRS are loaded one file per part by the parallel loader, without merging them
+    LOAD_TILES=false
     if [[ ! -z "$TILES_PATH" ]]; then
         # Check CRS of first tile
         first_tile=$(ls "$TILES_PATH"/*.tif | head -n 1)
@@ -200,7 +231,13 @@ if [ "$LOAD_DTM" = true ]; then
             exit 1
         fi
         echo "DTM CRS detected: EPSG:$dtm_srid"
-        
+
+        if [ "$JOBS" -gt 1 ] && [ "$OUT_DB" = false ] && [ "$dtm_srid" = "$TARGET_SRID" ]; then
+            LOAD_TILES=true
+        fi
+    fi
+
+    if [[ ! -z "$TILES_PATH" ]] && [ "$LOAD_TILES" = false ]; then
         # Create output directory if needed
         output_dir=$(dirname "$DTM_FILE")
         if [ ! -d "$output_dir" ] && [ "$output_dir" != "." ]; then
@@ -235,7 +272,7 @@ if [ "$LOAD_DTM" = true ]; then
             echo "Error: Failed to create DTM file"
             exit 1
         fi
-    else
+    elif [ "$LOAD_TILES" = false ]; then
         if [ ! -f "$DTM_FILE" ]; then
             echo "Error: DTM file '$DTM_FILE' not found"
             exit 1
@@ -265,39 +302,82 @@ if [ "$LOAD_DTM" = true ]; then
         fi
     fi
 
+    RASTER_FILE="$DTM_FILE"
+    RASTER_OPTIONS=""
+    if [ "$OUT_DB" = true ]; then
+        # Internally tiled and compressed copy of the DTM, read by PostGIS through GDAL
+        RASTER_FILE="${DTM_FILE%.*}_cog.tif"
+        echo "Converting DTM to Cloud-Optimized GeoTIFF: $RASTER_FILE"
+        gdal_translate -of COG -co COMPRESS=DEFLATE -co PREDICTOR=YES -co BLOCKSIZE=$COG_BLOCKSIZE \
+            "$DTM_FILE" "$RASTER_FILE"
+        if [[ $? -ne 0 ]]; then
+            echo "Error converting DTM to Cloud-Optimized GeoTIFF"
+            exit 1
+        fi
+        # The database server opens the file itself, so register it under its absolute path
+        RASTER_FILE="$(realpath "$RASTER_FILE")"
+        RASTER_OPTIONS="-R"
+        # Align the database tiles with the GeoTIFF blocks, so reading a tile reads whole blocks
+        if [ "$TILE_SIZE_SET" = false ]; then
+            TILE_SIZE="${COG_BLOCKSIZE}x${COG_BLOCKSIZE}"
+        fi
+        # Out-of-db rasters are disabled by default in PostGIS
+        PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -U $DB_USER -d "$DB_NAME" -c "
+            ALTER DATABASE \"$DB_NAME\" SET postgis.enable_outdb_rasters = true;
+            ALTER DATABASE \"$DB_NAME\" SET postgis.gdal_enabled_drivers = 'GTiff';"
+    fi
+
     # Load DTM raster to the database
     echo "Loading DTM raster into database..."
     echo "This may take some time depending on the size of your DTM file."
 
-    # Create a temporary SQL file for the raster import
-    TMPFILE=$(mktemp)
-    raster2pgsql -s $TARGET_SRID -C -I -M -F -t $TILE_SIZE "$DTM_FILE" public.dtm > "$TMPFILE"
-
-    if [[ $? -ne 0 ]]; then
-        echo "Error: Failed to create SQL for DTM import"
-        rm -f "$TMPFILE"
-        exit 1
-    fi
+    if [ "$JOBS" -gt 1 ]; then
+        # Parallel COPY streams, constraints and index are created once at the end
+        RASTER_SOURCE="$RASTER_FILE"
+        [ "$LOAD_TILES" = true ] && RASTER_SOURCE="$TILES_PATH"
+        LOADER_OPTIONS=""
+        [ "$OUT_DB" = true ] && LOADER_OPTIONS="$LOADER_OPTIONS --out-db"
+        [ "$RESUME" = true ] && LOADER_OPTIONS="$LOADER_OPTIONS --resume"
+        python3 "$(resolve_path scripts/load_dtm.py)" "$RASTER_SOURCE" -s $TARGET_SRID -t $TILE_SIZE \
+            -w $JOBS $LOADER_OPTIONS
+        if [[ $? -ne 0 ]]; then
+            echo "Error: Failed to load DTM into database"
+            exit 1
+        fi
+    else
+        # Stream the import SQL into psql instead of writing it to a file first
+        raster2pgsql -s $TARGET_SRID $RASTER_OPTIONS -C -I -M -F -t $TILE_SIZE "$RASTER_FILE" public.dtm \
+            | PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -U $DB_USER -d "$DB_NAME" -v ON_ERROR_STOP=1 2>&1 | tee import.log
+        IMPORT_STATUS=("${PIPESTATUS[@]}")
 
-    # Import the raster
-    PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -U $DB_USER -d "$DB_NAME" -f "$TMPFILE" 2>&1 | tee import.log
-    
-    if [[ ${PIPESTATUS[0]} -ne 0 ]]; then
-        echo "Error: Failed to load DTM into database"
-        rm -f "$TMPFILE"
-        exit 1
+        if [[ ${IMPORT_STATUS[0]} -ne 0 ]]; then
+            echo "Error: Failed to create SQL for DTM import"
+            exit 1
+        fi
+        if [[ ${IMPORT_STATUS[1]} -ne 0 ]]; then
+            echo "Error: Failed to load DTM into database"
+            exit 1
+        fi
     fi
 
     # Check if the table was actually created and has data
     table_check=$(PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -U $DB_USER -d "$DB_NAME" -tAc "SELECT COUNT(*) FROM public.dtm")
     if [[ $? -ne 0 ]] || [[ $table_check -eq 0 ]]; then
         echo "Error: DTM table is empty or was not created"
-        rm -f "$TMPFILE"
         exit 1
     fi
 
-    rm -f "$TMPFILE"
     echo "DTM loaded successfully into table 'public.dtm'"
+
+    # Extent and data footprint for the area selector and the dashboard
+    echo "Computing DTM coverage..."
+    PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -U $DB_USER -d "$DB_NAME" -v ON_ERROR_STOP=1 \
+        -v srid=$TARGET_SRID -v map_srid=$MAP_SRID -v cell=$COVERAGE_CELL \
+        -f "$(resolve_path database/queries/00_create_dtm_coverage.sql)"
+    if [[ $? -ne 0 ]]; then
+        echo "Error: Failed to compute DTM coverage"
+        exit 1
+    fi
 fi
 
 if [ "$LOAD_ROADS" = true ]; then
@@ -336,7 +416,9 @@ if [ "$LOAD_ROADS" = true ]; then
             PG:"dbname=$DB_NAME host=$DB_HOST user=$DB_USER password=$DB_PASSWORD" \
             "$ROADS_FILE" \
             -nln public.roads \
-            -nlt PROMOTE_TO_MULTI \
+            -where "$ROADS_WHERE" \
+            -explodecollections \
+            -nlt LINESTRING \
             -lco GEOMETRY_NAME=geom
 
     if [[ $? -ne 0 ]]; then
@@ -344,9 +426,29 @@ if [ "$LOAD_ROADS" = true ]; then
         exit 1
     fi
 
+    # Classify bridges, tunnels and layers once, instead of in every region run
+    PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -U $DB_USER -d "$DB_NAME" -v ON_ERROR_STOP=1 \
+        -f "$(resolve_path database/queries/00_prepare_roads.sql)"
+    if [[ $? -ne 0 ]]; then
+        echo -e "Error classifying roads"
+        exit 1
+    fi
+
     echo -e "Roads loaded successfully into table 'public.roads'"
 fi
 
+# Record the load time of the tables, so execute_queries.py reruns the stages that depend on them
+LOADED_TABLES=""
+[ "$LOAD_DTM" = true ] && LOADED_TABLES="'dtm'"
+[ "$LOAD_ROADS" = true ] && LOADED_TABLES="${LOADED_TABLES:+$LOADED_TABLES, }'roads'"
+if [ ! -z "$LOADED_TABLES" ]; then
+    PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -U $DB_USER -d "$DB_NAME" -v ON_ERROR_STOP=1 \
+        -f "$(resolve_path database/queries/00_create_table_versions.sql)" \
+        -c "INSERT INTO public.pipeline_table_versions (table_name, built_at)
+            SELECT table_name, now() FROM unnest(ARRAY[$LOADED_TABLES]) AS table_name
+            ON CONFLICT (table_name) DO UPDATE SET built_at = EXCLUDED.built_at, params_hash = NULL;"
+fi
+
 if [ "$LOAD_DTM" = true ] || [ "$LOAD_ROADS" = true ]; then
     echo "You can now proceed with the slope analysis."
 fi
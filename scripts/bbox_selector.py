@@ -10,6 +10,7 @@ from psycopg2.extras import RealDictCursor
 import pyproj
 from shapely.geometry import box
 import json
+import sqlite3
 import sys
 from os.path import dirname, abspath
 import traceback
@@ -19,9 +20,8 @@ project_root = dirname(dirname(abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from config import CONFIG
-
-# Maximum allowed area in square kilometers
-MAX_AREA_KM2 = 50.0  # Adjust this value based on your needs
+from scripts.cost_estimator import estimate_cost, admission
+from scripts.job_queue import connect_queue, submit_job, list_jobs, eta_seconds
 
 def get_db_connection():
     """Create and return a database connection with error handling."""
@@ -36,15 +36,15 @@ def get_db_connection():
         return None
 
 def get_dtm_extent(database=CONFIG["database"]):
-    """Get the extent of the DTM from the database in UTM Zone 32N coordinates."""
+    """Get the extent of the DTM in UTM Zone 32N coordinates, as stored by load_data.sh in dtm_coverage."""
     conn = get_db_connection()
     if not conn:
         return None
     
     try:
         query = """
-        SELECT ST_Extent(ST_Envelope(rast)) as extent
-        FROM dtm;
+        SELECT ST_XMin(extent) as minx, ST_YMin(extent) as miny, ST_XMax(extent) as maxx, ST_YMax(extent) as maxy
+        FROM dtm_coverage;
         """
         
         with conn:
@@ -52,22 +52,13 @@ def get_dtm_extent(database=CONFIG["database"]):
                 cur.execute(query)
                 result = cur.fetchone()
                 
-        if not result or not result['extent']:
+        if not result or result['minx'] is None:
             st.warning("No DTM data found in the database.")
             return None
-                
-        # Parse the extent string 'BOX(minx maxy, maxx maxy)'
-        extent_str = result['extent']
-        extent_str = extent_str.replace('BOX(', '').replace(')', '')
-        try:
-            (minx, miny), (maxx, maxy) = [
-                map(float, point.split()) 
-                for point in extent_str.split(',')
-            ]
-            return box(minx, miny, maxx, maxy)
-        except (ValueError, IndexError) as e:
-            st.error(f"Failed to parse DTM extent: {str(e)}")
-            return None
+        return box(result['minx'], result['miny'], result['maxx'], result['maxy'])
+    except psycopg2.errors.UndefinedTable:
+        st.error("DTM coverage not found, please reload the DTM with load_data.sh.")
+        return None
     except psycopg2.Error as e:
         st.error(f"Database error while fetching DTM extent: {str(e)}")
         return None
@@ -75,19 +66,14 @@ def get_dtm_extent(database=CONFIG["database"]):
         conn.close()
 
 def get_dtm_coverage():
-    """Get DTM coverage from database and transform to WGS84 for map display."""
+    """Get the DTM data footprint in WGS84 for map display, as stored by load_data.sh in dtm_coverage."""
     conn = get_db_connection()
     if not conn:
         return None
     
     try:
-        query = f"""
-        WITH valid_areas AS (
-            SELECT ST_Transform(ST_Union(ST_Envelope(rast)), {CONFIG['map_crs'].split(':')[1]}) as geom
-            FROM dtm
-            WHERE NOT ST_BandIsNoData(rast)
-        )
-        SELECT ST_AsGeoJSON(geom) as geojson FROM valid_areas;
+        query = """
+        SELECT coverage_geojson as geojson FROM dtm_coverage;
         """
         
         with conn:
@@ -99,6 +85,9 @@ def get_dtm_coverage():
             return json.loads(result['geojson'])
         st.warning("No valid DTM coverage found.")
         return None
+    except psycopg2.errors.UndefinedTable:
+        st.error("DTM coverage not found, please reload the DTM with load_data.sh.")
+        return None
     except psycopg2.Error as e:
         st.error(f"Database error while fetching DTM coverage: {str(e)}")
         return None
@@ -128,12 +117,88 @@ def calculate_area_km2(minx, miny, maxx, maxy):
         st.error(f"Error calculating area: {str(e)}")
         return None
 
+def get_cost_estimate(minx, miny, maxx, maxy):
+    """Estimate the cost of processing the bounding box from the roads and DTM indexes and recorded runs."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    
+    try:
+        return estimate_cost(conn, minx, miny, maxx, maxy, int(CONFIG['dtm_crs'].split(':')[1]))
+    except psycopg2.Error as e:
+        st.error(f"Database error while estimating the processing cost: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+def format_duration(seconds):
+    """Format a duration in seconds as seconds, minutes or hours."""
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+def submit_region(params, tiles, estimated_seconds):
+    """Submit a region to the job queue processed by scripts/job_worker.py."""
+    try:
+        queue = connect_queue()
+        try:
+            job_id = submit_job(queue, params, tiles, estimated_seconds)
+        finally:
+            queue.close()
+    except ValueError as e:
+        st.error(str(e))
+        return
+    except sqlite3.Error as e:
+        st.error(f"Failed to submit the area to the job queue: {str(e)}")
+        return
+    st.success(f"Area queued as job {job_id}, see its progress under Processing Queue")
+
+@st.fragment(run_every=5)
+def show_jobs():
+    """Show the progress of the running jobs, the queued jobs and the latest finished ones."""
+    st.write("### Processing Queue")
+    try:
+        queue = connect_queue()
+        try:
+            jobs = list_jobs(queue)
+        finally:
+            queue.close()
+    except sqlite3.Error as e:
+        st.error(f"Failed to read the job queue: {str(e)}")
+        return
+    
+    if not jobs:
+        st.write("No areas submitted yet.")
+        return
+    
+    position = 0
+    for job in jobs:
+        if job['status'] == 'running':
+            eta = eta_seconds(job)
+            st.progress(
+                job['stages_done'] / job['stage_count'],
+                text=f"🔄 {job['name_area']}: {job['stage'] or 'starting'} "
+                     f"({job['stages_done']}/{job['stage_count']} stages), "
+                     f"ETA {format_duration(eta) if eta is not None else 'unknown'}"
+            )
+        elif job['status'] == 'queued':
+            position += 1
+            st.write(f"⏳ {job['name_area']}: queued, position {position}")
+        elif job['status'] == 'done':
+            st.write(f"✅ {job['name_area']}: done in {format_duration(job['finished_at'] - job['started_at'])}")
+            st.caption(f"REGION={job['name_area']} streamlit run web-app/streamlit_app.py")
+        else:
+            st.write(f"❌ {job['name_area']}: failed")
+            st.caption(job['error'])
+
 def main():
     st.set_page_config(page_title="Area Selector", layout="wide")
     
     st.title("Area Selector")
     st.write("Draw a rectangle to select your area of interest.")
-    st.write(f"⚠️ Maximum allowed area: {MAX_AREA_KM2:.1f} km²")
+    st.write(f"⚠️ Areas estimated to take longer than {format_duration(CONFIG['estimate_max_seconds'])} are split into tiles")
     st.write(f"ℹ️ The purple shaded area shows where DTM data is available")
     
     # Get DTM extent in UTM coordinates
@@ -229,6 +294,9 @@ def main():
         # Get the drawn features using st_folium
         output = st_folium(m, width=800)
     
+    with col3:
+        show_jobs()
+    
     with col2:
         # Area name input with validation
         area_name = st.text_input(
@@ -290,24 +358,64 @@ def main():
                 
             st.write(f"### Selected Area: {area_km2:.2f} km²")
             
-            if area_km2 > MAX_AREA_KM2:
-                st.error(f"⚠️ Selected area ({area_km2:.2f} km²) exceeds the maximum allowed size of {MAX_AREA_KM2:.1f} km²")
-                st.write("Please draw a smaller rectangle")
+            # Admission by the estimated cost, not by the area: dense and sparse areas of the same size differ a lot
+            estimate = get_cost_estimate(sw_x, sw_y, ne_x, ne_y)
+            if estimate is None:
+                st.error("Failed to estimate the processing cost. Please try again.")
+                return
+            
+            st.write("### Estimated Cost")
+            st.write(f"Roads: {estimate['roads']:,} ({estimate['road_length_m'] / 1000:,.1f} km)")
+            st.write(f"Sampled points: {estimate['points']:,}")
+            st.write(f"DTM tiles: {estimate['dtm_tiles']:,}")
+            st.write(f"Runtime: {format_duration(estimate['seconds'])}")
+            st.write(f"Table size: {estimate['table_bytes'] / 1e6:,.0f} MB")
+            if estimate['runs']:
+                st.caption(f"Rates from the last {estimate['runs']} recorded runs ({CONFIG['densify']} densification)")
             else:
-                # Format the parameters dictionary to match config.py structure
-                params = {
-                    area_name: {
-                        "minx": sw_x,
-                        "miny": sw_y,
-                        "maxx": ne_x,
-                        "maxy": ne_y,
-                        "crs": int(CONFIG['dtm_crs'].split(':')[1])
-                    }
+                st.caption("No runs recorded yet, the runtime and table size use default rates")
+            
+            if estimate['dtm_tiles'] == 0:
+                st.error("⚠️ No DTM data in the selected area")
+                st.write("Please draw a rectangle within the purple boundary")
+                return
+            
+            decision, (nx, ny) = admission(estimate, ne_x - sw_x, ne_y - sw_y)
+            if decision == 'warn':
+                st.warning(f"⚠️ Processing is estimated to take {format_duration(estimate['seconds'])}")
+            elif decision == 'tile':
+                st.warning(
+                    f"⚠️ Processing is estimated to take {format_duration(estimate['seconds'])}, "
+                    f"the area is processed in {nx}x{ny} tiles of at most "
+                    f"{format_duration(CONFIG['estimate_max_seconds'])} each"
+                )
+            
+            # Format the parameters dictionary to match config.py structure
+            params = {
+                area_name: {
+                    "minx": sw_x,
+                    "miny": sw_y,
+                    "maxx": ne_x,
+                    "maxy": ne_y,
+                    "crs": int(CONFIG['dtm_crs'].split(':')[1])
                 }
-                
-                st.write("### Region Parameters")
-                st.write("Add this to the REGION_PARAMS dictionary in config.py:")
-                st.code(f"REGION_PARAMS.update({json.dumps(params, indent=4)})", language='python')
+            }
+            
+            st.write("### Region Parameters")
+            st.write("Add this to the REGION_PARAMS dictionary in config.py:")
+            st.code(f"REGION_PARAMS.update({json.dumps(params, indent=4)})", language='python')
+            if decision == 'tile':
+                st.write(f"Set \"region\" in config.py to \"{area_name}\" and process it in tiles:")
+                st.code(f"python3 scripts/execute_queries.py --tiles {nx}x{ny}", language='bash')
+            
+            st.write("### Processing")
+            st.write("Or queue the area for the job worker (`scripts/job_worker.py`):")
+            if st.button("Process this area"):
+                submit_region(
+                    {**params[area_name], "name_area": area_name},
+                    f"{nx}x{ny}" if decision == 'tile' else None,
+                    estimate['seconds']
+                )
         else:
             st.write("⚠️ Please draw a rectangle on the map.")
 
@@ -0,0 +1,126 @@
+"""Cost estimate of a region before it is processed.
+
+The road count and length and the DTM tiles touched by a bounding box are
+looked up through the spatial indexes of roads and dtm, without reading the
+DTM pixels. The sampled point count follows from the road lengths and the
+densification distances of 01_extract_points_window.sql. The runtime and the
+size of the region tables are scaled from the points with the median rates of
+the last runs recorded in pipeline_run_stats (same densification mode), which
+also correct the point estimate. Before any run is recorded, default rates are
+used.
+"""
+import math
+
+from config import CONFIG
+
+# Recorded runs the rates are taken from, the most recent first
+RECENT_RUNS = 20
+
+# Rates used before any run is recorded
+DEFAULT_SECONDS_PER_POINT = 1e-4
+DEFAULT_BYTES_PER_POINT = 400.0
+
+# Road count and length and sampled points of the roads the pipeline reads for the box (01 step 2,
+# whole roads), with the densification distances of 01 step 5, and the DTM tiles under the box
+ESTIMATE_QUERY = """
+WITH envelope AS (
+    SELECT ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, %(crs)s) AS geom
+),
+road_lengths AS (
+    SELECT ST_Length(r.geom) AS length_m
+    FROM roads r, envelope e
+    WHERE r.geom && e.geom
+)
+SELECT
+    COUNT(*) AS roads,
+    COALESCE(SUM(length_m), 0) AS road_length_m,
+    COALESCE(SUM(CEIL(length_m / CASE
+        WHEN %(densify)s = 'adaptive' THEN %(densify_coarse)s
+        WHEN length_m < 50 THEN 5
+        WHEN length_m < 100 THEN 10
+        ELSE 25
+    END) + 1), 0)::bigint AS estimated_points,
+    (SELECT COUNT(*) FROM dtm d, envelope e WHERE ST_ConvexHull(d.rast) && e.geom) AS dtm_tiles
+FROM road_lengths
+"""
+
+RATES_QUERY = """
+SELECT
+    COUNT(*),
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY points::double precision / estimated_points),
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY seconds / points),
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY table_bytes::double precision / points)
+FROM (
+    SELECT * FROM pipeline_run_stats
+    WHERE densify = %s AND points > 0 AND estimated_points > 0
+    ORDER BY finished_at DESC
+    LIMIT %s
+) recent
+"""
+
+
+def estimate_inputs(cur, minx, miny, maxx, maxy, crs):
+    """Roads, road length, DTM tiles and estimated points of a bounding box, from index lookups."""
+    cur.execute(ESTIMATE_QUERY, {
+        'minx': minx, 'miny': miny, 'maxx': maxx, 'maxy': maxy, 'crs': crs,
+        'densify': CONFIG['densify'], 'densify_coarse': CONFIG['densify_coarse'],
+    })
+    roads, road_length_m, estimated_points, dtm_tiles = cur.fetchone()
+    return {
+        'area_km2': (maxx - minx) * (maxy - miny) / 1e6,
+        'roads': roads,
+        'road_length_m': float(road_length_m),
+        'dtm_tiles': dtm_tiles,
+        'estimated_points': estimated_points,
+    }
+
+
+def load_rates(cur, densify):
+    """Median point correction, seconds and table bytes per point of the recent runs, or the defaults."""
+    cur.execute("SELECT to_regclass('public.pipeline_run_stats') IS NOT NULL")
+    runs = 0
+    if cur.fetchone()[0]:
+        cur.execute(RATES_QUERY, (densify, RECENT_RUNS))
+        runs, point_factor, seconds_per_point, bytes_per_point = cur.fetchone()
+    if not runs:
+        return {'runs': 0, 'point_factor': 1.0, 'seconds_per_point': DEFAULT_SECONDS_PER_POINT,
+                'bytes_per_point': DEFAULT_BYTES_PER_POINT}
+    return {'runs': runs, 'point_factor': point_factor, 'seconds_per_point': seconds_per_point,
+            'bytes_per_point': bytes_per_point}
+
+
+def estimate_cost(conn, minx, miny, maxx, maxy, crs):
+    """Estimated points, runtime in seconds and table size in bytes of processing a bounding box."""
+    with conn.cursor() as cur:
+        estimate = estimate_inputs(cur, minx, miny, maxx, maxy, crs)
+        rates = load_rates(cur, CONFIG['densify'])
+    conn.commit()
+    points = estimate['estimated_points'] * rates['point_factor']
+    return {
+        **estimate,
+        'points': round(points),
+        'seconds': points * rates['seconds_per_point'],
+        'table_bytes': points * rates['bytes_per_point'],
+        'runs': rates['runs'],
+    }
+
+
+def tile_grid(estimate, width, height, max_seconds):
+    """Smallest grid of about square tiles whose estimated runtime is each at most max_seconds."""
+    tiles = max(1, math.ceil(estimate['seconds'] / max_seconds))
+    nx = max(1, round(math.sqrt(tiles * width / height)))
+    ny = math.ceil(tiles / nx)
+    return nx, ny
+
+
+def admission(estimate, width, height):
+    """Decide how to run a region: 'accept', 'warn' or 'tile', with the tile grid (1x1 unless tiled).
+
+    Regions estimated above CONFIG['estimate_warn_seconds'] are accepted with a warning, regions above
+    CONFIG['estimate_max_seconds'] are split into tiles of at most that runtime each.
+    """
+    if estimate['seconds'] > CONFIG['estimate_max_seconds']:
+        return 'tile', tile_grid(estimate, width, height, CONFIG['estimate_max_seconds'])
+    if estimate['seconds'] > CONFIG['estimate_warn_seconds']:
+        return 'warn', (1, 1)
+    return 'accept', (1, 1)
@@ -1,84 +1,635 @@
 import psycopg2
 from pathlib import Path
+import hashlib
+import json
+import re
 import time
 from datetime import datetime
 import sys
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
 from os.path import dirname, abspath
 
 # Add the project root directory to Python path
 project_root = dirname(dirname(abspath(__file__)))
 sys.path.insert(0, project_root)
 
-from config import CONFIG, get_region_params
+from config import CONFIG, REGION_PARAMS, get_region_params
+import cost_estimator
+import profiling
 
 
 SQL_DIR = Path(__file__).parent.parent / 'database' / 'queries'
 
-def run_query(sqlfilename, params):
-    start_time = time.time()
-    print(f"\nStarting {sqlfilename} at {datetime.now().strftime('%H:%M:%S')} for database/region: {CONFIG['database']}/{CONFIG['region']}")
-    sql = (SQL_DIR / f"{sqlfilename}.sql").read_text()
-    
+# CONFIG keys of the road densification, passed to the points stage
+DENSIFY_KEYS = ['densify', 'densify_coarse', 'densify_fine', 'densify_max_rise', 'densify_max_turn']
+
+# Pipeline stages in execution order, with the tables each stage reads and writes.
+# Table names are filled in like the SQL files; dtm and roads are loaded by load_data.sh.
+# dtm_window_<area> is an intermediate of the points stage and is not tracked.
+STAGES = [
+    {
+        'name': 'points',
+        'sql': '01_extract_points_window',
+        'inputs': ['dtm', 'roads'],
+        'outputs': ['filtered_roads_%(name_area)s', 'road_points_window_%(name_area)s'],
+        'params': {
+            'resample': CONFIG['dtm_resample'],
+            'storage': CONFIG['storage'],
+            **{key: CONFIG[key] for key in DENSIFY_KEYS},
+        },
+    },
+    {
+        'name': 'segments',
+        'sql': '02_create_segment_slopes_table',
+        'inputs': ['road_points_window_%(name_area)s'],
+        'outputs': ['road_segments_slope_%(name_area)s'],
+        'params': {'max_gap': CONFIG['segment_max_gap'], 'storage': CONFIG['storage'], 'densify': CONFIG['densify']},
+    },
+    {
+        'name': 'bins',
+        'sql': '03_create_slope_bins_table',
+        'inputs': ['road_segments_slope_%(name_area)s'],
+        'outputs': ['road_slope_bins_%(name_area)s'],
+    },
+    {
+        'name': 'lod',
+        'sql': '04_create_segment_lod_table',
+        'inputs': ['road_segments_slope_%(name_area)s'],
+        'outputs': ['road_segments_lod_%(name_area)s'],
+        'params': {'lod_tolerances': CONFIG['lod_tolerances']},
+    },
+    {
+        'name': 'summary',
+        'sql': '05_create_road_summary_table',
+        'inputs': ['filtered_roads_%(name_area)s', 'road_segments_slope_%(name_area)s'],
+        'outputs': ['road_summary_%(name_area)s'],
+    },
+]
+STAGE_NAMES = [stage['name'] for stage in STAGES]
+
+# Report of the current run with --profile (None = statements are not profiled)
+profile_report = None
+
+def area_table_name(name_area):
+    """Clean a region name for use in table names."""
+    return name_area.replace('-', '_').replace(' ', '_')
+
+def render_sql(sqlfilename, params):
+    """Read a SQL file and return it with the table names filled in, plus its query parameters.
+
+    With compact storage, the file of the same name in SQL_DIR/compact is read instead when there is one.
+    """
     # Create a copy of params for modification
     sql_params = params.copy()
+    # Optional restriction of the run to a list of road fids (NULL = all roads)
+    sql_params.setdefault('fids', None)
+    sql_params.setdefault('resample', CONFIG['dtm_resample'])
+    sql_params.setdefault('max_gap', CONFIG['segment_max_gap'])
+    sql_params.setdefault('storage', CONFIG['storage'])
+    for key in DENSIFY_KEYS:
+        sql_params.setdefault(key, CONFIG[key])
     
-    # Handle name_area parameter by cleaning it and doing direct string replacement
-    if 'name_area' in sql_params:
+    sqlfile = SQL_DIR / f"{sqlfilename}.sql"
+    if sql_params['storage'] == 'compact' and (SQL_DIR / 'compact' / f"{sqlfilename}.sql").exists():
+        sqlfile = SQL_DIR / 'compact' / f"{sqlfilename}.sql"
+    sql = sqlfile.read_text()
+    # Shared SQL files, included by a line '-- @include <sql file name>' (from SQL_DIR, whatever the storage)
+    sql = re.sub(r'^-- @include (\S+)$', lambda m: (SQL_DIR / f"{m.group(1)}.sql").read_text(), sql, flags=re.M)
+    
+    # Handle name_area (and other *_area table name parameters) by cleaning it and doing direct string replacement
+    for key in [key for key in sql_params if key.endswith('_area')]:
         # Replace hyphens and spaces with underscores for table names
-        area_name = sql_params['name_area'].replace('-', '_').replace(' ', '_')
+        area_name = area_table_name(sql_params[key])
         # Do direct string replacement for table names
-        sql = sql.replace('%(name_area)s', area_name)
-        # Remove name_area from params since we handled it directly
-        del sql_params['name_area']
+        sql = sql.replace(f'%({key})s', area_name)
+        # Remove the parameter since we handled it directly
+        del sql_params[key]
+    return sql, sql_params
+
+def connect():
+    """Open a database connection with the pipeline session settings."""
+    conn = psycopg2.connect(
+        dbname=CONFIG['database'],
+        **CONFIG['db_connection']
+    )
+    with conn.cursor() as cur:
+        cur.execute("SET search_path TO public;")
+        for name, value in CONFIG['session_settings'].items():
+            cur.execute("SELECT set_config(%s, %s, false)", (name, str(value)))
+    conn.commit()
+    return conn
+
+def prepare_database(params, conn):
+    """Create the table versions, run statistics and storage code tables and the helper functions used by the stages."""
+    run_query('00_create_table_versions', params, conn)
+    run_query('00_create_run_stats', params, conn)
+    run_query('00_create_storage_codes', params, conn)
+    run_query('00_create_functions', params, conn)
+
+def run_query(sqlfilename, params, conn=None):
+    """Run a SQL file and commit, on the given connection or on a new one."""
+    start_time = time.time()
+    print(f"\nStarting {sqlfilename} at {datetime.now().strftime('%H:%M:%S')} for database/region: {CONFIG['database']}/{params.get('name_area', CONFIG['region'])}")
+    sql, sql_params = render_sql(sqlfilename, params)
     
     # Debug prints
     #print("\nDEBUG INFO:")
-    print(f"SQL parameters: {sql_params}")
-    print(f"Area name: {area_name}")
+    printed_params = sql_params.copy()
+    if printed_params['fids'] is not None:
+        printed_params['fids'] = f"<{len(printed_params['fids'])} roads>"
+    print(f"SQL parameters: {printed_params}")
+    print(f"Area name: {area_table_name(params['name_area'])}")
     #print(f"SQL preview after name_area replacement: {sql[:500]}...")
     
-    with psycopg2.connect(
-        dbname=CONFIG['database'],
-        **CONFIG['db_connection']
-    ) as conn:
+    own_conn = conn is None
+    if own_conn:
+        conn = connect()
+    try:
         with conn.cursor() as cur:
-            try:
-                # Create public schema if it doesn't exist and set search_path
-                cur.execute("""
-                    CREATE SCHEMA IF NOT EXISTS public;
-                    SET search_path TO public;
-                    SHOW search_path;
-                """)
-                search_path = cur.fetchone()
-                #print(f"Current search_path: {search_path}")
-                conn.commit()
-                
+            if profile_report is not None:
+                statements = profiling.execute_profiled(cur, sql, sql_params)
+            else:
                 # Execute the main query with remaining parameters
                 cur.execute(sql, sql_params)
-                conn.commit()
-            except Exception as e:
-                print(f"Error executing query: {e}")
-                print(f"SQL parameters: {sql_params}")
-                print(f"SQL preview: {sql[:500]}...")  # Print first 500 chars of SQL
-                conn.rollback()
-                raise
+        conn.commit()
+    except Exception as e:
+        print(f"Error executing query: {e}")
+        print(f"SQL parameters: {sql_params}")
+        print(f"SQL preview: {sql[:500]}...")  # Print first 500 chars of SQL
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
     
     duration = time.time() - start_time
     print(f"{sqlfilename} complete in {duration:.2f} seconds")
+    if profile_report is not None:
+        profile_report['queries'].append({
+            'sql': sqlfilename,
+            'name_area': area_table_name(params['name_area']),
+            'seconds': round(duration, 3),
+            'statements': statements,
+        })
+        for statement in sorted(statements, key=lambda s: s['seconds'], reverse=True)[:3]:
+            print(f"  {statement['seconds']:8.2f}s  line {statement['line']}: {statement['statement']}")
+
+def make_tiles(params, nx, ny, margin):
+    """Split the region envelope into an nx x ny grid of tile parameters.
+
+    Each tile window is expanded by margin (meters) and clipped to the region, so
+    that segments starting in a tile's core can be built from points inside its window.
+    """
+    width = (params['maxx'] - params['minx']) / nx
+    height = (params['maxy'] - params['miny']) / ny
+    area_name = area_table_name(params['name_area'])
+    tiles = []
+    for j in range(ny):
+        for i in range(nx):
+            tiles.append({
+                **params,
+                'minx': max(params['minx'], params['minx'] + i * width - margin),
+                'miny': max(params['miny'], params['miny'] + j * height - margin),
+                'maxx': min(params['maxx'], params['minx'] + (i + 1) * width + margin),
+                'maxy': min(params['maxy'], params['miny'] + (j + 1) * height + margin),
+                'name_area': f"{area_name}_tile_{i}_{j}",
+                'tile_i': i,
+                'tile_j': j,
+            })
+    return tiles
+
+def run_tile(tile):
+    """Run the region pipeline for a single tile on its own connection."""
+    tile_params = {k: v for k, v in tile.items() if k not in ('tile_i', 'tile_j')}
+    run_query('01_extract_points_window', tile_params)
+    run_query('02_create_segment_slopes_table', tile_params)
+
+def merge_tiles(params, tiles, nx, ny):
+    """Merge the per-tile tables into the region tables and drop the tile tables.
+
+    Points and segments are kept only from the tile whose core contains them
+    (the segment start point for segments), roads crossing tile borders are
+    deduplicated by fid, and segment_id is renumbered per road.
+    """
+    area_name = area_table_name(params['name_area'])
+    width = (params['maxx'] - params['minx']) / nx
+    height = (params['maxy'] - params['miny']) / ny
+    # Compact storage keeps the points unlogged, like 01_extract_points_window.sql
+    points_table = 'UNLOGGED TABLE' if params.get('storage', CONFIG['storage']) == 'compact' else 'TABLE'
+
+    def owned_by(tile, geom):
+        # Core cell of a geometry, clamped so points on the region border belong to the last tile
+        return (
+            f"LEAST(GREATEST(FLOOR((ST_X({geom}) - {params['minx']}) / {width})::integer, 0), {nx - 1}) = {tile['tile_i']} "
+            f"AND LEAST(GREATEST(FLOOR((ST_Y({geom}) - {params['miny']}) / {height})::integer, 0), {ny - 1}) = {tile['tile_j']}"
+        )
+
+    start_time = time.time()
+    print(f"\nMerging {len(tiles)} tiles at {datetime.now().strftime('%H:%M:%S')} into region tables for {area_name}")
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            # Column list of the segments table, with segment_id renumbered over the whole road
+            cur.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position",
+                (f"road_segments_slope_{tiles[0]['name_area']}",)
+            )
+            segment_columns = [
+                'ROW_NUMBER() OVER(PARTITION BY fid ORDER BY seq_start) AS segment_id' if col == 'segment_id' else col
+                for col, in cur.fetchall()
+            ]
+
+            roads_union = "\nUNION ALL\n".join(
+                f"SELECT * FROM filtered_roads_{tile['name_area']}" for tile in tiles
+            )
+            points_union = "\nUNION ALL\n".join(
+                f"SELECT * FROM road_points_window_{tile['name_area']} WHERE {owned_by(tile, 'geom_utm')}"
+                for tile in tiles
+            )
+            segments_union = "\nUNION ALL\n".join(
+                f"SELECT * FROM road_segments_slope_{tile['name_area']} WHERE {owned_by(tile, 'ST_StartPoint(segment_geom)')}"
+                for tile in tiles
+            )
+
+            cur.execute(f"""
+                DROP TABLE IF EXISTS dtm_window_{area_name};
+                DROP TABLE IF EXISTS filtered_roads_{area_name};
+                DROP TABLE IF EXISTS road_points_window_{area_name};
+                DROP TABLE IF EXISTS road_segments_slope_{area_name};
+
+                CREATE TABLE filtered_roads_{area_name} AS
+                SELECT DISTINCT ON (fid) * FROM ({roads_union}) r
+                ORDER BY fid;
+                CREATE INDEX filtered_roads_{area_name}_geom_idx ON filtered_roads_{area_name} USING GIST(geom);
+
+                CREATE {points_table} road_points_window_{area_name} AS
+                {points_union};
+                CREATE INDEX road_points_window_{area_name}_geom_idx ON road_points_window_{area_name} USING GIST(geom_utm);
+                CREATE INDEX road_points_window_{area_name}_seq_idx ON road_points_window_{area_name} (fid, seq);
+
+                CREATE TABLE road_segments_slope_{area_name} AS
+                SELECT {', '.join(segment_columns)}
+                FROM ({segments_union}) s;
+            """)
+            # Same indexes as the segments stage
+            cur.execute(*render_sql('02_create_segment_slopes_indexes', params))
+            for tile in tiles:
+                cur.execute(f"""
+                    DROP TABLE IF EXISTS dtm_window_{tile['name_area']};
+                    DROP TABLE IF EXISTS filtered_roads_{tile['name_area']};
+                    DROP TABLE IF EXISTS road_points_window_{tile['name_area']};
+                    DROP TABLE IF EXISTS road_segments_slope_{tile['name_area']};
+                """)
+        conn.commit()
+    finally:
+        conn.close()
+
+    duration = time.time() - start_time
+    print(f"Merge complete in {duration:.2f} seconds")
+
+def run_tiled(params, nx, ny, workers, margin):
+    """Run the pipeline over an nx x ny grid of tiles in parallel and merge the results."""
+    tiles = make_tiles(params, nx, ny, margin)
+    print(f"Processing {len(tiles)} tiles with {workers} parallel connections")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() re-raises the first tile error
+        list(pool.map(run_tile, tiles))
+    merge_tiles(params, tiles, nx, ny)
+
+def parse_grid(grid):
+    """Tile counts of a grid like '4x3', or '4' for a square grid."""
+    nx, _, ny = grid.lower().partition('x')
+    return int(nx), int(ny) if ny else int(nx)
+
+def tiled_stages(nx, ny, workers, margin):
+    """The stages with the points stage replaced by a tiled run of the points and segments."""
+    tiled = []
+
+    def run_points(conn, stage_params):
+        run_tiled(stage_params, nx, ny, min(workers, nx * ny), margin)
+        tiled.append(True)
+
+    def run_segments(conn, stage_params):
+        # The tiles compute points and segments together, the segments stage then only records its version
+        if not tiled:
+            run_query(STAGES[1]['sql'], stage_params, conn)
+
+    return [{**STAGES[0], 'run': run_points}, {**STAGES[1], 'run': run_segments}] + STAGES[2:]
+
+def table_exists(cur, table_name):
+    """Check whether a table exists in the public schema."""
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"public.{table_name}",))
+    return cur.fetchone()[0]
+
+def stage_tables(tables, params):
+    """Fill in the region name in a list of stage table names."""
+    area_name = area_table_name(params['name_area'])
+    return [table.replace('%(name_area)s', area_name) for table in tables]
+
+def params_hash(params):
+    """Hash of the parameters a table is built with, a changed region or setting makes it stale."""
+    return hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+def stage_hash(stage, params):
+    """Parameters hash of the outputs of a stage, from the region and the stage's own parameters."""
+    return params_hash({**params, **stage.get('params', {})})
+
+def record_versions(conn, tables, built_with):
+    """Record the tables as built now with the given parameters hash."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO pipeline_table_versions (table_name, built_at, params_hash)
+            SELECT table_name, now(), %s FROM unnest(%s::text[]) AS table_name
+            ON CONFLICT (table_name) DO UPDATE
+            SET built_at = EXCLUDED.built_at, params_hash = EXCLUDED.params_hash
+        """, (built_with, tables))
+    conn.commit()
+
+def outputs_current(conn, inputs, outputs, built_with):
+    """Check that all outputs exist, were built with the same parameters and are not older than any input.
+
+    Inputs without a recorded version (e.g. loaded before versions were recorded) count as old.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT
+                COUNT(*) = cardinality(%(outputs)s::text[])
+                AND bool_and(v.params_hash IS NOT DISTINCT FROM %(built_with)s AND to_regclass('public.' || v.table_name) IS NOT NULL)
+                AND MIN(v.built_at) >= COALESCE(
+                    (SELECT MAX(built_at) FROM pipeline_table_versions WHERE table_name = ANY(%(inputs)s::text[])),
+                    '-infinity'
+                )
+            FROM pipeline_table_versions v
+            WHERE v.table_name = ANY(%(outputs)s::text[])
+        """, {'inputs': inputs, 'outputs': outputs, 'built_with': built_with})
+        return bool(cur.fetchone()[0])
+
+def run_stages(conn, params, stages, force=(), on_stage=None):
+    """Run the stages in order on one connection, skipping stages whose outputs are up to date.
+
+    Stages named in force always run. A stage may replace running its SQL file with a 'run' function.
+    on_stage is called with the stage name and the number of stages done before each stage.
+    Returns the names of the stages that ran.
+    """
+    ran = []
+    for index, stage in enumerate(stages):
+        if on_stage is not None:
+            on_stage(stage['name'], index)
+        stage_params = {**params, **stage.get('params', {})}
+        outputs = stage_tables(stage['outputs'], params)
+        built_with = stage_hash(stage, params)
+        if stage['name'] not in force and stage_current(conn, stage, params):
+            print(f"\nSkipping stage {stage['name']}: {', '.join(outputs)} up to date")
+            continue
+        if 'run' in stage:
+            stage['run'](conn, stage_params)
+        else:
+            run_query(stage['sql'], stage_params, conn)
+        record_versions(conn, outputs, built_with)
+        ran.append(stage['name'])
+    return ran
+
+def record_run_stats(conn, params, seconds):
+    """Record the estimated and actual cost of a full region run for scripts/cost_estimator.py."""
+    area_name = area_table_name(params['name_area'])
+    tables = stage_tables([table for stage in STAGES for table in stage['outputs']], params)
+    with conn.cursor() as cur:
+        estimate = cost_estimator.estimate_inputs(
+            cur, params['minx'], params['miny'], params['maxx'], params['maxy'], params['crs']
+        )
+        cur.execute(f"""
+            INSERT INTO pipeline_run_stats (
+                name_area, densify, area_km2, roads, road_length_m, dtm_tiles, estimated_points,
+                points, segments, table_bytes, seconds
+            )
+            SELECT
+                %(name_area)s, %(densify)s, %(area_km2)s, %(roads)s, %(road_length_m)s, %(dtm_tiles)s,
+                %(estimated_points)s,
+                (SELECT COUNT(*) FROM road_points_window_{area_name}),
+                (SELECT COUNT(*) FROM road_segments_slope_{area_name}),
+                (SELECT COALESCE(SUM(pg_total_relation_size(to_regclass('public.' || t))), 0)
+                 FROM unnest(%(tables)s::text[]) AS t),
+                %(seconds)s
+        """, {**estimate, 'name_area': area_name, 'densify': CONFIG['densify'], 'tables': tables, 'seconds': seconds})
+    conn.commit()
+
+def stage_current(conn, stage, params):
+    """Check whether the outputs of a stage are up to date for the region."""
+    return outputs_current(
+        conn,
+        stage_tables(stage['inputs'], params),
+        stage_tables(stage['outputs'], params),
+        stage_hash(stage, params)
+    )
+
+def envelope_area(envelope):
+    minx, miny, maxx, maxy = envelope
+    return (maxx - minx) * (maxy - miny)
+
+def make_clusters(regions):
+    """Group regions with overlapping bounding boxes that are cheaper to extract as one shared window.
+
+    Two groups are merged when their envelopes overlap and the combined envelope is smaller
+    than the two envelopes together.
+    """
+    def envelope(cluster):
+        return (
+            min(p['minx'] for p in cluster), min(p['miny'] for p in cluster),
+            max(p['maxx'] for p in cluster), max(p['maxy'] for p in cluster),
+        )
+
+    clusters = [[params] for params in regions]
+    merged = True
+    while merged:
+        merged = False
+        for a, b in combinations(range(len(clusters)), 2):
+            ea, eb = envelope(clusters[a]), envelope(clusters[b])
+            union = envelope(clusters[a] + clusters[b])
+            overlap = ea[0] < eb[2] and eb[0] < ea[2] and ea[1] < eb[3] and eb[1] < ea[3]
+            if (overlap and clusters[a][0]['crs'] == clusters[b][0]['crs']
+                    and envelope_area(union) < envelope_area(ea) + envelope_area(eb)):
+                clusters[a] = clusters[a] + clusters.pop(b)
+                merged = True
+                break
+    return [(cluster, envelope(cluster)) for cluster in clusters]
+
+def run_batch(regions, stages, force, workers):
+    """Run the stages for several regions concurrently on at most workers connections.
+
+    Overlapping regions whose points stage must run share one DTM clip and point
+    sampling over their combined envelope; their points are then copied from it.
+    """
+    shared = {}
+    jobs = []
+    if stages and stages[0]['name'] == 'points':
+        conn = connect()
+        try:
+            for cluster, envelope in make_clusters(regions):
+                stale = [p for p in cluster if 'points' in force or not stage_current(conn, stages[0], p)]
+                if len(stale) < 2:
+                    continue
+                names = sorted(area_table_name(p['name_area']) for p in stale)
+                shared_params = {
+                    'minx': envelope[0], 'miny': envelope[1], 'maxx': envelope[2], 'maxy': envelope[3],
+                    'crs': stale[0]['crs'],
+                    'name_area': 'shared_' + hashlib.md5(','.join(names).encode()).hexdigest()[:8],
+                    **stages[0].get('params', {}),
+                }
+                print(f"Regions {', '.join(names)} share the points window {shared_params['name_area']}")
+                jobs.append(shared_params)
+                for p in stale:
+                    shared[p['name_area']] = shared_params['name_area']
+        finally:
+            conn.close()
+
+    def run_region(params):
+        region_stages = stages
+        if params['name_area'] in shared:
+            region_stages = [{
+                **stages[0],
+                'run': lambda conn, stage_params: run_query(
+                    'batch/01_extract_region_points', {**stage_params, 'shared_area': shared[params['name_area']]}, conn
+                ),
+            }] + stages[1:]
+        conn = connect()
+        try:
+            start_time = time.time()
+            ran = run_stages(conn, params, region_stages, force)
+            # Regions sharing a points window did part of their work in the shared job
+            if 'points' in ran and params['name_area'] not in shared:
+                record_run_stats(conn, params, time.time() - start_time)
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() re-raises the first error
+        list(pool.map(lambda shared_params: run_query('01_extract_points_window', shared_params), jobs))
+        list(pool.map(run_region, regions))
+
+    if jobs:
+        conn = connect()
+        try:
+            with conn.cursor() as cur:
+                for shared_params in jobs:
+                    cur.execute(f"""
+                        DROP TABLE IF EXISTS dtm_window_{shared_params['name_area']};
+                        DROP TABLE IF EXISTS filtered_roads_{shared_params['name_area']};
+                        DROP TABLE IF EXISTS road_points_window_{shared_params['name_area']};
+                    """)
+            conn.commit()
+        finally:
+            conn.close()
+
+def run_incremental(params, run_full, conn):
+    """Recompute only the roads whose fingerprint or DTM tiles changed since the last run.
+
+    Falls back to run_full() when the region has no previous results.
+    """
+    area_name = area_table_name(params['name_area'])
+    run_query('incremental/01_detect_changes', params, conn)
+
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT fid FROM public.changed_roads_{area_name} ORDER BY fid")
+        changed_fids = [fid for fid, in cur.fetchall()]
+        has_results = all(
+            table_exists(cur, f"{table}_{area_name}")
+            for table in ('filtered_roads', 'road_points_window', 'road_segments_slope')
+        )
+    conn.commit()
+
+    if not has_results:
+        print("No previous results for this region, running the full pipeline")
+        run_full()
+    elif not changed_fids:
+        print("No road or DTM changes since the last run")
+    else:
+        print(f"Recomputing {len(changed_fids):,} changed roads")
+        delta_params = {**params, 'name_area': f"{area_name}_delta", 'fids': changed_fids}
+        run_query('01_extract_points_window', delta_params, conn)
+        run_query('02_create_segment_slopes_table', delta_params, conn)
+        run_query('incremental/02_apply_changes', params, conn)
+        # The updated tables make the later stages stale
+        for stage in STAGES[:2]:
+            record_versions(conn, stage_tables(stage['outputs'], params), stage_hash(stage, params))
+    run_query('incremental/03_commit_fingerprints', params, conn)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the slope analysis queries for the configured region.")
+    parser.add_argument('--regions',
+                        help="Comma-separated regions of REGION_PARAMS to process concurrently, or 'all' (default: CONFIG['region'])")
+    parser.add_argument('--tiles', help="Split the region into a grid of tiles processed in parallel, e.g. 4x4")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Number of tiles or regions processed at the same time (default: number of CPUs)")
+    parser.add_argument('--tile-margin', type=float, default=50.0,
+                        help="Overlap in meters between neighbouring tiles, at least the longest segment (default: 50, "
+                             "segments bridge gaps up to segment_max_gap)")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument('--incremental', action='store_true',
+                           help="Only recompute roads whose geometry/tags or DTM tiles changed since the last run")
+    selection.add_argument('--from-stage', choices=STAGE_NAMES,
+                           help="Rerun this stage and the stages after it, keeping the results of earlier stages")
+    selection.add_argument('--only-stage', choices=STAGE_NAMES, help="Rerun only this stage")
+    parser.add_argument('--force', action='store_true', help="Rerun all stages, even when their outputs are up to date")
+    parser.add_argument('--profile', action='store_true',
+                        help="Time every SQL statement, capture the plans of the heavy ones and write a JSON report to reports/")
+    args = parser.parse_args()
+    if args.regions and (args.tiles or args.incremental):
+        parser.error("--regions cannot be combined with --tiles or --incremental")
+
     total_start = time.time()
     
-    # Get parameters for the configured region
-    params = get_region_params(CONFIG['region'])
-    if params is None:
-        print(f"Error: No parameters found for region '{CONFIG['region']}'")
-        sys.exit(1)
-    
-    print(f"Using region parameters: {params}")
-    
-    run_query('01_extract_points_window', params)
-    run_query('02_create_segment_slopes_table', params)
+    # Get parameters for the configured region(s)
+    region_names = [CONFIG['region']]
+    if args.regions:
+        region_names = list(REGION_PARAMS) if args.regions == 'all' else args.regions.split(',')
+    regions = []
+    for region_name in region_names:
+        params = get_region_params(region_name)
+        if params is None:
+            print(f"Error: No parameters found for region '{region_name}'")
+            sys.exit(1)
+        print(f"Using region parameters: {params}")
+        regions.append(params)
+    params = regions[0]
+
+    stages = STAGES
+    if args.tiles:
+        nx, ny = parse_grid(args.tiles)
+        stages = tiled_stages(nx, ny, args.workers, args.tile_margin)
+
+    if args.only_stage:
+        stages = [stage for stage in stages if stage['name'] == args.only_stage]
+    elif args.from_stage:
+        stages = stages[STAGE_NAMES.index(args.from_stage):]
+    force = set(STAGE_NAMES) if args.force else {args.only_stage or args.from_stage}
+
+    if args.profile:
+        profile_report = profiling.new_report(params if len(regions) == 1 else {'name_area': 'batch', 'regions': regions},
+                                              CONFIG['session_settings'])
+        profile_report['args'] = vars(args)
+
+    conn = connect()
+    try:
+        prepare_database(params, conn)
+        if args.incremental:
+            run_incremental(params, lambda: run_stages(conn, params, stages[:2], force), conn)
+            stages = stages[2:]
+        if not args.regions:
+            start_time = time.time()
+            ran = run_stages(conn, params, stages, force)
+            # Only full runs from the points stage on are representative of the cost of a region
+            if 'points' in ran and not args.only_stage:
+                record_run_stats(conn, params, time.time() - start_time)
+    finally:
+        conn.close()
+    if args.regions:
+        run_batch(regions, stages, force, min(args.workers, len(regions)))
 
     total_time = time.time() - total_start
-    print(f"\nTotal processing completed in {total_time:.2f} seconds")
\ No newline at end of file
+    print(f"\nTotal processing completed in {total_time:.2f} seconds")
+    if profile_report is not None:
+        print(f"Profile report written to {profiling.write_report(profile_report, total_time)}")
@@ -0,0 +1,95 @@
+"""Export a processed region to a read-only dashboard snapshot.
+
+Writes the segments, the simplified levels of detail and the slope bins of a
+region as uncompressed Arrow IPC (Feather v2) files with WKB geometry, plus a
+metadata.json with the DTM extent. The dashboard can memory-map these files
+with SNAPSHOT_DIR set and runs without a database.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from os.path import dirname, abspath
+
+import geopandas as gpd
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+# Add the project root directory to Python path
+project_root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from config import CONFIG, get_region_params
+
+
+def write_arrow(df, path):
+    """Write a (Geo)DataFrame uncompressed in a single record batch, so columns can be memory-mapped as arrays."""
+    df.to_feather(path, compression='uncompressed', chunksize=max(len(df), 1))
+
+
+def export_snapshot(region, output_dir):
+    """Write <output_dir>/<region>/{segments,lod,bins}.arrow and metadata.json and return the directory."""
+    start_time = time.time()
+    params = get_region_params(region)
+    area_name = region.replace('-', '_').replace(' ', '_')
+    map_srid = CONFIG['map_crs'].split(':')[1]
+    snapshot_dir = os.path.join(output_dir, area_name)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    print(f"\nExporting snapshot of {area_name} at {datetime.now().strftime('%H:%M:%S')} to {snapshot_dir}")
+
+    db = CONFIG['db_connection']
+    engine = create_engine(f"postgresql://{db['user']}:{db['password']}@{db['host']}/{CONFIG['database']}")
+    with engine.connect() as conn:
+        # Sorted by slope, so slope ranges are contiguous row ranges in the dashboard
+        segments = gpd.read_postgis(text(f"""
+            SELECT fid, slope_pct, segment_length, ST_Transform(segment_geom, {map_srid}) AS geometry
+            FROM road_segments_slope_{area_name}
+            WHERE slope_pct IS NOT NULL
+            ORDER BY slope_pct
+        """), conn, geom_col='geometry')
+        lod = gpd.read_postgis(text(f"""
+            SELECT lod, slope_category, min_slope, max_slope, ST_Transform(geom, {map_srid}) AS geometry
+            FROM road_segments_lod_{area_name}
+            ORDER BY lod
+        """), conn, geom_col='geometry')
+        bins = pd.read_sql(text(f"SELECT * FROM road_slope_bins_{area_name} ORDER BY bin"), conn)
+        extent = conn.execute(text("""
+            SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)
+            FROM dtm_coverage
+        """)).fetchone()
+    engine.dispose()
+
+    write_arrow(segments, os.path.join(snapshot_dir, 'segments.arrow'))
+    write_arrow(lod, os.path.join(snapshot_dir, 'lod.arrow'))
+    write_arrow(bins, os.path.join(snapshot_dir, 'bins.arrow'))
+    metadata = {
+        'region': area_name,
+        'params': params,
+        'dtm_crs': CONFIG['dtm_crs'],
+        'map_crs': CONFIG['map_crs'],
+        'dtm_extent': list(extent),
+        'lod_tolerances': CONFIG['lod_tolerances'],
+        'segments': len(segments),
+        'exported_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(os.path.join(snapshot_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    duration = time.time() - start_time
+    print(f"Exported {len(segments):,} segments and {len(lod):,} simplified lines in {duration:.2f} seconds")
+    return snapshot_dir
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a processed region to a snapshot for the database-free dashboard.")
+    parser.add_argument('--region', default=CONFIG['region'], help="Region name in REGION_PARAMS")
+    parser.add_argument('-o', '--output', default='snapshots', help="Snapshot directory (default: snapshots)")
+    args = parser.parse_args()
+
+    if get_region_params(args.region) is None:
+        print(f"Error: No parameters found for region '{args.region}'")
+        sys.exit(1)
+
+    export_snapshot(args.region, args.output)
@@ -0,0 +1,156 @@
+"""Queue of region processing jobs in a local SQLite file.
+
+The area selector submits regions to the queue, scripts/job_worker.py claims
+and runs them. A job holds the region parameters, an optional tile grid and
+the runtime estimated at submission. While it runs, the worker records the
+current stage, so the selector can show the progress and an ETA. Claiming a
+job checks the number of running jobs in the same transaction, so all workers
+together run at most CONFIG['job_concurrency'] jobs. A running job holds a
+lease that its worker renews; the jobs of workers that stopped renewing are
+queued again when the lease expires.
+"""
+import json
+import os
+import sqlite3
+import time
+
+from config import CONFIG
+
+# Seconds a running job stays claimed without its worker renewing the lease
+LEASE_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name_area TEXT NOT NULL,
+    params TEXT NOT NULL,              -- region parameters as JSON
+    tiles TEXT,                        -- tile grid like '3x2', NULL = whole region
+    estimated_seconds REAL,
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done or failed
+    stage TEXT,
+    stages_done INTEGER NOT NULL DEFAULT 0,
+    stage_count INTEGER,
+    worker_pid INTEGER,
+    lease_expires_at REAL,
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, id);
+"""
+
+
+def connect_queue(path=None):
+    """Open the queue file, creating the jobs table if needed. Transactions are started explicitly."""
+    conn = sqlite3.connect(path or CONFIG['job_queue'], timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    # Readers (the selectors) do not block the workers
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    # Queue files created before running jobs held a lease
+    if 'lease_expires_at' not in [column['name'] for column in conn.execute("PRAGMA table_info(jobs)")]:
+        conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+    return conn
+
+
+def submit_job(conn, params, tiles=None, estimated_seconds=None):
+    """Queue a region and return the job id; a region can only be queued or running once."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        active = conn.execute(
+            "SELECT id FROM jobs WHERE name_area = ? AND status IN ('queued', 'running')", (params['name_area'],)
+        ).fetchone()
+        if active:
+            raise ValueError(f"Region '{params['name_area']}' is already queued as job {active['id']}")
+        job_id = conn.execute(
+            "INSERT INTO jobs (name_area, params, tiles, estimated_seconds, submitted_at) VALUES (?, ?, ?, ?, ?)",
+            (params['name_area'], json.dumps(params), tiles, estimated_seconds, time.time())
+        ).lastrowid
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return job_id
+
+
+def claim_job(conn, max_running, stage_count):
+    """Mark the oldest queued job as running in this process and return it, if fewer than max_running run."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+        job = None
+        if running < max_running:
+            job = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if job is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?, lease_expires_at = ?, "
+                "stage_count = ? WHERE id = ?",
+                (os.getpid(), time.time(), time.time() + LEASE_SECONDS, stage_count, job['id'])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return job
+
+
+def set_stage(conn, job_id, stage, stages_done):
+    conn.execute("UPDATE jobs SET stage = ?, stages_done = ? WHERE id = ?", (stage, stages_done, job_id))
+
+
+def finish_job(conn, job_id, error=None):
+    """Mark a job as done, or as failed with the error message."""
+    conn.execute(
+        "UPDATE jobs SET status = ?, error = ?, finished_at = ?, stage = NULL, "
+        "stages_done = CASE WHEN ? IS NULL THEN stage_count ELSE stages_done END WHERE id = ?",
+        ('failed' if error else 'done', error, time.time(), error, job_id)
+    )
+
+
+def renew_leases(conn, job_ids):
+    """Extend the leases of running jobs by LEASE_SECONDS from now."""
+    conn.executemany(
+        "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = 'running'",
+        [(time.time() + LEASE_SECONDS, job_id) for job_id in job_ids]
+    )
+
+
+def requeue_expired(conn):
+    """Queue the running jobs whose lease expired again and return their ids.
+
+    Worker process ids are not compared, a restarted container runs its worker under the same pid.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        expired = [job['id'] for job in conn.execute(
+            "SELECT id FROM jobs WHERE status = 'running' AND COALESCE(lease_expires_at, 0) < ?", (time.time(),)
+        )]
+        conn.executemany(
+            "UPDATE jobs SET status = 'queued', stage = NULL, stages_done = 0, worker_pid = NULL, "
+            "started_at = NULL, finished_at = NULL, lease_expires_at = NULL WHERE id = ?",
+            [(job_id,) for job_id in expired]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return expired
+
+
+def list_jobs(conn, limit=20):
+    """The running and queued jobs in queue order, then the latest finished ones."""
+    return conn.execute("""
+        SELECT * FROM jobs
+        ORDER BY status = 'running' DESC, status = 'queued' DESC,
+            CASE WHEN status = 'queued' THEN id END, COALESCE(finished_at, submitted_at) DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+
+def eta_seconds(job, now=None):
+    """Estimated seconds until a running job is done, from its estimated runtime (None if unknown or overdue)."""
+    if job['status'] != 'running' or job['estimated_seconds'] is None:
+        return None
+    remaining = job['estimated_seconds'] - ((now or time.time()) - job['started_at'])
+    return remaining if remaining > 0 else None
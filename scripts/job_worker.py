@@ -0,0 +1,112 @@
+"""Worker that processes the regions submitted to the job queue.
+
+Polls the queue (scripts/job_queue.py) and runs the pipeline stages of each
+claimed region in a thread, on its own database connection, like
+execute_queries.py does for one region. At most --concurrency jobs run at the
+same time over all workers. Regions with a tile grid are processed tiled, with
+--tile-workers connections each. The worker renews the leases of its running
+jobs on every look at the queue; jobs of a worker that was killed are queued
+again by any worker once their lease expired.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from os.path import dirname, abspath
+
+# Add the project root directory to Python path
+project_root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from config import CONFIG
+import execute_queries
+import job_queue
+
+# Seconds between two looks at the queue when no job can be started, well below job_queue.LEASE_SECONDS
+POLL_SECONDS = 5
+
+
+def run_job(job, tile_workers, tile_margin):
+    """Run all stages of a queued region and record its progress and result in the queue."""
+    queue = job_queue.connect_queue()
+    params = json.loads(job['params'])
+    stages = execute_queries.STAGES
+    if job['tiles']:
+        nx, ny = execute_queries.parse_grid(job['tiles'])
+        stages = execute_queries.tiled_stages(nx, ny, tile_workers, tile_margin)
+    print(f"\n[job {job['id']}] Processing {params['name_area']} at {datetime.now().strftime('%H:%M:%S')}")
+
+    try:
+        conn = execute_queries.connect()
+        try:
+            execute_queries.prepare_database(params, conn)
+            start_time = time.time()
+            ran = execute_queries.run_stages(
+                conn, params, stages,
+                on_stage=lambda stage, done: job_queue.set_stage(queue, job['id'], stage, done)
+            )
+            if 'points' in ran:
+                execute_queries.record_run_stats(conn, params, time.time() - start_time)
+        finally:
+            conn.close()
+        job_queue.finish_job(queue, job['id'])
+        print(f"[job {job['id']}] {params['name_area']} done")
+    except Exception as e:
+        traceback.print_exc()
+        job_queue.finish_job(queue, job['id'], str(e))
+        print(f"[job {job['id']}] {params['name_area']} failed: {e}")
+    finally:
+        queue.close()
+
+
+def work(concurrency, tile_workers, tile_margin, once=False):
+    """Claim and run jobs until interrupted, or until the queue is empty with once."""
+    queue = job_queue.connect_queue()
+    print(f"Worker {os.getpid()} processing up to {concurrency} jobs from {CONFIG['job_queue']}")
+
+    # Job id of each running job
+    running = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        try:
+            while True:
+                running = {future: job_id for future, job_id in running.items() if not future.done()}
+                job_queue.renew_leases(queue, running.values())
+                expired = job_queue.requeue_expired(queue)
+                if expired:
+                    print(f"Queued jobs {', '.join(map(str, expired))} of stopped workers again")
+                while len(running) < concurrency:
+                    job = job_queue.claim_job(queue, concurrency, len(execute_queries.STAGES))
+                    if job is None:
+                        break
+                    running[pool.submit(run_job, job, tile_workers, tile_margin)] = job['id']
+                if once and not running:
+                    break
+                time.sleep(POLL_SECONDS)
+        except KeyboardInterrupt:
+            if running:
+                print(f"Stopping after the {len(running)} running jobs, interrupt again to abort them "
+                      "(they are queued again when their lease expires)")
+            # Keep the leases until the running jobs are done
+            while running:
+                wait(running, timeout=POLL_SECONDS)
+                running = {future: job_id for future, job_id in running.items() if not future.done()}
+                job_queue.renew_leases(queue, running.values())
+    queue.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Process the regions submitted to the job queue.")
+    parser.add_argument('-c', '--concurrency', type=int, default=CONFIG['job_concurrency'],
+                        help="Jobs running at the same time over all workers (default: CONFIG['job_concurrency'])")
+    parser.add_argument('--tile-workers', type=int, default=2,
+                        help="Parallel connections of a job processed in tiles (default: 2)")
+    parser.add_argument('--tile-margin', type=float, default=50.0,
+                        help="Overlap in meters between neighbouring tiles (default: 50)")
+    parser.add_argument('--once', action='store_true', help="Exit when no job is queued or running")
+    args = parser.parse_args()
+
+    work(args.concurrency, args.tile_workers, args.tile_margin, args.once)
@@ -0,0 +1,199 @@
+"""Parallel DTM loader.
+
+Loads a DTM into public.dtm over several connections. The DTM is split into
+parts: the files of a tile directory, or bands of tile rows of a single file
+(small VRT windows on it, without copying pixels). raster2pgsql streams each
+part as COPY data into its own psql session, in one transaction, so a part is
+loaded completely or not at all. Each tile records its part in the filename
+column; parts already in public.dtm are skipped, so a failed load can be
+resumed without dropping the table. The raster constraints, the GiST index
+and VACUUM ANALYZE run once, after all parts are loaded.
+"""
+import argparse
+import glob
+import math
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os.path import dirname, abspath
+
+import psycopg2
+import rasterio
+
+# Add the project root directory to Python path
+project_root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from config import CONFIG
+
+# Parts per worker when splitting a single file, so slow parts do not leave workers idle at the end
+PARTS_PER_WORKER = 4
+
+
+def parse_tile_size(tile_size):
+    """Width and height of a raster2pgsql tile size like '500x500'."""
+    width, height = tile_size.lower().split('x')
+    return int(width), int(height)
+
+
+def split_rows(dtm_file, tile_height, n_parts, parts_dir):
+    """Write VRT windows of whole tile rows of dtm_file into parts_dir and return their paths.
+
+    The bands start at multiples of the tile height, so the tiles are the same as
+    when loading the whole file at once. Existing windows are reused on resume.
+    """
+    with rasterio.open(dtm_file) as src:
+        width, height = src.width, src.height
+    tile_rows = math.ceil(height / tile_height)
+    band_rows = math.ceil(tile_rows / n_parts) * tile_height
+    base = os.path.splitext(os.path.basename(dtm_file))[0]
+    os.makedirs(parts_dir, exist_ok=True)
+
+    parts = []
+    for yoff in range(0, height, band_rows):
+        path = os.path.join(parts_dir, f"{base}_rows_{yoff:07d}.vrt")
+        if not os.path.exists(path):
+            subprocess.run(
+                ['gdal_translate', '-q', '-of', 'VRT', '-srcwin', '0', str(yoff), str(width),
+                 str(min(band_rows, height - yoff)), abspath(dtm_file), path],
+                check=True
+            )
+        parts.append(path)
+    return parts
+
+
+def find_parts(source, tile_size, workers, out_db):
+    """Files to load: the .tif files of a directory, or row bands of a single DTM file."""
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, '*.tif')))
+    if out_db or workers == 1:
+        # Out-of-db tiles only store a reference, they must point at the file itself
+        return [source]
+    parts_dir = os.path.splitext(source)[0] + '_parts'
+    return split_rows(source, parse_tile_size(tile_size)[1], workers * PARTS_PER_WORKER, parts_dir)
+
+
+def psql_command():
+    db = CONFIG['db_connection']
+    return ['psql', '-q', '-h', db['host'], '-U', db['user'], '-d', CONFIG['database'], '-v', 'ON_ERROR_STOP=1']
+
+
+def psql_env():
+    return {**os.environ, 'PGPASSWORD': CONFIG['db_connection']['password']}
+
+
+def raster2pgsql_command(mode, path, srid, tile_size, out_db):
+    """raster2pgsql in prepare (-p) or append (-a) mode, with COPY data and the filename column."""
+    command = ['raster2pgsql', mode, '-s', str(srid), '-F', '-t', tile_size]
+    if mode == '-a':
+        command.append('-Y')
+    if out_db:
+        command.append('-R')
+    return command + [abspath(path), 'public.dtm']
+
+
+def stream(command):
+    """Pipe a raster2pgsql command into psql and raise if either of them fails."""
+    producer = subprocess.Popen(command, stdout=subprocess.PIPE)
+    consumer = subprocess.run(psql_command(), stdin=producer.stdout, env=psql_env(),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    producer.stdout.close()
+    if producer.wait() != 0:
+        raise RuntimeError(f"raster2pgsql failed on {command[-2]}")
+    if consumer.returncode != 0:
+        raise RuntimeError(f"psql failed on {command[-2]}: {consumer.stderr.strip()}")
+
+
+def prepare_table(conn, first_part, srid, tile_size, resume):
+    """Create public.dtm (or keep it on resume, without constraints and index) and return the loaded parts."""
+    with conn.cursor() as cur:
+        if not resume:
+            cur.execute("DROP TABLE IF EXISTS public.dtm CASCADE")
+        cur.execute("SELECT to_regclass('public.dtm') IS NOT NULL")
+        exists = cur.fetchone()[0]
+    conn.commit()
+
+    if not exists:
+        stream(raster2pgsql_command('-p', first_part, srid, tile_size, False))
+        return set()
+
+    with conn.cursor() as cur:
+        # The extent and alignment constraints would reject the remaining tiles, the index slows down COPY
+        cur.execute("SELECT DropRasterConstraints('public'::name, 'dtm'::name, 'rast'::name)")
+        cur.execute("DROP INDEX IF EXISTS public.dtm_st_convexhull_idx")
+        cur.execute("SELECT DISTINCT filename FROM public.dtm")
+        loaded = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return loaded
+
+
+def finish_table(conn):
+    """Add the raster constraints and the spatial index and update the statistics, once for all parts."""
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        print("Adding raster constraints...")
+        cur.execute("SELECT AddRasterConstraints('public'::name, 'dtm'::name, 'rast'::name)")
+        print("Creating spatial index...")
+        cur.execute("CREATE INDEX IF NOT EXISTS dtm_st_convexhull_idx ON public.dtm USING gist (ST_ConvexHull(rast))")
+        print("Running VACUUM ANALYZE...")
+        cur.execute("VACUUM ANALYZE public.dtm")
+
+
+def load_dtm(source, srid, tile_size, workers, out_db=False, resume=False):
+    """Load a DTM file or tile directory into public.dtm with parallel COPY streams."""
+    start_time = time.time()
+    parts = find_parts(source, tile_size, workers, out_db)
+    if not parts:
+        raise FileNotFoundError(f"No .tif files found in {source}")
+
+    conn = psycopg2.connect(dbname=CONFIG['database'], **CONFIG['db_connection'])
+    try:
+        loaded = prepare_table(conn, parts[0], srid, tile_size, resume)
+        todo = [part for part in parts if os.path.basename(part) not in loaded]
+        if len(todo) < len(parts):
+            print(f"Resuming: {len(parts) - len(todo)} of {len(parts)} parts are already loaded")
+        print(f"Loading {len(todo)} parts with {workers} workers...")
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(stream, raster2pgsql_command('-a', part, srid, tile_size, out_db)): part
+                for part in todo
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    future.result()
+                    print(f"  [{done}/{len(todo)}] {os.path.basename(futures[future])}")
+                except Exception as e:
+                    failed.append(futures[future])
+                    print(f"  [{done}/{len(todo)}] Error: {e}")
+
+        if failed:
+            print(f"Error: {len(failed)} parts failed, run again with --resume to load them")
+            return False
+
+        finish_table(conn)
+    finally:
+        conn.close()
+
+    print(f"DTM loaded in {time.time() - start_time:.2f} seconds")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load a DTM into public.dtm with parallel COPY streams.")
+    parser.add_argument('source', help="DTM file, or directory of DTM tiles (.tif) in the target CRS")
+    parser.add_argument('-s', '--srid', type=int, default=int(CONFIG['dtm_crs'].split(':')[1]),
+                        help="SRID of the DTM (default: from CONFIG['dtm_crs'])")
+    parser.add_argument('-t', '--tile-size', default='500x500', help="Tile size (default: 500x500)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help="Number of parallel COPY connections (default: number of CPUs)")
+    parser.add_argument('--out-db', action='store_true', help="Register the file as out-of-db rasters")
+    parser.add_argument('--resume', action='store_true',
+                        help="Keep public.dtm and load only the parts that are not in it yet")
+    args = parser.parse_args()
+
+    if not load_dtm(args.source, args.srid, args.tile_size, args.workers, args.out_db, args.resume):
+        sys.exit(1)
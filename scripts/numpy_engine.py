@@ -0,0 +1,372 @@
+"""In-process slope engine.
+
+Computes road segment slopes directly from the DTM GeoTIFF and the roads
+GeoPackage with NumPy, as an alternative to running
+01_extract_points_window.sql and 02_create_segment_slopes_table.sql in PostGIS.
+The result has the same columns as road_segments_slope_<area>, so the dashboard
+can read the output of either engine. The engine implements the fixed
+densification and both DTM sampling modes, and writes the standard storage
+layout.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from os.path import dirname, abspath
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+from rasterio.windows import Window
+from sqlalchemy import create_engine, text
+from sqlalchemy.types import Integer, BigInteger
+
+# Add the project root directory to Python path
+project_root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from config import CONFIG, get_region_params
+from execute_queries import (
+    STAGES, connect, prepare_database, record_versions, render_sql, run_stages, stage_hash, stage_tables
+)
+
+# other_tags values that mark a road as bridge/tunnel (same rules as 00_prepare_roads.sql)
+BRIDGE_TAGS = ('"bridge"=>"yes"', '"bridge"=>"viaduct"', '"bridge"=>"aqueduct"')
+TUNNEL_TAGS = ('"tunnel"=>"yes"', '"tunnel"=>"building_passage"', '"tunnel"=>"passage"')
+
+# Side length in meters of the square cells used to split sampling into windowed reads
+DEFAULT_CHUNK_SIZE = 1000.0
+
+
+def load_roads(roads_file, params):
+    """Read the roads intersecting the region window and classify bridges/tunnels."""
+    bbox = (params['minx'], params['miny'], params['maxx'], params['maxy'])
+    roads = gpd.read_file(roads_file, bbox=bbox, engine='pyogrio', fid_as_index=True)
+    if roads.crs is None or roads.crs.to_epsg() != params['crs']:
+        raise ValueError(f"Roads CRS {roads.crs} does not match region CRS EPSG:{params['crs']}")
+
+    roads = roads[roads['highway'].notna() & ~roads['highway'].isin(CONFIG['excluded_highways'])]
+    roads = roads[roads.intersects(shapely.box(*bbox))]
+    roads.index.name = 'fid'
+    roads = roads.reset_index()
+
+    other_tags = roads['other_tags'].fillna('') if 'other_tags' in roads else pd.Series('', index=roads.index)
+    is_bridge = roads.get('bridge', pd.Series(None, index=roads.index)).eq('yes')
+    is_tunnel = roads.get('tunnel', pd.Series(None, index=roads.index)).eq('yes')
+    for tag in BRIDGE_TAGS:
+        is_bridge |= other_tags.str.contains(tag, regex=False)
+    for tag in TUNNEL_TAGS:
+        is_tunnel |= other_tags.str.contains(tag, regex=False)
+    roads['bridge'] = np.where(is_bridge, 'yes', 'no')
+    roads['tunnel'] = np.where(is_tunnel, 'yes', 'no')
+    return roads[['fid', 'highway', 'bridge', 'tunnel', 'geometry']]
+
+
+def densify_roads(roads, params):
+    """Segmentize road lines and return one row per point, like ST_Segmentize + ST_DumpPoints.
+
+    Uses the fixed densification distances; the adaptive densification is only implemented in SQL.
+    """
+    geoms = roads.geometry.values
+    lengths = shapely.length(geoms)
+    # Same segmentation distances as road_lengths_table in 01_extract_points_window.sql
+    seg_distance = np.where(lengths < 50, 5.0, np.where(lengths < 100, 10.0, 25.0))
+    segmented = shapely.segmentize(geoms, seg_distance)
+
+    # The roads file may hold multi-part lines, which load_data.sh loads as separate roads:
+    # split them so that seq restarts per part
+    parts, road_idx = shapely.get_parts(segmented, return_index=True)
+    coords, part_idx = shapely.get_coordinates(parts, return_index=True)
+    part_start = np.searchsorted(part_idx, np.arange(len(parts)))
+    seq = np.arange(len(part_idx)) - part_start[part_idx] + 1
+    n_points = shapely.get_num_coordinates(segmented)
+
+    points = pd.DataFrame({
+        'fid': roads['fid'].values[road_idx[part_idx]],
+        'part': part_idx,
+        'seq': seq,
+        'x': coords[:, 0],
+        'y': coords[:, 1],
+        'segmented_points': n_points[road_idx[part_idx]],
+        'resolution': seg_distance[road_idx[part_idx]],
+        'bridge': roads['bridge'].values[road_idx[part_idx]],
+        'tunnel': roads['tunnel'].values[road_idx[part_idx]],
+        'highway': roads['highway'].values[road_idx[part_idx]],
+    })
+    # Only keep points inside the region window
+    inside = (
+        points['x'].between(params['minx'], params['maxx'])
+        & points['y'].between(params['miny'], params['maxy'])
+    )
+    return points[inside].reset_index(drop=True)
+
+
+def sample_dtm(dtm_file, xs, ys, resample):
+    """Sample elevations at the given coordinates from a single windowed raster read.
+
+    With resample 'nearest' returns the containing pixel. With 'bilinear' uses bilinear
+    interpolation between the four surrounding pixel centers and falls back to the
+    containing pixel when a neighbour is nodata. Points outside the raster or on nodata
+    pixels get NaN.
+    """
+    with rasterio.open(dtm_file) as src:
+        transform = src.transform
+        if transform.b != 0 or transform.d != 0:
+            raise ValueError("Rotated rasters are not supported")
+        cols = (xs - transform.c) / transform.a
+        rows = (ys - transform.f) / transform.e
+
+        # Window covering all points plus one pixel on each side for the neighbours
+        col_off = int(np.floor(cols.min())) - 1
+        row_off = int(np.floor(rows.min())) - 1
+        width = int(np.floor(cols.max())) - col_off + 2
+        height = int(np.floor(rows.max())) - row_off + 2
+        window = Window(col_off, row_off, width, height)
+        band = src.read(1, window=window, boundless=True, masked=True)
+        dtm = band.astype('float64').filled(np.nan)
+
+    # Pixel containing each point (nearest value, as ST_Value returns)
+    nearest = dtm[
+        np.floor(rows).astype(int) - row_off,
+        np.floor(cols).astype(int) - col_off
+    ]
+    if resample == 'nearest':
+        return nearest
+
+    # Position relative to pixel centers of the window
+    u = cols - col_off - 0.5
+    v = rows - row_off - 0.5
+    j0 = np.clip(np.floor(u).astype(int), 0, width - 2)
+    i0 = np.clip(np.floor(v).astype(int), 0, height - 2)
+    fu = u - j0
+    fv = v - i0
+    bilinear = (
+        dtm[i0, j0] * (1 - fu) * (1 - fv)
+        + dtm[i0, j0 + 1] * fu * (1 - fv)
+        + dtm[i0 + 1, j0] * (1 - fu) * fv
+        + dtm[i0 + 1, j0 + 1] * fu * fv
+    )
+    return np.where(np.isnan(bilinear), nearest, bilinear)
+
+
+def sample_elevations(dtm_file, points, resample, chunk_size=DEFAULT_CHUNK_SIZE, workers=None):
+    """Sample elevations for all points, one windowed read per chunk cell, in parallel."""
+    xs = points['x'].to_numpy()
+    ys = points['y'].to_numpy()
+    elevation = np.full(len(points), np.nan)
+    if len(points) == 0:
+        return elevation
+
+    # Group points into square cells so every worker reads a small window
+    cell_x = np.floor((xs - xs.min()) / chunk_size).astype(np.int64)
+    cell_y = np.floor((ys - ys.min()) / chunk_size).astype(np.int64)
+    cell = cell_y * (cell_x.max() + 1) + cell_x
+    order = np.argsort(cell, kind='stable')
+    boundaries = np.flatnonzero(np.diff(cell[order])) + 1
+    chunks = np.split(order, boundaries)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            (idx, pool.submit(sample_dtm, dtm_file, xs[idx], ys[idx], resample))
+            for idx in chunks
+        ]
+        for idx, future in futures:
+            elevation[idx] = future.result()
+    return elevation
+
+
+def compute_segments(points, max_gap=CONFIG['segment_max_gap']):
+    """Pair consecutive valid points and compute slope per segment, as 02_create_segment_slopes_table.sql.
+
+    Points without elevation in between are bridged when the next valid point is at most max_gap meters away.
+    Points missing in between (outside the region window) are never bridged.
+    """
+    points = points.sort_values(['fid', 'part', 'seq'], kind='stable')
+    # Points of the road part up to each point, a missing point makes it fall behind seq
+    point_count = points.groupby(['fid', 'part']).cumcount().to_numpy()
+    is_valid = (points['point_status'] == 'valid').to_numpy()
+    valid = points[is_valid]
+    point_count = point_count[is_valid]
+    fid = valid['fid'].to_numpy()
+    part = valid['part'].to_numpy()
+    seq = valid['seq'].to_numpy()
+    x = valid['x'].to_numpy()
+    y = valid['y'].to_numpy()
+    z = valid['elevation'].to_numpy()
+
+    # Consecutive valid points within the same road part without missing points in between, next along
+    # the road or across a bridged gap of points without elevation
+    gap = np.hypot(x[1:] - x[:-1], y[1:] - y[:-1])
+    complete = seq[1:] - seq[:-1] == point_count[1:] - point_count[:-1]
+    pair = (
+        (fid[1:] == fid[:-1]) & (part[1:] == part[:-1]) & complete
+        & ((seq[1:] == seq[:-1] + 1) | (gap <= max_gap))
+    )
+    start = np.flatnonzero(pair)
+    end = start + 1
+
+    segment_length = np.hypot(x[end] - x[start], y[end] - y[start])
+    keep = segment_length > 0  # Exclude zero-length segments
+    start, end, segment_length = start[keep], end[keep], segment_length[keep]
+
+    bridge = valid['bridge'].to_numpy()[start]
+    tunnel = valid['tunnel'].to_numpy()[start]
+    elevation_change = np.abs(z[end] - z[start])
+    slope_pct = elevation_change / segment_length * 100.0
+    # Exclude bridges and tunnels
+    slope_pct = np.where((bridge == 'yes') | (tunnel == 'yes'), np.nan, slope_pct)
+    direction = np.select(
+        [z[end] > z[start], z[end] < z[start]],
+        ['uphill_along_road_direction', 'downhill_along_road_direction'],
+        default='flat'
+    )
+
+    line_coords = np.stack([
+        np.column_stack([x[start], y[start]]),
+        np.column_stack([x[end], y[end]])
+    ], axis=1)
+
+    segments = pd.DataFrame({
+        'fid': fid[start],
+        'seq_start': seq[start],
+        'seq_end': seq[end],
+        'segment_length': segment_length,
+        'resolution': valid['resolution'].to_numpy()[start],
+        'elev_start': z[start],
+        'elev_end': z[end],
+        'elevation_change': elevation_change,
+        'slope_pct': slope_pct,
+        'direction': direction,
+        'bridge': bridge,
+        'tunnel': tunnel,
+        'highway': valid['highway'].to_numpy()[start],
+    })
+    segments = segments.sort_values(['fid', 'seq_start'], kind='stable')
+    segments.insert(1, 'segment_id', segments.groupby('fid').cumcount() + 1)
+    geometry = shapely.linestrings(line_coords[segments.index.to_numpy()])
+    return gpd.GeoDataFrame(
+        segments.reset_index(drop=True),
+        geometry=gpd.GeoSeries(geometry),
+    ).rename_geometry('segment_geom')
+
+
+def db_engine():
+    db = CONFIG['db_connection']
+    return create_engine(f"postgresql://{db['user']}:{db['password']}@{db['host']}/{CONFIG['database']}")
+
+
+def write_roads(roads, area_name, crs):
+    """Write the roads to PostGIS as filtered_roads_<area>, from which the summary stage takes the highway."""
+    table_name = f"filtered_roads_{area_name}"
+    roads = roads.rename(columns={'bridge': 'bridge_combined', 'tunnel': 'tunnel_combined'}).rename_geometry('geom')
+    roads.set_crs(epsg=crs, allow_override=True).to_postgis(
+        table_name, db_engine(), schema='public', if_exists='replace', index=False, dtype={'fid': Integer}
+    )
+    return table_name
+
+
+def write_segments(segments, area_name, crs):
+    """Write the segments to PostGIS as road_segments_slope_<area>, with the indexes of the segments stage."""
+    table_name = f"road_segments_slope_{area_name}"
+    segments = segments.set_crs(epsg=crs, allow_override=True)
+    engine = db_engine()
+    segments.to_postgis(
+        table_name, engine, schema='public', if_exists='replace', index=False,
+        dtype={'fid': Integer, 'segment_id': BigInteger, 'seq_start': Integer, 'seq_end': Integer}
+    )
+    sql, _ = render_sql('02_create_segment_slopes_indexes', {'name_area': area_name})
+    with engine.begin() as conn:
+        # GeoAlchemy2 creates a GiST index on segment_geom of its own, replaced by the shared one
+        conn.execute(text(f"DROP INDEX IF EXISTS idx_{table_name}_segment_geom"))
+        conn.exec_driver_sql(sql)
+    return table_name
+
+
+def engine_hash(stage, params, engine_params):
+    """Parameters hash of the outputs of a stage, with the settings the engine applied instead of CONFIG's."""
+    stage_params = stage.get('params', {})
+    applied = {key: value for key, value in engine_params.items() if key in stage_params}
+    return stage_hash({**stage, 'params': {**stage_params, **applied}}, params)
+
+
+def run(dtm_file, roads_file, params, output=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None,
+        resample=CONFIG['dtm_resample']):
+    if CONFIG['densify'] != 'fixed':
+        raise ValueError(f"The numpy engine only implements densify 'fixed', not '{CONFIG['densify']}': "
+                         "set DENSIFY=fixed or run scripts/execute_queries.py")
+    if resample not in ('nearest', 'bilinear'):
+        raise ValueError(f"Unknown DTM resample mode '{resample}', use 'nearest' or 'bilinear'")
+    # Settings the outputs are built with, recorded in the table versions
+    engine_params = {'resample': resample, 'densify': 'fixed', 'storage': 'standard'}
+    area_name = params['name_area'].replace('-', '_').replace(' ', '_')
+    start_time = time.time()
+    print(f"\nStarting numpy engine at {datetime.now().strftime('%H:%M:%S')} for region: {area_name}")
+
+    roads = load_roads(roads_file, params)
+    print(f"Roads in window: {len(roads):,}")
+
+    points = densify_roads(roads, params)
+    with rasterio.open(dtm_file) as src:
+        if src.crs is None or src.crs.to_epsg() != params['crs']:
+            raise ValueError(f"DTM CRS {src.crs} does not match region CRS EPSG:{params['crs']}")
+    points['elevation'] = sample_elevations(dtm_file, points, resample, chunk_size, workers)
+    points['point_status'] = np.where(np.isnan(points['elevation']), 'null_elevation', 'valid')
+    print(f"Sampled points: {len(points):,} ({(points['point_status'] == 'valid').sum():,} valid)")
+
+    segments = compute_segments(points)
+    print(f"Segments: {len(segments):,}")
+
+    if output:
+        segments = segments.set_crs(epsg=params['crs'], allow_override=True)
+        if output.endswith('.parquet'):
+            segments.to_parquet(output, index=False)
+        else:
+            # Keep 'fid' as a regular column, GeoPackage reserves it for the feature id
+            segments.to_file(output, layer_options={'FID': 'ogc_fid'})
+        print(f"Segments written to {output}")
+    else:
+        table_name = write_segments(segments, area_name, params['crs'])
+        print(f"Segments written to table {table_name}")
+        table_name = write_roads(roads, area_name, params['crs'])
+        print(f"Roads written to table {table_name}")
+        # Record the roads and segments like the points and segments stages, then build the summary tables
+        # used by the dashboard
+        conn = connect()
+        try:
+            prepare_database(params, conn)
+            record_versions(conn, stage_tables(STAGES[0]['outputs'][:1], params),
+                            engine_hash(STAGES[0], params, engine_params))
+            record_versions(conn, stage_tables(STAGES[1]['outputs'], params),
+                            engine_hash(STAGES[1], params, engine_params))
+            # The engine writes the standard storage layout
+            run_stages(conn, {**params, 'storage': 'standard'}, STAGES[2:])
+        finally:
+            conn.close()
+
+    duration = time.time() - start_time
+    print(f"numpy engine complete in {duration:.2f} seconds")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compute road segment slopes in-process from the DTM and roads files.")
+    parser.add_argument('-d', '--dtm', default='data/dtm.tif', help="Path to DTM GeoTIFF")
+    parser.add_argument('-r', '--roads', default='data/roads.gpkg', help="Path to roads GeoPackage")
+    parser.add_argument('--region', default=CONFIG['region'], help="Region name in REGION_PARAMS")
+    parser.add_argument('-o', '--output', help="Write segments to this file (.gpkg or .parquet) instead of the database")
+    parser.add_argument('--chunk-size', type=float, default=DEFAULT_CHUNK_SIZE,
+                        help="Side length in meters of the cells sampled per raster read")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of sampling processes")
+    parser.add_argument('--resample', choices=['nearest', 'bilinear'], default=CONFIG['dtm_resample'],
+                        help="DTM sampling: nearest pixel or bilinear interpolation (default: CONFIG['dtm_resample'])")
+    args = parser.parse_args()
+
+    params = get_region_params(args.region)
+    if params is None:
+        print(f"Error: No parameters found for region '{args.region}'")
+        sys.exit(1)
+
+    run(args.dtm, args.roads, params, args.output, args.chunk_size, args.workers, args.resample)
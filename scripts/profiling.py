@@ -0,0 +1,130 @@
+"""Per-statement profiling of the pipeline SQL files.
+
+With execute_queries.py --profile, every SQL file is split into its statements,
+which are timed one by one. Statements preceded by a "-- @explain" comment are
+run through EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and their plans are kept.
+The timings, row counts and plans of a run are written to a JSON report.
+"""
+import json
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+REPORT_DIR = Path(__file__).parent.parent / 'reports'
+
+# Marker comment in the SQL files for statements whose plan is captured
+EXPLAIN_MARKER = '@explain'
+
+DOLLAR_QUOTE = re.compile(r"\$[A-Za-z_]*\$")
+
+
+def split_statements(sql):
+    """Split a SQL script into (line number, statement) pairs at top-level semicolons.
+
+    Semicolons inside quotes, dollar quotes and comments are not split on. Each
+    statement keeps the comments in front of it; comment-only chunks are dropped.
+    """
+    statements = []
+    start = 0
+    i = 0
+    while i < len(sql):
+        char = sql[i]
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = len(sql) if end == -1 else end + 1
+            continue
+        if sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = len(sql) if end == -1 else end + 2
+            continue
+        if char in ("'", '"'):
+            # A doubled quote inside the string just ends and restarts it
+            end = sql.find(char, i + 1)
+            i = len(sql) if end == -1 else end + 1
+            continue
+        if char == '$':
+            match = DOLLAR_QUOTE.match(sql, i)
+            if match:
+                end = sql.find(match.group(), match.end())
+                i = len(sql) if end == -1 else end + len(match.group())
+                continue
+        if char == ';':
+            statements.append((start, sql[start:i + 1]))
+            start = i + 1
+        i += 1
+    statements.append((start, sql[start:]))
+
+    result = []
+    for offset, statement in statements:
+        body = statement_body(statement)
+        if body:
+            # Line of the statement itself, after its comments
+            result.append((sql.count('\n', 0, offset + statement.index(body[0])) + 1, statement))
+    return result
+
+
+def statement_body(statement):
+    """Lines of a statement without its leading comments and blank lines."""
+    lines = statement.strip().splitlines()
+    while lines and (not lines[0].strip() or lines[0].lstrip().startswith('--')):
+        lines.pop(0)
+    return lines
+
+
+def plan_rows(plan):
+    """Rows produced by the top of a plan, below the ModifyTable node of INSERT statements."""
+    if plan.get('Node Type') == 'ModifyTable' and plan.get('Plans'):
+        plan = plan['Plans'][0]
+    return plan.get('Actual Rows')
+
+
+def execute_profiled(cur, sql, params):
+    """Execute a SQL script statement by statement and return the timing of each statement."""
+    profile = []
+    for line, statement in split_statements(sql):
+        body = statement_body(statement)
+        lines = statement.strip().splitlines()
+        explain = any(EXPLAIN_MARKER in comment for comment in lines[:len(lines) - len(body)])
+        entry = {
+            'line': line,
+            'statement': ' '.join(body[0].split())[:120],
+        }
+        start_time = time.time()
+        if explain:
+            cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", params)
+            plan = cur.fetchone()[0]
+            plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+            entry['rows'] = plan_rows(plan['Plan'])
+            entry['plan'] = plan
+        else:
+            cur.execute(statement, params)
+            entry['rows'] = cur.rowcount if cur.rowcount >= 0 else None
+            entry['status'] = cur.statusmessage
+        entry['seconds'] = round(time.time() - start_time, 3)
+        profile.append(entry)
+    return profile
+
+
+def new_report(params, settings):
+    """Start the report of a profiled run, for one region or for a batch with a list of regions."""
+    regions = params.get('regions', [params])
+    area = sum((p['maxx'] - p['minx']) * (p['maxy'] - p['miny']) for p in regions)
+    return {
+        'region': params['name_area'],
+        'params': params,
+        'area_km2': round(area / 1e6, 3),
+        'session_settings': settings,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'queries': [],
+    }
+
+
+def write_report(report, total_seconds):
+    """Write the report to reports/profile_<region>_<timestamp>.json and return its path."""
+    report['total_seconds'] = round(total_seconds, 3)
+    REPORT_DIR.mkdir(exist_ok=True)
+    started = report['started_at'].replace(':', '').replace('-', '')
+    path = REPORT_DIR / f"profile_{report['region']}_{started}.json"
+    path.write_text(json.dumps(report, indent=2, default=str))
+    return path
@@ -0,0 +1,98 @@
+"""Segments bridge gaps of points without elevation, but not gaps of points missing from the points table,
+in the segments stage and in the in-process engine.
+
+Road 1 has points seq 1 to 9, 5 m apart along x. Point 5 has no elevation and point 7 is missing, as
+if it had been left out by the region window: the segment 4 -> 6 bridges the elevation gap, no segment
+joins 6 and 8.
+"""
+import sys
+from os.path import dirname, abspath
+
+import pandas as pd
+import psycopg2
+import pytest
+
+# Add the scripts directory to Python path, as the scripts are run from there
+sys.path.insert(0, dirname(dirname(abspath(__file__))) + '/scripts')
+
+import execute_queries
+import numpy_engine
+
+PARAMS = {'name_area': 'test_segment_gaps', 'crs': 25832, 'densify': 'fixed', 'max_gap': 50.0, 'storage': 'standard'}
+
+# (seq, elevation) of the points of road 1
+POINTS = [(1, 100.0), (2, 100.5), (3, 101.0), (4, 101.5), (5, None), (6, 102.5), (8, 103.5), (9, 104.0)]
+
+EXPECTED_SEGMENTS = [(1, 2), (2, 3), (3, 4), (4, 6), (8, 9)]
+
+
+@pytest.fixture
+def conn():
+    try:
+        conn = execute_queries.connect()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"No database: {e}")
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM pg_extension WHERE extname = 'postgis'")
+        has_postgis = cur.fetchone()[0] > 0
+    conn.commit()
+    if not has_postgis:
+        conn.close()
+        pytest.skip("The database has no PostGIS extension")
+    yield conn
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            DROP TABLE IF EXISTS filtered_roads_{PARAMS['name_area']};
+            DROP TABLE IF EXISTS road_points_window_{PARAMS['name_area']};
+            DROP TABLE IF EXISTS road_segments_slope_{PARAMS['name_area']};
+        """)
+    conn.commit()
+    conn.close()
+
+
+def test_sql_segments_bridge_null_elevations_only(conn):
+    execute_queries.prepare_database(PARAMS, conn)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            DROP TABLE IF EXISTS filtered_roads_{PARAMS['name_area']};
+            CREATE TABLE filtered_roads_{PARAMS['name_area']} AS
+            SELECT 1 AS fid, 'residential'::text AS highway, 'no'::text AS bridge_combined,
+                'no'::text AS tunnel_combined;
+
+            DROP TABLE IF EXISTS road_points_window_{PARAMS['name_area']};
+            CREATE TABLE road_points_window_{PARAMS['name_area']} (
+              fid integer, seq integer, geom_utm geometry(Point, 25832), elevation double precision, resolution real
+            );
+        """)
+        cur.executemany(
+            f"INSERT INTO road_points_window_{PARAMS['name_area']} "
+            "VALUES (1, %s, ST_SetSRID(ST_MakePoint(%s, 0), 25832), %s, 5)",
+            [(seq, seq * 5.0, elevation) for seq, elevation in POINTS]
+        )
+    conn.commit()
+
+    execute_queries.run_query('02_create_segment_slopes_table', PARAMS, conn)
+
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT seq_start, seq_end FROM road_segments_slope_{PARAMS['name_area']} ORDER BY seq_start")
+        assert cur.fetchall() == EXPECTED_SEGMENTS
+
+
+def test_numpy_segments_bridge_null_elevations_only():
+    points = pd.DataFrame({
+        'fid': 1,
+        'part': 0,
+        'seq': [seq for seq, _ in POINTS],
+        'x': [seq * 5.0 for seq, _ in POINTS],
+        'y': 0.0,
+        'elevation': [float('nan') if elevation is None else elevation for _, elevation in POINTS],
+        'point_status': ['null_elevation' if elevation is None else 'valid' for _, elevation in POINTS],
+        'resolution': 5.0,
+        'bridge': 'no',
+        'tunnel': 'no',
+        'highway': 'residential',
+    })
+
+    segments = numpy_engine.compute_segments(points, max_gap=PARAMS['max_gap'])
+
+    assert list(zip(segments['seq_start'], segments['seq_end'])) == EXPECTED_SEGMENTS
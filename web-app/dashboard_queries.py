@@ -0,0 +1,295 @@
+"""Dashboard queries for the slope statistics, histogram and map.
+
+Statistics are computed from the per-region road_slope_bins_<region> table
+(see 03_create_slope_bins_table.sql) instead of the individual segments. Only
+the segments in the partially selected bins at both ends of the slope filter
+are read from road_segments_slope_<region>, through the slope index. Road
+counts and road lookups start from road_summary_<region>
+(see 05_create_road_summary_table.sql). The map lines are loaded per XYZ tile
+of the visible area, so the dashboard can cache them tile by tile.
+"""
+import math
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import CONFIG
+
+# Number of bars in the slope histogram
+HISTOGRAM_BARS = 20
+
+# Map lines are loaded in tiles this many zoom levels coarser than the map, a few tiles per screen
+VIEWPORT_TILE_ZOOM_OFFSET = 2
+
+# Margin around the visible area that is loaded too, as a share of its width and height
+VIEWPORT_MARGIN = 0.25
+
+# Slope category of a segment, as shown in the dashboard legend
+SLOPE_CATEGORY_SQL = """
+    CASE
+        WHEN slope_pct <= 1 THEN 1
+        WHEN slope_pct <= 3 THEN 2
+        WHEN slope_pct <= 6 THEN 3
+        WHEN slope_pct <= 10 THEN 4
+        ELSE 5
+    END"""
+
+# Map color per slope category
+SLOPE_CATEGORY_COLORS = {
+    1: '#00ff00',  # Flat (0-1%)
+    2: '#ffff00',  # Gentle (1-3%)
+    3: '#ffa500',  # Moderate (3-6%)
+    4: '#982d80',  # Steep (6-10%)
+    5: '#ff0000'   # Very Steep (>10%)
+}
+
+
+def lod_for_zoom(zoom, latitude, tolerances):
+    """Level of detail for a map zoom level at the given latitude.
+
+    Picks the coarsest level whose simplification tolerance is at most one
+    pixel; level 0 means the original segments.
+    """
+    # Web Mercator ground resolution in meters per pixel
+    pixel_size = 156543.03 * math.cos(math.radians(latitude)) / 2 ** zoom
+    lod = 0
+    for level, tolerance in enumerate(tolerances, start=1):
+        if tolerance <= pixel_size:
+            lod = level
+    return lod
+
+
+def lonlat_to_tile(lon, lat, zoom):
+    """XYZ tile (x, y) containing a point at the given zoom level."""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def viewport_tiles(bounds, zoom, margin=VIEWPORT_MARGIN):
+    """XYZ tiles (z, x, y) covering the map bounds (south, west, north, east) plus a margin."""
+    south, west, north, east = bounds
+    dx, dy = (east - west) * margin, (north - south) * margin
+    z = max(0, int(zoom) - VIEWPORT_TILE_ZOOM_OFFSET)
+    x_min, y_min = lonlat_to_tile(west - dx, north + dy, z)
+    x_max, y_max = lonlat_to_tile(east + dx, south - dy, z)
+    return [(z, x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+
+
+def get_road_data(engine, region, min_slope, max_slope, lod=0, tile=None):
+    """Map lines of the slope range in the map CRS, one multi-line per slope category.
+
+    Level 0 returns the original segments, higher levels the merged and
+    simplified lines of road_segments_lod_<region>. With tile=(z, x, y) only
+    the lines whose first point is in that XYZ tile are returned, found
+    through the GiST index on the tile envelope.
+    """
+    if lod > 0:
+        table, geom_column, category = f"road_segments_lod_{region}", "geom", "slope_category"
+        slope_filter = "lod = :lod AND max_slope >= :min_slope AND min_slope <= :max_slope"
+    else:
+        table, geom_column, category = f"road_segments_slope_{region}", "segment_geom", SLOPE_CATEGORY_SQL
+        slope_filter = "slope_pct BETWEEN :min_slope AND :max_slope"
+    params = {"min_slope": min_slope, "max_slope": max_slope, "lod": lod}
+
+    tile_filter = ""
+    if tile is not None:
+        envelope = f"ST_Transform(ST_TileEnvelope(:z, :x, :y), {CONFIG['dtm_crs'].split(':')[1]})"
+        tile_filter = f"""
+            AND {geom_column} && {envelope}
+            AND ST_Intersects(ST_PointN(ST_GeometryN({geom_column}, 1), 1), {envelope})"""
+        params.update(zip(('z', 'x', 'y'), tile))
+
+    query = text(f"""
+        SELECT
+            slope_category,
+            ST_AsBinary(ST_Transform(ST_Collect({geom_column}), {CONFIG['map_crs'].split(':')[1]})) as geometry
+        FROM (
+            SELECT {category} AS slope_category, {geom_column}
+            FROM {table}
+            WHERE {slope_filter}{tile_filter}
+        ) lines
+        GROUP BY slope_category
+    """)
+    with engine.connect() as conn:
+        map_df = pd.read_sql(query, conn, params=params)
+
+    # Decode the WKB geometries in one vectorized call
+    geometry = gpd.GeoSeries.from_wkb([bytes(wkb) for wkb in map_df['geometry']], crs=CONFIG['map_crs'])
+    return gpd.GeoDataFrame(map_df.drop(columns='geometry'), geometry=geometry)
+
+
+# Tables read by the dashboard, whose build times make up the table version of a region
+DASHBOARD_TABLES = ['road_segments_slope_{}', 'road_slope_bins_{}', 'road_segments_lod_{}', 'road_summary_{}']
+
+
+def get_table_version(engine, region):
+    """Latest build time of the DTM and of the region's dashboard tables, from pipeline_table_versions.
+
+    execute_queries.py records a new build time whenever it rebuilds a table,
+    so cached results keyed by this version are recomputed after a rebuild.
+    """
+    query = text("""
+        SELECT MAX(built_at) FROM pipeline_table_versions WHERE table_name = ANY(:tables)
+    """)
+    tables = ['dtm'] + [table.format(region) for table in DASHBOARD_TABLES]
+    with engine.connect() as conn:
+        version = conn.execute(query, {"tables": tables}).scalar()
+    return version.isoformat() if version is not None else None
+
+
+def get_stats(engine, region):
+    """Overall slope statistics of the region, used as initial filter values."""
+    query = text(f"""
+        SELECT
+            MIN(min_slope) as min_slope,
+            MAX(max_slope) as max_slope,
+            SUM(slope_sum) / NULLIF(SUM(segment_count), 0) as avg_slope,
+            SUM(segment_count) as total_segments
+        FROM road_slope_bins_{region}
+    """)
+    with engine.connect() as conn:
+        return pd.read_sql(query, conn).iloc[0]
+
+
+def get_filtered_bins(engine, region, min_slope, max_slope):
+    """Slope bins restricted to min_slope <= slope_pct <= max_slope.
+
+    Bins fully inside the range come from the summary table; the bins cut by
+    the range limits are recomputed from the segments in the range.
+    """
+    bins_table = f"road_slope_bins_{region}"
+    segments_table = f"road_segments_slope_{region}"
+    params = {"min_slope": min_slope, "max_slope": max_slope}
+
+    inner_query = text(f"""
+        SELECT bin, bin_min, bin_max, segment_count, length_m, min_slope, max_slope
+        FROM {bins_table}
+        WHERE bin_min >= :min_slope AND bin_max <= :max_slope
+        ORDER BY bin
+    """)
+    edge_query = text(f"""
+        SELECT
+            width_bucket(slope_pct, 0, 40, 400) as bin,
+            COUNT(*) as segment_count,
+            SUM(segment_length) as length_m,
+            MIN(slope_pct) as min_slope,
+            MAX(slope_pct) as max_slope
+        FROM {segments_table}
+        WHERE slope_pct BETWEEN :min_slope AND :max_slope
+        AND (slope_pct < :inner_min OR slope_pct >= :inner_max)
+        GROUP BY 1
+    """)
+    with engine.connect() as conn:
+        inner = pd.read_sql(inner_query, conn, params=params)
+        # Without inner bins, every segment in the range is an edge segment
+        inner_min = float(inner['bin_min'].min()) if not inner.empty else max_slope + 1
+        inner_max = float(inner['bin_max'].max()) if not inner.empty else max_slope + 1
+        edge = pd.read_sql(edge_query, conn, params={**params, "inner_min": inner_min, "inner_max": inner_max})
+
+    bins = pd.concat([inner.drop(columns=['bin_min', 'bin_max']), edge], ignore_index=True)
+    return bins.groupby('bin', as_index=False).agg({
+        'segment_count': 'sum',
+        'length_m': 'sum',
+        'min_slope': 'min',
+        'max_slope': 'max',
+    })
+
+
+def count_roads(engine, region, min_slope, max_slope):
+    """Number of roads with at least one segment in the slope range.
+
+    A road whose minimum or maximum slope is in the range counts from the road
+    summary alone; only roads whose slopes span the whole range are looked up
+    in the per-road slope index of the segments.
+    """
+    query = text(f"""
+        SELECT COUNT(*) as total_roads
+        FROM road_summary_{region} s
+        WHERE s.min_slope BETWEEN :min_slope AND :max_slope
+        OR s.max_slope BETWEEN :min_slope AND :max_slope
+        OR (
+            s.min_slope < :min_slope AND s.max_slope > :max_slope
+            AND EXISTS (
+                SELECT 1 FROM road_segments_slope_{region} g
+                WHERE g.fid = s.fid AND g.slope_pct BETWEEN :min_slope AND :max_slope
+            )
+        )
+    """)
+    with engine.connect() as conn:
+        return int(conn.execute(query, {"min_slope": min_slope, "max_slope": max_slope}).scalar())
+
+
+def get_steep_roads(engine, region, min_slope, min_length, limit=20):
+    """Roads with at least min_length meters of segments steeper than min_slope, longest steep length first."""
+    query = text(f"""
+        SELECT
+            s.fid,
+            s.highway,
+            steep.length_m as steep_length_m,
+            s.length_m,
+            s.mean_slope,
+            s.max_slope,
+            s.climb_m,
+            s.descent_m
+        FROM road_summary_{region} s
+        CROSS JOIN LATERAL (
+            SELECT SUM(g.segment_length) as length_m
+            FROM road_segments_slope_{region} g
+            WHERE g.fid = s.fid AND g.slope_pct >= :min_slope
+        ) steep
+        WHERE s.max_slope >= :min_slope
+        AND s.slope_length_m >= :min_length
+        AND steep.length_m >= :min_length
+        ORDER BY steep.length_m DESC
+        LIMIT :limit
+    """)
+    with engine.connect() as conn:
+        return pd.read_sql(query, conn, params={"min_slope": min_slope, "min_length": min_length, "limit": limit})
+
+
+def median_from_bins(bins):
+    """Median slope, interpolated linearly inside the bin holding the middle segment."""
+    if bins.empty:
+        return np.nan
+    counts = bins['segment_count'].to_numpy(dtype=float)
+    cumulative = np.cumsum(counts)
+    half = cumulative[-1] / 2
+    i = int(np.searchsorted(cumulative, half))
+    below = cumulative[i] - counts[i]
+    low, high = bins['min_slope'].iloc[i], bins['max_slope'].iloc[i]
+    return low + (high - low) * (half - below) / counts[i]
+
+
+def get_filtered_stats(engine, region, min_slope, max_slope):
+    """Segment and road counts, median and max slope for the slope range, plus the bins used."""
+    bins = get_filtered_bins(engine, region, min_slope, max_slope)
+    stats = pd.Series({
+        'total_segments': int(bins['segment_count'].sum()),
+        'total_roads': count_roads(engine, region, min_slope, max_slope),
+        'median_slope': median_from_bins(bins),
+        'max_slope': bins['max_slope'].max() if not bins.empty else np.nan,
+    })
+    return stats, bins
+
+
+def histogram_from_bins(bins, min_slope, max_slope, bars=HISTOGRAM_BARS):
+    """Re-bin the fine slope bins into equal-width histogram bars between min_slope and max_slope.
+
+    Returns the bar edges and the segment count per bar.
+    """
+    if bins.empty:
+        return np.array([min_slope, max_slope]), np.zeros(1)
+    # Never make bars narrower than the 0.1 summary bins
+    bars = max(1, min(bars, int(round((max_slope - min_slope) / 0.1))))
+    edges = np.linspace(min_slope, max_slope, bars + 1)
+    centers = (bins['min_slope'] + bins['max_slope']) / 2
+    counts, _ = np.histogram(centers, bins=edges, weights=bins['segment_count'])
+    return edges, counts
@@ -0,0 +1,144 @@
+"""Dashboard queries on a region snapshot, without a database.
+
+Reads the files written by scripts/export_snapshot.py through memory maps.
+The segments are sorted by slope, so a slope range is a contiguous slice found
+by binary search; the statistics and bins are computed on that slice with
+NumPy. The functions mirror those of dashboard_queries.py with the snapshot in
+place of the database engine.
+"""
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+
+from dashboard_queries import median_from_bins
+
+# Upper slope limits of the categories 1-4 of SLOPE_CATEGORY_SQL, higher slopes are category 5
+SLOPE_CATEGORY_LIMITS = np.array([1.0, 3.0, 6.0, 10.0])
+
+
+def read_arrow(path):
+    """Memory-map an Arrow IPC file as a table."""
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def column(table, name):
+    """Column of a single-batch table as a NumPy array (zero-copy for numbers without nulls)."""
+    return table.column(name).combine_chunks().to_numpy(zero_copy_only=False)
+
+
+def load_snapshot(snapshot_dir):
+    """Open the snapshot of one region: the segments and levels of detail stay memory-mapped."""
+    with open(os.path.join(snapshot_dir, 'metadata.json')) as f:
+        metadata = json.load(f)
+    segments = read_arrow(os.path.join(snapshot_dir, 'segments.arrow'))
+    lod = read_arrow(os.path.join(snapshot_dir, 'lod.arrow'))
+    return {
+        'metadata': metadata,
+        'segments': segments,
+        'slope_pct': column(segments, 'slope_pct'),
+        'fid': column(segments, 'fid'),
+        'segment_length': column(segments, 'segment_length'),
+        'lod': lod,
+        'lod_level': column(lod, 'lod'),
+        'lod_min_slope': column(lod, 'min_slope'),
+        'lod_max_slope': column(lod, 'max_slope'),
+        'bins': read_arrow(os.path.join(snapshot_dir, 'bins.arrow')).to_pandas(),
+    }
+
+
+def slope_category(slope_pct):
+    """Slope category 1-5 as in SLOPE_CATEGORY_SQL."""
+    return np.searchsorted(SLOPE_CATEGORY_LIMITS, slope_pct, side='left') + 1
+
+
+def slope_range(snapshot, min_slope, max_slope):
+    """Row slice of the segments with min_slope <= slope_pct <= max_slope."""
+    slope = snapshot['slope_pct']
+    return slice(
+        int(np.searchsorted(slope, min_slope, side='left')),
+        int(np.searchsorted(slope, max_slope, side='right'))
+    )
+
+
+def get_stats(snapshot, region=None):
+    """Overall slope statistics of the region, used as initial filter values."""
+    bins = snapshot['bins']
+    return pd.Series({
+        'min_slope': bins['min_slope'].min(),
+        'max_slope': bins['max_slope'].max(),
+        'avg_slope': bins['slope_sum'].sum() / bins['segment_count'].sum() if not bins.empty else np.nan,
+        'total_segments': bins['segment_count'].sum(),
+    })
+
+
+def get_filtered_bins(snapshot, region, min_slope, max_slope):
+    """Slope bins (as in road_slope_bins_<region>) of the segments in the slope range."""
+    rows = slope_range(snapshot, min_slope, max_slope)
+    slope = snapshot['slope_pct'][rows]
+    if len(slope) == 0:
+        return pd.DataFrame(columns=['bin', 'segment_count', 'length_m', 'min_slope', 'max_slope'])
+    # width_bucket(slope_pct, 0, 40, 400)
+    bucket = np.minimum(np.floor(slope * 10).astype(np.int64) + 1, 401)
+    # Sorted slopes, so each bin is a contiguous run
+    bin_values, starts = np.unique(bucket, return_index=True)
+    ends = np.append(starts[1:], len(slope))
+    return pd.DataFrame({
+        'bin': bin_values,
+        'segment_count': ends - starts,
+        'length_m': np.add.reduceat(snapshot['segment_length'][rows], starts),
+        'min_slope': slope[starts],
+        'max_slope': slope[ends - 1],
+    })
+
+
+def count_roads(snapshot, rows):
+    """Number of distinct roads in a row slice, with a flag per fid instead of sorting."""
+    fids = snapshot['fid'][rows]
+    if len(fids) == 0:
+        return 0
+    seen = np.zeros(int(fids.max()) + 1, dtype=bool)
+    seen[fids] = True
+    return int(np.count_nonzero(seen))
+
+
+def get_filtered_stats(snapshot, region, min_slope, max_slope):
+    """Segment and road counts, median and max slope for the slope range, plus the bins used."""
+    bins = get_filtered_bins(snapshot, region, min_slope, max_slope)
+    rows = slope_range(snapshot, min_slope, max_slope)
+    stats = pd.Series({
+        'total_segments': int(bins['segment_count'].sum()),
+        'total_roads': count_roads(snapshot, rows),
+        'median_slope': median_from_bins(bins),
+        'max_slope': bins['max_slope'].max() if not bins.empty else np.nan,
+    })
+    return stats, bins
+
+
+def get_road_data(snapshot, min_slope, max_slope, lod=0):
+    """Map lines of the slope range in the map CRS, one multi-line per slope category."""
+    if lod > 0:
+        rows = np.flatnonzero(
+            (snapshot['lod_level'] == lod)
+            & (snapshot['lod_max_slope'] >= min_slope) & (snapshot['lod_min_slope'] <= max_slope)
+        )
+        table = snapshot['lod'].take(rows)
+        categories = column(table, 'slope_category')
+    else:
+        rows = slope_range(snapshot, min_slope, max_slope)
+        table = snapshot['segments'].slice(rows.start, rows.stop - rows.start)
+        categories = slope_category(snapshot['slope_pct'][rows])
+
+    geometries = shapely.from_wkb(column(table, 'geometry'))
+    parts, index = shapely.get_parts(geometries, return_index=True)
+    part_categories = categories[index]
+    category_values = np.unique(part_categories)
+    return gpd.GeoDataFrame(
+        {'slope_category': category_values},
+        geometry=[shapely.multilinestrings(parts[part_categories == c]) for c in category_values],
+        crs=snapshot['metadata']['map_crs'],
+    )
@@ -1,12 +1,12 @@
 import streamlit as st
 import folium
-from streamlit_folium import folium_static
+from folium.plugins import VectorGridProtobuf
+from streamlit_folium import st_folium
 import pandas as pd
 import geopandas as gpd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine
 import json
 from branca.colormap import LinearColormap
-from shapely.geometry import shape
 import pyproj
 import os
 import sys
@@ -20,6 +20,10 @@ sys.path.append(project_root)
 # Now we can import from project root
 from config import CONFIG, REGION_PARAMS, get_region_params
 from scripts.bbox_selector import get_dtm_extent
+import dashboard_queries
+import snapshot_queries
+from dashboard_queries import histogram_from_bins, lod_for_zoom, viewport_tiles, SLOPE_CATEGORY_COLORS
+from shapely.geometry import box
 
 # Page config
 st.set_page_config(
@@ -31,9 +35,18 @@ st.set_page_config(
 # Get the current region from config
 region = CONFIG["region"]
 
-# Database configuration
-DB_CONNECTION = f"postgresql://{CONFIG['db_connection']['user']}:{CONFIG['db_connection']['password']}@{CONFIG['db_connection']['host']}/{CONFIG['database']}"
-engine = create_engine(DB_CONNECTION)
+if CONFIG['snapshot_dir']:
+    # Read-only mode on a snapshot written by scripts/export_snapshot.py, without a database
+    snapshot = st.cache_resource(snapshot_queries.load_snapshot)(os.path.join(CONFIG['snapshot_dir'], region))
+    queries, source = snapshot_queries, snapshot
+else:
+    # Database configuration
+    DB_CONNECTION = f"postgresql://{CONFIG['db_connection']['user']}:{CONFIG['db_connection']['password']}@{CONFIG['db_connection']['host']}/{CONFIG['database']}"
+    engine = create_engine(DB_CONNECTION)
+    queries, source = dashboard_queries, engine
+
+# Vector tiles need the tile server and its database
+use_tiles = CONFIG['map_source'] == 'tiles' and not CONFIG['snapshot_dir']
 
 # Custom CSS to make the layout more compact but with larger fonts
 #st.markdown("""
@@ -120,94 +133,84 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Function to get road data
-def get_road_data(min_slope, max_slope):
-    # Format the table name with the region
-    table_name = f"road_segments_slope_{region}"
-    
-    # Modified query to reduce data and pre-calculate clusters for the map
-    map_query = text(f"""
-        WITH slope_ranges AS (
-            SELECT 
-                CASE
-                    WHEN slope_pct <= 1 THEN 1
-                    WHEN slope_pct <= 3 THEN 2
-                    WHEN slope_pct <= 6 THEN 3
-                    WHEN slope_pct <= 10 THEN 4
-                    ELSE 5
-                END AS slope_category,
-                ST_Transform(segment_geom, {CONFIG['map_crs'].split(':')[1]}) as geom_wgs84
-            FROM {table_name}
-            WHERE slope_pct BETWEEN :min_slope AND :max_slope
-            AND slope_pct IS NOT NULL
-        ),
-        clusters AS (
-            SELECT 
-                slope_category,
-                ST_Collect(geom_wgs84) as geometry
-            FROM slope_ranges
-            GROUP BY slope_category
-        )
-        SELECT 
-            slope_category,
-            ST_AsGeoJSON(geometry) as geometry
-        FROM clusters;
-    """)
-    
-    # Separate query to get slope percentages for the histogram
-    hist_query = text(f"""
-        SELECT slope_pct
-        FROM {table_name}
-        WHERE slope_pct BETWEEN :min_slope AND :max_slope
-        AND slope_pct IS NOT NULL;
-    """)
-    
-    with engine.connect() as conn:
-        # Get map data
-        map_df = pd.read_sql(map_query, conn, params={"min_slope": min_slope, "max_slope": max_slope})
-        # Get histogram data
-        hist_df = pd.read_sql(hist_query, conn, params={"min_slope": min_slope, "max_slope": max_slope})
-    
-    # Convert geometry from GeoJSON string to GeoDataFrame
-    map_df['geometry'] = map_df['geometry'].apply(lambda x: shape(json.loads(x)))
-    
-    # Create GeoDataFrame for map
-    map_gdf = gpd.GeoDataFrame(map_df, geometry='geometry', crs=CONFIG['map_crs'])
-    
-    return map_gdf, hist_df
+# Query results are cached for all sessions of this server, the least recently used entries are evicted first.
+# Every cache key holds the region and the version of its tables, so rebuilt tables are queried again.
+QUERY_CACHE_ENTRIES = 256
+# Map tiles are small and many, so more of them are kept
+TILE_CACHE_ENTRIES = 2048
+# Seconds before the table version is looked up again
+TABLE_VERSION_TTL = 10
+
+# Version of the region's tables: the latest build time recorded by execute_queries.py (export time of a snapshot)
+@st.cache_data(ttl=TABLE_VERSION_TTL, show_spinner=False)
+def get_table_version(region):
+    if CONFIG['snapshot_dir']:
+        return snapshot['metadata'].get('exported_at')
+    return dashboard_queries.get_table_version(engine, region)
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_stats(region, version):
+    return queries.get_stats(source, region)
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_filtered_stats(region, min_slope, max_slope, version):
+    return queries.get_filtered_stats(source, region, min_slope, max_slope)
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_steep_roads(region, steep_slope, steep_length, version):
+    return dashboard_queries.get_steep_roads(engine, region, steep_slope, steep_length)
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_map_extent(region, version):
+    """DTM extent as (west, south, east, north) in the map CRS."""
+    if CONFIG['snapshot_dir']:
+        dtm_extent = box(*snapshot['metadata']['dtm_extent'])
+    else:
+        dtm_extent = get_dtm_extent()
+    transformer = pyproj.Transformer.from_crs(CONFIG['dtm_crs'], CONFIG['map_crs'], always_xy=True)
+    return transformer.transform_bounds(*dtm_extent.bounds)
+
+# Map lines of one viewport tile, cached so panning back to a tile does not query it again
+@st.cache_data(max_entries=TILE_CACHE_ENTRIES, show_spinner=False)
+def get_tile_data(region, min_slope, max_slope, lod, tile, version):
+    return dashboard_queries.get_road_data(engine, region, min_slope, max_slope, lod, tile)
+
+# Function to get road data of the visible tiles, at the given level of detail (0 = original segments)
+def get_road_data(min_slope, max_slope, lod, tiles):
+    if CONFIG['snapshot_dir']:
+        return snapshot_queries.get_road_data(snapshot, min_slope, max_slope, lod)
+    version = get_table_version(region)
+    frames = [get_tile_data(region, min_slope, max_slope, lod, tile, version) for tile in tiles]
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=CONFIG['map_crs'])
 
 # Function to get color based on slope category
 def get_color(category):
-    color_map = {
-        1: '#00ff00',  # Flat (0-1%)
-        2: '#ffff00',  # Gentle (1-3%)
-        3: '#ffa500',  # Moderate (3-6%)
-        4: '#982d80',  # Steep (6-10%)
-        5: '#ff0000'   # Very Steep (>10%)
-    }
-    return color_map.get(category, '#gray')
+    return SLOPE_CATEGORY_COLORS.get(category, '#gray')
 
-# Function to get statistics
-def get_stats():
-    # Format the table name with the region
-    table_name = f"road_segments_slope_{region}"
-    
-    query = text(f"""
-        SELECT 
-            MIN(slope_pct) as min_slope,
-            MAX(slope_pct) as max_slope,
-            AVG(slope_pct) as avg_slope,
-            COUNT(*) as total_segments,
-            COUNT(DISTINCT fid) as total_roads
-        FROM {table_name}
-        WHERE slope_pct IS NOT NULL
-    """)
-    
-    with engine.connect() as conn:
-        return pd.read_sql(query, conn).iloc[0]
+# Function to add the road segments as vector tiles loaded by the browser for the visible area
+def add_segment_tiles(m, min_slope, max_slope):
+    url = (
+        f"{CONFIG['tile_server_url']}/tiles/{region}/{{z}}/{{x}}/{{y}}.pbf"
+        f"?min_slope={min_slope}&max_slope={max_slope}"
+    )
+    colors = json.dumps({str(k): v for k, v in SLOPE_CATEGORY_COLORS.items()})
+    # Options as a string so the style can depend on the slope category of each feature
+    options = f"""{{
+        "rendererFactory": L.canvas.tile,
+        "vectorTileLayerStyles": {{
+            "segments": function(properties) {{
+                return {{
+                    "color": {colors}[properties.slope_category] || "gray",
+                    "weight": 4,
+                    "opacity": 0.8
+                }};
+            }}
+        }}
+    }}"""
+    VectorGridProtobuf(url, "Road segments", options).add_to(m)
 
 # Get initial statistics for reference values
-initial_stats = get_stats()
+initial_stats = get_stats(region, get_table_version(region))
 
 # Create columns with adjusted ratios for better fit
 col1, col2, col3 = st.columns([2, 0.9, 1])  # Make the main column wider
@@ -275,25 +278,8 @@ with col2:
         min_slope = float(initial_stats['min_slope'])
         max_slope = min(float(initial_stats['max_slope']), 40.0)
     
-    # Get filtered statistics
-    table_name = f"road_segments_slope_{region}"
-    filtered_query = text(f"""
-        SELECT 
-            COUNT(*) as total_segments,
-            COUNT(DISTINCT fid) as total_roads,
-            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY slope_pct) as median_slope,
-            MAX(slope_pct) as max_slope
-        FROM {table_name}
-        WHERE slope_pct BETWEEN :min_slope AND :max_slope
-        AND slope_pct IS NOT NULL
-    """)
-    
-    with engine.connect() as conn:
-        filtered_stats = pd.read_sql(
-            filtered_query, 
-            conn, 
-            params={"min_slope": min_slope, "max_slope": max_slope}
-        ).iloc[0]
+    # Get filtered statistics from the slope bins summary
+    filtered_stats, filtered_bins = get_filtered_stats(region, min_slope, max_slope, get_table_version(region))
 
     # Display statistics in a more compact way
     st.markdown('<div style="margin: 3rem 0;"></div>', unsafe_allow_html=True)
@@ -308,29 +294,46 @@ with col2:
         st.metric("Max. slope", f"{filtered_stats['max_slope']:.1f}%")
         
 with col1:
-    # Show loading indicator while getting data
-    with st.spinner('Loading data...'):
-        map_gdf, hist_df = get_road_data(min_slope, max_slope)
-    
     # Create the map
-    dtm_extent = get_dtm_extent()
-    center_x = (dtm_extent.bounds[0] + dtm_extent.bounds[2]) / 2
-    center_y = (dtm_extent.bounds[1] + dtm_extent.bounds[3]) / 2
-    
-    transformer = pyproj.Transformer.from_crs(CONFIG['dtm_crs'], CONFIG['map_crs'], always_xy=True)
-    center_lon, center_lat = transformer.transform(center_x, center_y)
+    zoom_start = 12
+    west, south, east, north = get_map_extent(region, get_table_version(region))
+
+    # View of the map after the last pan or zoom, as returned by st_folium (the whole DTM at first)
+    map_view = st.session_state.get('segment_map') or {}
+    view_bounds = map_view.get('bounds') or {}
+    if map_view.get('center') and view_bounds.get('_southWest', {}).get('lat') is not None:
+        center_lat, center_lon = map_view['center']['lat'], map_view['center']['lng']
+        zoom = map_view['zoom']
+        bounds = (
+            view_bounds['_southWest']['lat'], view_bounds['_southWest']['lng'],
+            view_bounds['_northEast']['lat'], view_bounds['_northEast']['lng'],
+        )
+    else:
+        center_lat, center_lon = (south + north) / 2, (west + east) / 2
+        zoom = zoom_start
+        bounds = (south, west, north, east)
+
     m = folium.Map(
         location=[center_lat, center_lon],  
-        zoom_start=12,
+        zoom_start=zoom,
         tiles='OpenStreetMap',
     )
     
+    # Show loading indicator while getting data
+    if not use_tiles:
+        with st.spinner('Loading data...'):
+            lod = lod_for_zoom(zoom, center_lat, CONFIG['lod_tolerances'])
+            map_gdf = get_road_data(min_slope, max_slope, lod, viewport_tiles(bounds, zoom))
+    
     # Add road segments to map with thicker lines
-    for _, row in map_gdf.iterrows():
+    if use_tiles:
+        add_segment_tiles(m, min_slope, max_slope)
+    else:
+        # One layer for all categories, styled by the slope_category property
         folium.GeoJson(
-            row['geometry'],
-            style_function=lambda x, cat=row['slope_category']: {
-                'color': get_color(cat),
+            map_gdf,
+            style_function=lambda feature: {
+                'color': get_color(feature['properties']['slope_category']),
                 'weight': 4,
                 'opacity': 0.8
             }
@@ -344,13 +347,14 @@ with col1:
     
     # Map
     st.subheader(f"Road Segments ({min_slope:.1f}% - {max_slope:.1f}%)")
-    folium_static(m, width=1300, height=1000)
+    # Reruns the app with the new bounds after panning or zooming, only the lines on screen are loaded
+    st_folium(m, key='segment_map', width=1300, height=1000, returned_objects=['bounds', 'zoom', 'center'])
     
     st.markdown('</div><div style="flex: 1; max-width: 300px;">', unsafe_allow_html=True)
     
 with col3:
     # Histogram with dark background
-    if not hist_df.empty:
+    if not filtered_bins.empty:
         st.markdown("""
         <div style="display: flex; gap: 0rem; margin: 0rem; padding: 0rem;">
             <div style="flex: 4; margin-right: 1rem;">
@@ -361,8 +365,9 @@ with col3:
         fig.patch.set_facecolor('#0E1117')  # Match Streamlit's dark theme
         ax.set_facecolor('#0E1117')
         
-        # Create histogram with custom colors
-        ax.hist(hist_df['slope_pct'], bins=20, edgecolor='#666666', color='#4A5460')
+        # Create histogram with custom colors from the pre-binned counts
+        edges, counts = histogram_from_bins(filtered_bins, min_slope, max_slope)
+        ax.hist(edges[:-1], bins=edges, weights=counts, edgecolor='#666666', color='#4A5460')
         ax.set_xlabel('Slope (%)', fontsize=10, color='white')
         ax.set_ylabel('Segment count', fontsize=10, color='white')
         ax.tick_params(axis='both', which='major', labelsize=8, colors='white')
@@ -375,4 +380,18 @@ with col3:
         plt.tight_layout()
         st.pyplot(fig, use_container_width=False)
         plt.close()
-        plt.style.use('default')  # Reset to default style
\ No newline at end of file
+        plt.style.use('default')  # Reset to default style
+
+    # Roads with long steep stretches, from the per-road summary (not part of snapshots)
+    if not CONFIG['snapshot_dir']:
+        st.subheader("Steep Roads")
+        col_steep, col_length = st.columns([1, 1])
+        with col_steep:
+            steep_slope = st.number_input("Slope over %", min_value=0.0, max_value=40.0, value=10.0, step=1.0)
+        with col_length:
+            steep_length = st.number_input("For at least m", min_value=0.0, value=50.0, step=10.0)
+        steep_roads = get_steep_roads(region, steep_slope, steep_length, get_table_version(region))
+        st.dataframe(
+            steep_roads[['fid', 'highway', 'steep_length_m', 'mean_slope', 'max_slope']].round(1),
+            hide_index=True
+        )
\ No newline at end of file
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Vector tile (MVT) server for the road segment slopes.
+
+Serves /tiles/<region>/<z>/<x>/<y>.pbf from road_segments_slope_<region> with
+ST_AsMVT, so the dashboard map only loads the segments of the visible tiles.
+At low zoom levels the tiles come from the simplified road_segments_lod_<region>.
+Optional query parameters min_slope and max_slope filter the segments.
+"""
+import argparse
+import math
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from psycopg2.pool import ThreadedConnectionPool
+
+# Add the project root to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from config import CONFIG
+from dashboard_queries import SLOPE_CATEGORY_SQL, lod_for_zoom
+
+# Name of the layer inside each tile
+TILE_LAYER = "segments"
+
+TILE_PATH = re.compile(r"^/tiles/(?P<region>[A-Za-z0-9_]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$")
+
+TILE_QUERY = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+    ),
+    mvt AS (
+        SELECT
+            fid,
+            {slope_category} AS slope_category,
+            ROUND(slope_pct::numeric, 1)::double precision AS slope_pct,
+            ST_AsMVTGeom(ST_Transform(segment_geom, 3857), bounds.geom) AS geom
+        FROM road_segments_slope_{region}, bounds
+        WHERE segment_geom && ST_Transform(bounds.geom, {crs})
+        AND slope_pct BETWEEN %(min_slope)s AND %(max_slope)s
+    )
+    SELECT ST_AsMVT(mvt, '{layer}', 4096, 'geom') FROM mvt;
+"""
+
+# Same tile from the simplified level of detail, for low zoom levels
+LOD_TILE_QUERY = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+    ),
+    mvt AS (
+        SELECT
+            fid,
+            slope_category,
+            ROUND(mean_slope::numeric, 1)::double precision AS slope_pct,
+            ST_AsMVTGeom(ST_Transform(geom, 3857), bounds.geom) AS geom
+        FROM road_segments_lod_{region}, bounds
+        WHERE lod = %(lod)s
+        AND geom && ST_Transform(bounds.geom, {crs})
+        AND max_slope >= %(min_slope)s AND min_slope <= %(max_slope)s
+    )
+    SELECT ST_AsMVT(mvt, '{layer}', 4096, 'geom') FROM mvt;
+"""
+
+
+def tile_latitude(z, y):
+    """Latitude of the center of a Web Mercator tile row."""
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / 2 ** z))))
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    pool = None
+    # Bounds concurrent queries to the pool size, getconn() fails instead of waiting
+    slots = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        match = TILE_PATH.match(url.path)
+        if not match:
+            self.send_error(404, "Expected /tiles/<region>/<z>/<x>/<y>.pbf")
+            return
+
+        query = parse_qs(url.query)
+        try:
+            params = {
+                "z": int(match["z"]),
+                "x": int(match["x"]),
+                "y": int(match["y"]),
+                "min_slope": float(query.get("min_slope", ["0"])[0]),
+                "max_slope": float(query.get("max_slope", ["Infinity"])[0]),
+            }
+        except ValueError:
+            self.send_error(400, "Invalid slope filter")
+            return
+
+        # Use the simplified geometry when the original segments are smaller than a pixel
+        params["lod"] = lod_for_zoom(params["z"], tile_latitude(params["z"], params["y"]), CONFIG['lod_tolerances'])
+        sql = (LOD_TILE_QUERY if params["lod"] > 0 else TILE_QUERY).format(
+            slope_category=SLOPE_CATEGORY_SQL,
+            region=match['region'],
+            crs=CONFIG['dtm_crs'].split(':')[1],
+            layer=TILE_LAYER,
+        )
+        with self.slots:
+            conn = self.pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    tile = bytes(cur.fetchone()[0] or b"")
+                conn.rollback()
+            except Exception as e:
+                conn.rollback()
+                self.send_error(500, str(e).splitlines()[0])
+                return
+            finally:
+                self.pool.putconn(conn)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.mapbox-vector-tile")
+        self.send_header("Content-Length", str(len(tile)))
+        # The dashboard page is served from another port
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "max-age=60")
+        self.end_headers()
+        self.wfile.write(tile)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve road segment slopes as Mapbox vector tiles.")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    parser.add_argument("--connections", type=int, default=8, help="Size of the database connection pool (default: 8)")
+    args = parser.parse_args()
+
+    TileHandler.pool = ThreadedConnectionPool(
+        1, args.connections,
+        dbname=CONFIG['database'],
+        **CONFIG['db_connection']
+    )
+    TileHandler.slots = threading.BoundedSemaphore(args.connections)
+    server = ThreadingHTTPServer((args.host, args.port), TileHandler)
+    print(f"Serving vector tiles on http://{args.host}:{args.port}/tiles/<region>/<z>/<x>/<y>.pbf")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        TileHandler.pool.closeall()
+
+
+if __name__ == "__main__":
+    main()